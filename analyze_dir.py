@@ -0,0 +1,67 @@
+"""
+Batch analysis script for Image Insight Analyzer
+
+Runs every image in a directory (or zip archive) through the analysis
+pipeline and appends one JSON record per image to a JSONL file.
+
+Usage:
+    python analyze_dir.py photos/ -o results.jsonl
+"""
+import argparse
+import time
+
+from app.batch import iter_source, run_to_jsonl
+from app.utils.blip_caption import CAPTION_TIERS, DEFAULT_TIER
+from app.utils.clip_embedding import ENCODERS, configure_shared_clip
+from app.utils.image_context import configure_decoding
+from app.utils.micro_batcher import BATCH_CONFIG, configure_batching
+from app.utils.quantization import configure_quantization
+from app.utils.result_cache import CACHE_DIR, ResultCache
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze a directory or zip archive of images")
+    parser.add_argument('source', help="Directory or .zip archive of images")
+    parser.add_argument('-o', '--output', default='results.jsonl', help="JSONL output file")
+    parser.add_argument('--workers', type=int, default=16, help="Images analyzed concurrently")
+    parser.add_argument('--read-ahead', type=int, default=64, help="Loaded images queued ahead of the workers")
+    parser.add_argument('--batch-size', type=int, help="Max micro-batch size for every model")
+    parser.add_argument('--max-wait-ms', type=float, help="Max micro-batch wait for every model")
+    parser.add_argument('--no-resume', action='store_true', help="Overwrite the output instead of resuming")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the result cache")
+    parser.add_argument('--full-decode', action='store_true', help="Decode JPEGs at full resolution for every stage")
+    parser.add_argument('--caption-tier', choices=list(CAPTION_TIERS), default=DEFAULT_TIER,
+                        help="Caption decoding: fast (greedy), balanced (2 beams) or quality (5 beams)")
+    parser.add_argument('--int8', action='store_true',
+                        help="Run BLIP and the CLIP models with dynamically quantized int8 Linear layers (CPU)")
+    parser.add_argument('--shared-clip', choices=list(ENCODERS),
+                        help="Score attributes and countries against one shared CLIP image embedding")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_decoding(not args.full_decode)
+    if args.int8:
+        configure_quantization('int8')
+    if args.shared_clip:
+        configure_shared_clip(args.shared_clip)
+
+    if args.batch_size or args.max_wait_ms is not None:
+        for name in BATCH_CONFIG:
+            configure_batching(name, max_batch_size=args.batch_size, max_wait_ms=args.max_wait_ms)
+
+    started = time.time()
+    summary = run_to_jsonl(
+        iter_source(args.source),
+        args.output,
+        resume=not args.no_resume,
+        workers=args.workers,
+        read_ahead=args.read_ahead,
+        cache=None if args.no_cache else ResultCache(CACHE_DIR),
+        caption_tier=args.caption_tier
+    )
+    elapsed = time.time() - started
+
+    print("=" * 60)
+    print(f"Processed {summary['processed']} images in {elapsed:.1f}s "
+          f"({summary['failed']} failed, {summary['skipped']} already done)")
+    print(f"Results written to: {args.output}")
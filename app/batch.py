@@ -0,0 +1,238 @@
+"""
+Batch Analysis
+Runs whole directories or archives through the analysis pipeline
+
+Images are read by a background thread into a bounded read-ahead queue and
+analyzed concurrently, so the model micro-batchers see full batches.
+Results can be appended to a JSONL file one record at a time and a crashed
+run resumed from it.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import os
+import queue
+import threading
+import traceback
+import zipfile
+
+from app.pipeline import analyze_image
+from app.utils.blip_caption import DEFAULT_TIER
+from app.utils.image_context import ImageContext
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+MAX_ARCHIVE_FILES = 10000
+MAX_ARCHIVE_MEMBER_BYTES = 64 * 1024 * 1024
+
+# Stage statuses of a record that does not need to be redone on resume
+COMPLETE_STATUSES = ('ok', 'skipped')
+
+_DONE = object()
+
+def is_image_file(name):
+    return '.' in name and name.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def iter_directory(directory):
+    """
+    Image files under a directory, in a stable order
+
+    Yields:
+        (relative_name, loader) pairs; loader() returns the file bytes
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if is_image_file(name):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, directory).replace(os.sep, '/')
+                yield rel, (lambda p=path: _read_file(p))
+
+def iter_zip(archive):
+    """
+    Image members of a zip archive
+
+    Args:
+        archive: Path or seekable file object of the zip
+
+    Yields:
+        (member_name, loader) pairs; loader() returns the member bytes
+    """
+    # Loaders are called before the next member is requested, so the archive
+    # stays open for them and is closed once iteration finishes or stops
+    with zipfile.ZipFile(archive) as zf:
+        members = [m for m in zf.infolist() if not m.is_dir() and is_image_file(m.filename)]
+        if len(members) > MAX_ARCHIVE_FILES:
+            raise ValueError(f"Archive has {len(members)} images (limit {MAX_ARCHIVE_FILES})")
+        for member in members:
+            if member.file_size > MAX_ARCHIVE_MEMBER_BYTES:
+                yield member.filename, _raise(ValueError(f"{member.filename} is too large"))
+            else:
+                yield member.filename, (lambda m=member: zf.read(m))
+
+def _raise(error):
+    def loader():
+        raise error
+    return loader
+
+def iter_source(path):
+    """Directory walk or zip members depending on what path points to"""
+    if os.path.isdir(path):
+        return iter_directory(path)
+    if zipfile.is_zipfile(path):
+        return iter_zip(path)
+    raise ValueError(f"{path} is neither a directory nor a zip archive")
+
+def _read_ahead(sources, depth, stop):
+    """Load image bytes on a background thread into a queue of at most depth items"""
+    items = queue.Queue(maxsize=depth)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for name, loader in sources:
+                try:
+                    item = (name, ImageContext.from_bytes(loader(), filename=name))
+                except Exception as e:
+                    item = (name, e)
+                if not put(item):
+                    return
+        except Exception as e:
+            put((None, e))
+        put(_DONE)
+
+    threading.Thread(target=reader, name='batch-read-ahead', daemon=True).start()
+    while True:
+        item = items.get()
+        if item is _DONE:
+            return
+        yield item
+
+def _analyze_one(name, ctx, options):
+    if isinstance(ctx, Exception):
+        return {'filename': name, 'error': str(ctx)}
+    try:
+        # Opening parses the header, so a file that is not an image fails here
+        # with one top-level error instead of an error in every model stage
+        ctx.source
+        record = {'filename': name}
+        record.update(analyze_image(ctx, **options))
+        return record
+    except Exception as e:
+        print(f"Batch analysis error for {name}: {e}")
+        traceback.print_exc()
+        return {'filename': name, 'error': str(e)}
+
+def analyze_batch(sources, workers=8, read_ahead=32, timeouts=None, cache=None, caption_tier=DEFAULT_TIER):
+    """
+    Analyze many images with batched model inference
+
+    Args:
+        sources: Iterable of (name, loader) pairs, e.g. from iter_source
+        workers: Images analyzed concurrently (also bounds batch sizes)
+        read_ahead: Maximum number of loaded images waiting for a worker
+        timeouts, cache, caption_tier: See app.pipeline.build_stages
+
+    Yields:
+        One record per image in completion order: {'filename', ...analysis}
+        or {'filename', 'error'}
+    """
+    stop = threading.Event()
+    # A thread for every stage of every image in flight, so no stage waits for a thread
+    stage_pool = ThreadPoolExecutor(max_workers=workers * 8, thread_name_prefix='batch-stage')
+    image_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-image')
+    options = {'timeouts': timeouts, 'batched': True, 'cache': cache, 'executor': stage_pool,
+               'caption_tier': caption_tier}
+    in_flight = set()
+    try:
+        for name, ctx in _read_ahead(sources, read_ahead, stop):
+            if name is None:
+                raise ctx
+            if len(in_flight) >= workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(image_pool.submit(_analyze_one, name, ctx, options))
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        stop.set()
+        image_pool.shutdown(wait=False, cancel_futures=True)
+        stage_pool.shutdown(wait=False, cancel_futures=True)
+
+def load_completed(output_path):
+    """
+    Filenames already analyzed successfully in an existing JSONL output
+
+    A partially written last line (from a crash) is truncated so that new
+    records can be appended cleanly. Records with an 'error', or with a
+    stage that failed or timed out, are retried.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+            content = content[:content.rfind(b'\n') + 1]
+
+    for line in content.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        stages = record.get('stages') or {}
+        if 'error' not in record and stages and all(
+                stage.get('status') in COMPLETE_STATUSES for stage in stages.values()):
+            completed.add(record.get('filename'))
+    return completed
+
+def run_to_jsonl(sources, output_path, resume=True, progress_every=100, **options):
+    """
+    Analyze sources and append each record to a JSONL file as soon as it is ready
+
+    Args:
+        sources: Iterable of (name, loader) pairs
+        output_path: JSONL file to write
+        resume: Skip images already recorded successfully in output_path
+        progress_every: Print a progress line every N images
+        options: Passed to analyze_batch
+
+    Returns:
+        Summary dictionary with processed, failed and skipped counts
+    """
+    completed = load_completed(output_path) if resume else set()
+    skipped = [0]
+
+    def pending():
+        for name, loader in sources:
+            if name in completed:
+                skipped[0] += 1
+                continue
+            yield name, loader
+
+    processed = failed = 0
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out:
+        for record in analyze_batch(pending(), **options):
+            out.write(json.dumps(record, default=str) + '\n')
+            out.flush()
+            processed += 1
+            failed += 'error' in record
+            if progress_every and processed % progress_every == 0:
+                print(f"Analyzed {processed} images ({failed} failed, {skipped[0]} skipped)")
+
+    return {'processed': processed, 'failed': failed, 'skipped': skipped[0]}
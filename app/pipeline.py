@@ -0,0 +1,198 @@
+"""
+Analysis Pipeline
+Builds the per-image analysis stages and assembles their results
+
+Shared by the Flask routes and the batch/CLI runner.
+"""
+from app.utils.yolo_detection import detect_objects, count_objects, analyze_objects
+from app.utils.yolo_detection import MODEL_VERSION as OBJECTS_VERSION, engine_tag
+from app.utils.clip_attributes import classify_attributes
+from app.utils.clip_attributes import MODEL_VERSION as ATTRIBUTES_VERSION
+from app.utils.blip_caption import CAPTION_ERROR, DEFAULT_TIER, caption_settings, generate_caption
+from app.utils.blip_caption import MODEL_VERSION as CAPTION_VERSION
+from app.utils.exif_location import extract_coordinates, get_datetime
+from app.utils.location_enrichment import enrich_location
+from app.utils.time_api import analyze_photo_time
+from app.utils.visual_analysis import get_visual_predictions
+from app.utils.visual_analysis import MODEL_VERSION as VISUAL_VERSION
+from app.utils.geo_prediction import get_geo_prediction
+from app.utils.geo_prediction import MODEL_VERSION as GEO_VERSION, geo_tag
+from app.utils.stage_scheduler import Stage, run_stages
+from app.utils.image_context import decode_tag
+from app.utils.clip_embedding import shared_tag
+from app.utils.quantization import quantization_tag
+
+# Per-stage timeouts in seconds; late stages return their defaults
+STAGE_TIMEOUTS = {
+    'caption': 120, 'objects': 60, 'attributes': 120, 'visual': 30, 'geo': 120,
+    'gps': 10, 'enrich': 12, 'time': 10
+}
+
+# Cache key versions; a model upgrade only invalidates its own stage
+STAGE_VERSIONS = {
+    'caption': CAPTION_VERSION,
+    'objects': f'{OBJECTS_VERSION}-conf0.25',
+    'attributes': ATTRIBUTES_VERSION,
+    'visual': VISUAL_VERSION,
+    'geo': GEO_VERSION,
+}
+
+# Stages whose input comes from a reduced decode when that is enabled
+REDUCED_DECODE_STAGES = {'caption', 'attributes', 'visual', 'geo'}
+
+# Stages whose model runs in int8 when quantization is enabled
+QUANTIZED_STAGES = {'caption', 'attributes', 'geo'}
+
+# Zero-shot stages that score one shared CLIP embedding in shared mode
+SHARED_CLIP_STAGES = {'attributes', 'geo'}
+
+def stage_version(name, settings=''):
+    """Cache version of a stage, including its settings, decode mode, precision and model choice"""
+    version = STAGE_VERSIONS[name] + settings + (decode_tag() if name in REDUCED_DECODE_STAGES else '')
+    if name in QUANTIZED_STAGES:
+        version += quantization_tag()
+    if name in SHARED_CLIP_STAGES:
+        version += shared_tag()
+    if name == 'objects':
+        version += engine_tag()
+    if name == 'geo':
+        version += geo_tag()
+    return version
+
+def build_stages(ctx, timeouts=None, batched=True, cache=None, caption_tier=DEFAULT_TIER):
+    """
+    Analysis stages for one image; model stages and network lookups run side by side
+
+    Args:
+        ctx: ImageContext of the image
+        timeouts: Per-stage timeouts (defaults to STAGE_TIMEOUTS)
+        batched: Route model calls through the cross-request micro-batchers
+        cache: Optional ResultCache for the model and pixel stages
+        caption_tier: Caption latency tier ('fast', 'balanced' or 'quality')
+
+    Returns:
+        List of Stage objects for run_stages
+    """
+    timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+    max_length, num_beams = caption_settings(caption_tier)
+
+    def cached(name, func, is_valid=bool, settings=''):
+        """Serve a stage from the result cache; only successful results are stored"""
+        if cache is None:
+            return func
+
+        def run():
+            version = stage_version(name, settings)
+            hit, value = cache.get(ctx.sha256, name, version)
+            if hit:
+                print(f"Cache hit for {name}")
+                return value
+            value = func()
+            if is_valid(value):
+                cache.put(ctx.sha256, name, version, value)
+            return value
+        return run
+
+    def caption():
+        print("Generating caption...")
+        caption = generate_caption(ctx, max_length=max_length, num_beams=num_beams, batched=batched)
+        print(f"Caption generated: {caption}")
+        return caption
+
+    def objects():
+        print("Detecting objects...")
+        detections = detect_objects(ctx, confidence_threshold=0.25, batched=batched)
+        counts = count_objects(detections)
+        print(f"Objects detected: {counts}")
+        return {
+            'objects': [{'class': k, 'count': v} for k, v in counts.items()],
+            'object_analysis': analyze_objects(detections)
+        }
+
+    def attributes():
+        print("Classifying attributes...")
+        return classify_attributes(ctx, batched=batched)
+
+    def visual():
+        print("Getting visual predictions...")
+        return get_visual_predictions(ctx)
+
+    def geo():
+        print("Getting geo prediction...")
+        return get_geo_prediction(ctx, batched=batched)
+
+    def gps():
+        print("Extracting EXIF location...")
+        return extract_coordinates(ctx)
+
+    def enrich(location):
+        if not location:
+            return None
+        photo_datetime = get_datetime(ctx)
+        date = photo_datetime.date().isoformat() if photo_datetime else None
+        # One deadline for all lookups; the stage timeout only adds scheduling slack
+        return enrich_location(location, date, deadline=timeouts['enrich'])
+
+    def photo_time(location):
+        # Analysed during assembly, once the visual time-of-day prediction is known
+        return get_datetime(ctx) if location else None
+
+    return [
+        # Model stages raise on failure, so resume (app.batch) retries them and nothing failed is cached
+        Stage('caption', cached('caption', caption, settings=f'-len{max_length}-beams{num_beams}'),
+              timeout=timeouts['caption'], default=CAPTION_ERROR, pool='model'),
+        # Detection errors fail the stage, so an empty result really means no objects and is cached
+        Stage('objects', cached('objects', objects), timeout=timeouts['objects'],
+              default={'objects': [], 'object_analysis': {}}, pool='model'),
+        Stage('attributes', cached('attributes', attributes), timeout=timeouts['attributes'], default={},
+              pool='model'),
+        Stage('visual', cached('visual', visual), timeout=timeouts['visual'], default={}, pool='model'),
+        # Fallback-backend results are not cached; 'auto' retries the preferred backend periodically
+        # (see geo_prediction), and results are cached again once it loads
+        Stage('geo', cached('geo', geo, lambda r: r.get('predictions') and not r.get('fallback')),
+              timeout=timeouts['geo'], default={}, pool='model'),
+        Stage('gps', gps, timeout=timeouts['gps']),
+        Stage('enrich', enrich, depends_on=['gps'], timeout=timeouts['enrich'] + 2),
+        Stage('time', photo_time, depends_on=['gps'], timeout=timeouts['time']),
+    ]
+
+def analyze_image(ctx, timeouts=None, batched=True, cache=None, executor=None, caption_tier=DEFAULT_TIER):
+    """
+    Run the full analysis for one image
+
+    Args:
+        ctx: ImageContext of the image
+        timeouts, batched, cache, caption_tier: See build_stages
+        executor: Executor for the stages (defaults to the shared stage pools)
+
+    Returns:
+        Analysis dictionary as returned by /analyze (without the filename)
+    """
+    results, report = run_stages(build_stages(ctx, timeouts, batched, cache, caption_tier), executor=executor)
+
+    analysis = {'sha256': ctx.sha256}
+    analysis['caption'] = results['caption']
+    analysis.update(results['objects'])
+    analysis['attributes'] = results['attributes']
+    analysis['visual_predictions'] = results['visual']
+    analysis['geo_prediction'] = results['geo']
+
+    if results['gps']:
+        lookups, lookup_report = results['enrich'] or ({}, {})
+        location = dict(results['gps'])
+        if lookups.get('place'):
+            location.update(lookups['place'])
+        analysis['location'] = location
+        analysis['has_exif_location'] = True
+        analysis['weather'] = lookups.get('weather')
+        analysis['timezone'] = lookups.get('timezone')
+        analysis['sun_times'] = lookups.get('sun_times')
+        report['enrich']['lookups'] = lookup_report
+        if results['time']:
+            analysis['time_info'] = analyze_photo_time(
+                results['time'], results['gps'], results['visual'].get('time_of_day'))
+    else:
+        analysis['has_exif_location'] = False
+
+    analysis['stages'] = report
+    return analysis
@@ -1,20 +1,30 @@
 """
 Flask Routes for Image Insight Analyzer
 """
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+import io
+import json
 import os
 import traceback
 
-from app.utils.yolo_detection import detect_objects, count_objects, analyze_objects
-from app.utils.clip_attributes import classify_attributes
-from app.utils.blip_caption import generate_caption
-from app.utils.exif_location import extract_location, get_datetime
-from app.utils.weather_api import get_weather
-from app.utils.time_api import analyze_photo_time
-from app.utils.visual_analysis import get_visual_predictions
-from app.utils.geo_prediction import get_geo_prediction
+from app.pipeline import STAGE_TIMEOUTS, analyze_image
+from app.batch import analyze_batch, iter_zip
+from app.utils.image_context import ImageContext, configure_decoding
+from app.utils.upload_store import persist_upload, maybe_cleanup_uploads
+from app.utils.micro_batcher import batcher_metrics
+from app.utils.result_cache import ResultCache
+from app.utils.warmup import warmup_status, is_ready
+from app.utils.model_registry import registry
+from app.utils.exif_location import configure_geocoding
+from app.utils.offline_geocoder import load_offline_geocoder
+from app.utils.http_client import api_cache
+from app.utils.yolo_detection import configure_detection, detector_info
+from app.utils.quantization import configure_quantization, quantization_info
+from app.utils.clip_embedding import configure_shared_clip, shared_info
+from app.utils.geo_prediction import configure_geo_backend, configure_geo_labels, geo_info
+from app.utils.blip_caption import CAPTION_TIERS, caption_settings, stream_caption
 
 app = Flask(__name__, template_folder='../frontend/templates', static_folder='../frontend/static')
 CORS(app)  # Enable CORS for all routes
@@ -23,12 +33,83 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads are analyzed in memory; enable to keep a content-hashed copy on disk
+app.config['PERSIST_UPLOADS'] = False
+app.config['UPLOAD_RETENTION_SECONDS'] = 24 * 60 * 60
+# Per-stage timeouts in seconds; late stages return their defaults
+app.config['STAGE_TIMEOUTS'] = dict(STAGE_TIMEOUTS)
+# Route model calls through the cross-request micro-batchers
+app.config['MICRO_BATCHING'] = True
+# Content-addressed per-stage result cache (set the dir to None for memory only)
+app.config['RESULT_CACHE_DIR'] = os.path.join('cache', 'results')
+app.config['RESULT_CACHE_SIZE'] = 2048
+# Limits of the on-disk tier; oldest entries are removed first (None = no limit)
+app.config['RESULT_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+app.config['RESULT_CACHE_MAX_AGE_SECONDS'] = 30 * 24 * 60 * 60
+# Load models concurrently during the startup warm-up (see run.py)
+app.config['WARMUP_PARALLEL'] = True
+# Soft limit for all loaded models; idle models beyond it are unloaded (None = no limit)
+app.config['MODEL_MEMORY_BUDGET_MB'] = None
+# Persistent reverse-geocode cache; precision is the grid size in decimal degrees
+app.config['GEOCODE_CACHE_PATH'] = os.path.join('cache', 'geocode.sqlite3')
+app.config['GEOCODE_PRECISION'] = 3
+# Offline reverse geocoding from a GeoNames-style cities table (None = use Nominatim)
+app.config['OFFLINE_GAZETTEER'] = None
+app.config['OFFLINE_GAZETTEER_ADMIN1'] = None
+app.config['OFFLINE_GAZETTEER_COUNTRIES'] = None
+# Images analyzed concurrently by /analyze/batch
+app.config['BATCH_WORKERS'] = 8
+# Decode JPEGs at reduced scale for the model and color stages
+app.config['DRAFT_DECODE'] = True
+# Caption decoding: 'fast' (greedy), 'balanced' (2 beams) or 'quality' (5 beams)
+app.config['CAPTION_TIER'] = 'balanced'
+# YOLO inference size and backend ('auto' prefers an ONNX/OpenVINO export on CPU)
+app.config['YOLO_IMGSZ'] = 640
+app.config['YOLO_BACKEND'] = 'auto'
+# Geo image encoder: 'auto' (StreetCLIP, falling back to OpenCLIP ViT-B-32), 'streetclip' or 'open_clip'
+app.config['GEO_BACKEND'] = 'auto'
+# GeoNames admin1CodesASCII.txt / cities*.txt: add regions and cities to the geo label index
+app.config['GEO_LABEL_REGIONS'] = None
+app.config['GEO_LABEL_CITIES'] = None
+app.config['GEO_LABEL_MIN_POPULATION'] = 500000
+# None (separate models) or 'streetclip'/'open_clip': one CLIP vision encoder for attributes and geo
+app.config['SHARED_CLIP_ENCODER'] = None
+# None (fp32) or 'int8': dynamic int8 Linear layers for BLIP and the CLIP models on CPU
+app.config['QUANTIZATION'] = None
+
+registry.set_memory_budget(app.config['MODEL_MEMORY_BUDGET_MB'])
+configure_decoding(app.config['DRAFT_DECODE'])
+configure_detection(imgsz=app.config['YOLO_IMGSZ'], backend=app.config['YOLO_BACKEND'])
+configure_quantization(app.config['QUANTIZATION'])
+configure_shared_clip(app.config['SHARED_CLIP_ENCODER'])
+configure_geo_backend(app.config['GEO_BACKEND'])
+if app.config['GEO_LABEL_REGIONS']:
+    configure_geo_labels(
+        regions_path=app.config['GEO_LABEL_REGIONS'],
+        cities_path=app.config['GEO_LABEL_CITIES'],
+        min_city_population=app.config['GEO_LABEL_MIN_POPULATION']
+    )
+result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_SIZE'],
+                           max_disk_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+                           max_age_seconds=app.config['RESULT_CACHE_MAX_AGE_SECONDS'])
+geocode_cache = configure_geocoding(app.config['GEOCODE_CACHE_PATH'], app.config['GEOCODE_PRECISION'])
+if app.config['OFFLINE_GAZETTEER']:
+    load_offline_geocoder(
+        app.config['OFFLINE_GAZETTEER'],
+        admin1_path=app.config['OFFLINE_GAZETTEER_ADMIN1'],
+        country_info_path=app.config['OFFLINE_GAZETTEER_COUNTRIES']
+    )
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def caption_tier():
+    """Tier requested by the client ('caption_tier' form field or query arg), else the configured one"""
+    tier = request.values.get('caption_tier') or app.config['CAPTION_TIER']
+    if tier not in CAPTION_TIERS:
+        raise ValueError(f"caption_tier must be one of {', '.join(CAPTION_TIERS)}")
+    return tier
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -42,101 +123,116 @@ def analyze():
             return jsonify({'error': 'Invalid file'}), 400
 
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        print(f"File saved to: {filepath}")
+        # From the validated original name: secure_filename drops non-ASCII characters and can drop the dot
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        try:
+            tier = caption_tier()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        analysis = {'filename': filename}
+        # Decode straight from the request bytes; every stage below shares this context
+        ctx = ImageContext.from_bytes(file.read(), filename=filename)
 
-        # Caption
-        try:
-            print("Generating caption...")
-            analysis['caption'] = generate_caption(filepath, max_length=30, num_beams=2)
-            print(f"Caption generated: {analysis['caption']}")
-        except Exception as e:
-            print(f"Caption error: {e}")
-            traceback.print_exc()
-            analysis['caption'] = None
+        analysis = {'filename': filename}
+        if app.config['PERSIST_UPLOADS']:
+            analysis['stored_as'] = persist_upload(ctx, app.config['UPLOAD_FOLDER'], extension)
+            print(f"File saved to: {analysis['stored_as']}")
+            maybe_cleanup_uploads(app.config['UPLOAD_FOLDER'], app.config['UPLOAD_RETENTION_SECONDS'])
+        analysis.update(analyze_image(
+            ctx,
+            timeouts=app.config['STAGE_TIMEOUTS'],
+            batched=app.config['MICRO_BATCHING'],
+            cache=result_cache,
+            caption_tier=tier
+        ))
 
-        # Objects
-        try:
-            print("Detecting objects...")
-            detections = detect_objects(filepath, confidence_threshold=0.25)
-            counts = count_objects(detections)
-            analysis['objects'] = [{'class': k, 'count': v} for k, v in counts.items()]
-            analysis['object_analysis'] = analyze_objects(counts)
-            print(f"Objects detected: {counts}")
-        except Exception as e:
-            print(f"Object detection error: {e}")
-            traceback.print_exc()
-            analysis['objects'] = []
-            analysis['object_analysis'] = {}
+        print("Analysis complete, returning results...")
+        return jsonify(analysis)
 
-        # Attributes
-        try:
-            print("Classifying attributes...")
-            analysis['attributes'] = classify_attributes(filepath)
-            print(f"Attributes: {analysis['attributes']}")
-        except Exception as e:
-            print(f"Attribute classification error: {e}")
-            traceback.print_exc()
-            analysis['attributes'] = {}
+    except Exception as e:
+        print(f"Fatal error in analyze: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        # Visual predictions
+@app.route('/caption/stream', methods=['POST'])
+def caption_stream():
+    """Stream a greedy caption as Server-Sent Events: 'token' events, then one 'done' event"""
+    file = request.files.get('file') or request.files.get('image')
+    if not file or file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file'}), 400
+    ctx = ImageContext.from_bytes(file.read(), filename=secure_filename(file.filename))
+    max_length, _ = caption_settings('fast')
+
+    def events():
+        pieces = []
         try:
-            print("Getting visual predictions...")
-            analysis['visual_predictions'] = get_visual_predictions(filepath)
-            print(f"Visual predictions: {analysis['visual_predictions']}")
+            for text in stream_caption(ctx, max_length=max_length):
+                pieces.append(text)
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'caption': ''.join(pieces).strip()})}\n\n"
         except Exception as e:
-            print(f"Visual prediction error: {e}")
-            traceback.print_exc()
-            analysis['visual_predictions'] = {}
+            print(f"Error streaming caption: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
-        # Geo prediction
-        try:
-            print("Getting geo prediction...")
-            analysis['geo_prediction'] = get_geo_prediction(filepath)
-            print(f"Geo prediction: {analysis['geo_prediction']}")
-        except Exception as e:
-            print(f"Geo prediction error: {e}")
-            traceback.print_exc()
-            analysis['geo_prediction'] = {}
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-        # EXIF location
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch_route():
+    """Analyze a zip archive ('archive') or several uploaded files ('files')"""
+    print("Received batch analysis request...")
+    try:
         try:
-            print("Extracting EXIF location...")
-            location = extract_location(filepath)
-            if location:
-                analysis['location'] = location
-                analysis['has_exif_location'] = True
-                try:
-                    analysis['weather'] = get_weather(location)
-                except Exception as e:
-                    print(f"Weather API error: {e}")
-                try:
-                    photo_datetime = get_datetime(filepath)
-                    if photo_datetime:
-                        analysis['time_info'] = analyze_photo_time(photo_datetime)
-                except Exception as e:
-                    print(f"Time analysis error: {e}")
-            else:
-                analysis['has_exif_location'] = False
-        except Exception as e:
-            print(f"EXIF extraction error: {e}")
-            traceback.print_exc()
-            analysis['has_exif_location'] = False
-
-        print("Analysis complete, returning results...")
-        return jsonify(analysis)
+            tier = caption_tier()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        archive = request.files.get('archive')
+        if archive and archive.filename:
+            sources = iter_zip(io.BytesIO(archive.read()))
+        else:
+            files = [f for f in request.files.getlist('files') if f.filename and allowed_file(f.filename)]
+            if not files:
+                return jsonify({'error': 'No valid files'}), 400
+            sources = [(secure_filename(f.filename), f.read) for f in files]
+
+        results = list(analyze_batch(
+            sources,
+            workers=app.config['BATCH_WORKERS'],
+            timeouts=app.config['STAGE_TIMEOUTS'],
+            cache=result_cache,
+            caption_tier=tier
+        ))
+
+        print(f"Batch analysis complete ({len(results)} images)")
+        return jsonify({'count': len(results), 'results': results})
 
     except Exception as e:
-        print(f"Fatal error in analyze: {e}")
+        print(f"Fatal error in batch analyze: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'ok'})
+    status = warmup_status()
+    if status['status'] == 'idle':
+        # Warm-up was never started; models load lazily on first use
+        return jsonify({'status': 'ok', 'warmup': status})
+    return jsonify(status), (200 if is_ready() else 503)
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'batchers': batcher_metrics(),
+        'result_cache': result_cache.stats(),
+        'models': registry.stats(),
+        'geocode_cache': geocode_cache.stats(),
+        'api_cache': api_cache.stats(),
+        'detector': detector_info(),
+        'quantization': quantization_info(),
+        'shared_clip': shared_info(),
+        'geo': geo_info()
+    })
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
@@ -0,0 +1,120 @@
+"""
+API Stub Server
+Local stand-in for Open-Meteo, TimeAPI.io, sunrise-sunset.org and Nominatim
+
+Serves fixed, well-formed answers so the weather/time code can be exercised
+without network access, and counts requests so caching can be checked.
+
+Usage:
+    python -m app.utils.api_stub --port 8765
+    OPEN_METEO_URL=http://127.0.0.1:8765 TIMEAPI_URL=http://127.0.0.1:8765 \
+        SUNRISE_SUNSET_URL=http://127.0.0.1:8765 NOMINATIM_URL=http://127.0.0.1:8765 python run.py
+
+Or in-process:
+    server, base_url = start_stub_server()
+    use_stub(base_url)
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import threading
+
+from app.utils.http_client import BASE_URLS, set_base_url
+
+def _weather(query):
+    if 'daily' in query:
+        days = int(query.get('forecast_days', ['7'])[0])
+        dates = [f"2024-06-{d + 1:02d}" for d in range(days)]
+        return {'daily': {
+            'time': dates,
+            'temperature_2m_max': [24.0] * days,
+            'temperature_2m_min': [14.0] * days,
+            'precipitation_sum': [0.0] * days,
+            'weathercode': [1] * days,
+        }}
+    return {'current_weather': {
+        'temperature': 21.5, 'windspeed': 9.0, 'winddirection': 180,
+        'weathercode': 2, 'time': '2024-06-01T12:00'
+    }}
+
+def _timezone(query):
+    return {
+        'timeZone': 'Europe/Paris',
+        'currentLocalTime': '2024-06-01T14:00:00',
+        'currentUtcOffset': {'seconds': 7200},
+        'dstActive': True
+    }
+
+def _sun_times(query):
+    date = query.get('date', ['2024-06-01'])[0]
+    return {'status': 'OK', 'results': {
+        'sunrise': f'{date}T03:47:00+00:00',
+        'sunset': f'{date}T19:50:00+00:00',
+        'solar_noon': f'{date}T11:48:30+00:00',
+        'day_length': 57780,
+        'civil_twilight_begin': f'{date}T03:08:00+00:00',
+        'civil_twilight_end': f'{date}T20:29:00+00:00'
+    }}
+
+def _reverse(query):
+    return {
+        'display_name': 'Rue de Rivoli, Paris, Ile-de-France, 75001, France',
+        'address': {'road': 'Rue de Rivoli', 'city': 'Paris', 'state': 'Ile-de-France',
+                    'postcode': '75001', 'country': 'France'}
+    }
+
+ROUTES = {
+    '/v1/forecast': _weather,
+    '/api/TimeZone/coordinate': _timezone,
+    '/json': _sun_times,
+    '/reverse': _reverse,
+}
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        handler = ROUTES.get(url.path)
+        with self.server.count_lock:
+            self.server.request_counts[url.path] = self.server.request_counts.get(url.path, 0) + 1
+
+        body = json.dumps(handler(parse_qs(url.query)) if handler else {'error': 'not found'}).encode()
+        self.send_response(200 if handler else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(host='127.0.0.1', port=0):
+    """
+    Start the stub on a background thread
+
+    Returns:
+        Tuple of (server, base_url); server.request_counts maps path to hits
+        and server.shutdown() stops it
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.request_counts = {}
+    server.count_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='api-stub', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def use_stub(base_url):
+    """Point every weather/time client at the stub"""
+    for service in BASE_URLS:
+        set_base_url(service, base_url)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stub for the weather and time APIs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.request_counts = {}
+    server.count_lock = threading.Lock()
+    print(f"API stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,79 @@
+"""
+Async Runner Module
+Background event loop so sync code (Flask views, stages) can run coroutines
+
+One daemon thread owns the loop for the whole process; any number of
+callers can have coroutines in flight on it at once, so concurrent network
+lookups wait on sockets instead of each holding a worker thread.
+"""
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import asyncio
+import threading
+import time
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_loop():
+    """The shared background event loop, started on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='async-io', daemon=True).start()
+            _loop = loop
+        return _loop
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the background loop and wait for its result
+
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait; the coroutine is cancelled when exceeded
+
+    Returns:
+        The coroutine's result; raises its exception or TimeoutError
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+async def gather_with_deadline(coros, deadline):
+    """
+    Run named coroutines together; whatever is unfinished at the deadline is cancelled
+
+    Args:
+        coros: Dictionary of name to coroutine
+        deadline: Seconds for the whole group
+
+    Returns:
+        Tuple of (results, report) shaped like stage_scheduler.run_stages:
+        failed or late entries get None and a status of 'error' or 'timeout'
+    """
+    started = time.monotonic()
+    tasks = {name: asyncio.ensure_future(coro) for name, coro in coros.items()}
+    finished = {}
+    for name, task in tasks.items():
+        task.add_done_callback(lambda _, name=name: finished.setdefault(name, time.monotonic()))
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results, report = {}, {}
+    for name, task in tasks.items():
+        status, value = 'ok', None
+        if not task.done():
+            task.cancel()
+            status = 'timeout'
+            print(f"Lookup '{name}' missed the {deadline}s deadline")
+        elif task.exception() is not None:
+            status = 'error'
+            print(f"Lookup '{name}' error: {task.exception()}")
+        else:
+            value = task.result()
+        results[name] = value
+        report[name] = {'status': status, 'seconds': round(finished.get(name, time.monotonic()) - started, 3)}
+    return results, report
@@ -2,84 +2,198 @@
 BLIP Image Captioning Module
 Generates natural language descriptions of images using BLIP
 """
-from transformers import BlipProcessor, BlipForConditionalGeneration
-from PIL import Image
+from transformers import BlipProcessor, BlipForConditionalGeneration, TextIteratorStreamer
+import threading
 import torch
 
-# Global model instances
-_processor = None
-_model = None
-_device = None
+from app.utils.image_context import load_image_context
+from app.utils.micro_batcher import get_batcher, group_by, prepare_each, raise_if_error
+from app.utils.model_registry import registry
+from app.utils.quantization import quantize_model
+
+# Bump when the weights or decoding change so cached captions are invalidated
+MODEL_VERSION = 'blip-image-captioning-base-1'
+
+REGISTRY_NAME = 'caption'
+
+# Caption shown when generation fails
+CAPTION_ERROR = "Unable to generate caption"
+
+# BlipProcessor resizes to 384x384; JPEGs are decoded no larger than needed
+INPUT_SIZE = 384
+
+# Latency tiers: greedy, small beam and wide beam search
+CAPTION_TIERS = {
+    'fast': {'max_length': 30, 'num_beams': 1},
+    'balanced': {'max_length': 30, 'num_beams': 2},
+    'quality': {'max_length': 75, 'num_beams': 5},
+}
+DEFAULT_TIER = 'balanced'
+
+# Sequences (images x beams) per generate call; bounds the decoder's KV cache
+MAX_SEQUENCES = 64
+
+def caption_settings(tier):
+    """(max_length, num_beams) of a latency tier"""
+    if tier not in CAPTION_TIERS:
+        raise ValueError(f"Unknown caption tier: {tier}")
+    settings = CAPTION_TIERS[tier]
+    return settings['max_length'], settings['num_beams']
+
+def _load_model():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    try:
+        processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+        model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+        model.to(device).eval()
+    except Exception as e:
+        print(f"Error loading BLIP model: {e}")
+        raise
+    return processor, quantize_model(model, device), device
 
 def get_model():
-    """Load BLIP model (singleton pattern)"""
-    global _processor, _model, _device
-    if _model is None:
-        _device = "cuda" if torch.cuda.is_available() else "cpu"
-        try:
-            _processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-            _model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            _model.to(_device)
-        except Exception as e:
-            print(f"Error loading BLIP model: {e}")
-            raise
-    return _processor, _model, _device
-
-def generate_caption(image_path, max_length=50, num_beams=4):
+    """Load BLIP model (shared, thread-safe registry entry)"""
+    return registry.get(REGISTRY_NAME, _load_model)
+
+def _generation_options(processor, max_length, num_beams):
+    options = {
+        'max_length': max_length,
+        'num_beams': num_beams,
+        'do_sample': False,
+        'use_cache': True,
+        # Captions that finish early are padded to the longest one in the batch
+        'pad_token_id': processor.tokenizer.pad_token_id,
+    }
+    if num_beams > 1:
+        options['early_stopping'] = True
+    return options
+
+def generate_captions(images, max_length=50, num_beams=4):
+    """
+    Generates captions for several images in batched generate calls
+
+    Captioning is unconditional, so every sequence starts from the same BOS
+    token and no prompt padding is needed; finished captions are padded and
+    the padding is stripped when decoding. Images x beams per call is capped
+    at MAX_SEQUENCES to bound the KV cache.
+
+    Args:
+        images: List of image paths or ImageContexts
+        max_length: Maximum length of generated captions
+        num_beams: Number of beams for beam search (1 = greedy)
+
+    Returns:
+        List with one caption string per image, or the exception for images
+        that could not be decoded
+    """
+    chunk = max(1, MAX_SEQUENCES // num_beams)
+    with registry.use(REGISTRY_NAME, _load_model) as (processor, model, device):
+        options = _generation_options(processor, max_length, num_beams)
+        captions, ready = prepare_each(images, lambda image: processor(
+            load_image_context(image).pil_reduced(INPUT_SIZE), return_tensors="pt")['pixel_values'])
+        for start in range(0, len(ready), chunk):
+            part = ready[start:start + chunk]
+            pixel_values = torch.cat([pixels for _, pixels in part]).to(device)
+
+            with torch.no_grad():
+                output = model.generate(pixel_values=pixel_values, **options)
+
+            for (i, _), caption in zip(part, processor.batch_decode(output, skip_special_tokens=True)):
+                captions[i] = caption
+    return captions
+
+def _caption_batch(items):
+    """Micro-batcher entry point; items are (image, max_length, num_beams)"""
+    captions = [None] * len(items)
+    for (max_length, num_beams), group in group_by(items, lambda item: item[1:]).items():
+        outputs = generate_captions([item[0] for _, item in group], max_length, num_beams)
+        for (i, _), caption in zip(group, outputs):
+            captions[i] = caption
+    return captions
+
+def generate_caption(image, max_length=50, num_beams=4, batched=False, tier=None):
     """
     Generates a natural language caption for an image
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
         max_length: Maximum length of generated caption
         num_beams: Number of beams for beam search (higher = better quality, slower)
+        batched: Share a forward pass with concurrent requests via the micro-batcher
+        tier: 'fast', 'balanced' or 'quality'; overrides max_length and num_beams
 
     Returns:
-        String caption describing the image
+        String caption describing the image (raises on failure; the
+        pipeline reports CAPTION_ERROR instead)
     """
     try:
-        processor, model, device = get_model()
-
-        # Load and process image
-        image = Image.open(image_path).convert('RGB')
-        inputs = processor(image, return_tensors="pt").to(device)
-
-        # Generate caption
-        with torch.no_grad():
-            output = model.generate(
-                **inputs,
-                max_length=max_length,
-                num_beams=num_beams,
-                early_stopping=True
-            )
-
-        # Decode caption
-        caption = processor.decode(output[0], skip_special_tokens=True)
-
-        return caption
+        if tier:
+            max_length, num_beams = caption_settings(tier)
+        if batched:
+            return get_batcher('caption', _caption_batch)((load_image_context(image), max_length, num_beams))
+        return raise_if_error(generate_captions([image], max_length=max_length, num_beams=num_beams)[0])
 
     except Exception as e:
         print(f"Error generating caption: {e}")
-        return "Unable to generate caption"
+        raise
 
-def generate_detailed_caption(image_path):
+def generate_detailed_caption(image):
     """
     Generates a more detailed caption with higher quality settings
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
 
     Returns:
         Detailed string caption
     """
-    return generate_caption(image_path, max_length=75, num_beams=5)
+    return generate_caption(image, tier='quality')
+
+def stream_caption(image, max_length=30):
+    """
+    Yield caption text pieces as they are generated
+
+    Streaming needs one sequence at a time, so this always decodes greedily
+    (the 'fast' tier's decoding) for a single image.
 
-def answer_question(image_path, question):
+    Args:
+        image: Path to the image file or a shared ImageContext
+        max_length: Maximum length of generated caption
+
+    Yields:
+        Text fragments; joined they form the caption
+    """
+    ctx = load_image_context(image)
+    with registry.use(REGISTRY_NAME, _load_model) as (processor, model, device):
+        streamer = TextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=60)
+        inputs = processor(ctx.pil_reduced(INPUT_SIZE), return_tensors="pt").to(device)
+        options = _generation_options(processor, max_length, 1)
+        errors = []
+
+        def run():
+            try:
+                with torch.no_grad():
+                    model.generate(**inputs, **options, streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=run, name='caption-stream', daemon=True)
+        worker.start()
+        for text in streamer:
+            if text:
+                yield text
+        worker.join()
+        if errors:
+            raise errors[0]
+
+def answer_question(image, question):
     """
     Answer a question about the image using BLIP VQA (Visual Question Answering)
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
         question: Question to ask about the image
 
     Returns:
@@ -88,15 +202,13 @@ def answer_question(image_path, question):
     try:
         # Note: This would require BLIP VQA model
         # For now, we'll use the caption model with conditional generation
-        processor, model, device = get_model()
-
-        image = Image.open(image_path).convert('RGB')
-        inputs = processor(image, question, return_tensors="pt").to(device)
+        with registry.use(REGISTRY_NAME, _load_model) as (processor, model, device):
+            inputs = processor(load_image_context(image).pil_reduced(INPUT_SIZE), question, return_tensors="pt").to(device)
 
-        with torch.no_grad():
-            output = model.generate(**inputs, max_length=50)
+            with torch.no_grad():
+                output = model.generate(**inputs, max_length=50)
 
-        answer = processor.decode(output[0], skip_special_tokens=True)
+            answer = processor.decode(output[0], skip_special_tokens=True)
         return answer
 
     except Exception as e:
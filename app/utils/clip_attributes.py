@@ -1,60 +1,195 @@
 """
 OpenCLIP Attribute Classification - ViT-L/14
 """
+import hashlib
+import os
 import torch
-from PIL import Image
 
-_model = None
-_preprocess = None
-_tokenizer = None
-_device = None
+from app.utils.clip_embedding import image_embeddings, register_head, shared_encoder
+from app.utils.image_context import load_image_context
+from app.utils.micro_batcher import get_batcher, prepare_each, raise_if_error
+from app.utils.model_registry import registry
+from app.utils.quantization import quantize_model
+
+REGISTRY_NAME = 'attributes'
+
+# The ViT-L/14 transform resizes the shorter side to 224
+INPUT_SIZE = 224
+
+ATTRIBUTES = {
+    'setting': ['indoor', 'outdoor'],
+    'time_of_day': ['daytime', 'nighttime', 'sunrise', 'sunset'],
+    'weather': ['sunny', 'cloudy', 'rainy', 'snowy', 'foggy'],
+    'season': ['spring', 'summer', 'fall', 'winter'],
+    'lighting': ['bright', 'dim', 'natural light', 'artificial light'],
+    'mood': ['happy', 'calm', 'energetic', 'peaceful', 'dramatic'],
+    'scene_type': ['urban', 'rural', 'beach', 'mountain', 'forest', 'desert'],
+    'activity': ['busy', 'calm', 'empty']
+}
+
+PROMPT_TEMPLATE = "a photo that is {}"
+
+TEXT_CACHE_PATH = os.path.join('app', 'models', 'clip_attribute_text.pt')
+
+# Changes whenever the prompt bank does; bump the prefix when the weights change
+MODEL_VERSION = 'ViT-L-14-laion2b-1-' + hashlib.sha1(
+    repr((PROMPT_TEMPLATE, ATTRIBUTES)).encode()).hexdigest()[:8]
+
+def _load_model():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    try:
+        import open_clip
+        model, _, preprocess = open_clip.create_model_and_transforms('ViT-L-14', pretrained='laion2b_s32b_b82k')
+        tokenizer = open_clip.get_tokenizer('ViT-L-14')
+        model.to(device).eval()
+        model_name = 'open_clip/ViT-L-14/laion2b_s32b_b82k'
+    except Exception as e:
+        print(f"Error loading OpenCLIP, falling back to CLIP ViT-B/32: {e}")
+        import clip
+        model, preprocess = clip.load("ViT-B/32", device=device)
+        tokenizer = clip.tokenize
+        model_name = 'clip/ViT-B/32'
+
+    text_bank = load_text_bank(model_name, device)
+    if text_bank is None:
+        text_bank = build_text_bank(model, tokenizer, device)
+        save_text_bank(model_name, text_bank)
+    # The text bank is built in fp32 before the Linear layers are (optionally) quantized
+    model = quantize_model(model, device)
+    return model, preprocess, tokenizer, device, text_bank
 
 def get_model():
-    global _model, _preprocess, _tokenizer, _device
-    if _model is None:
-        _device = "cuda" if torch.cuda.is_available() else "cpu"
-        try:
-            import open_clip
-            _model, _, _preprocess = open_clip.create_model_and_transforms('ViT-L-14', pretrained='laion2b_s32b_b82k')
-            _tokenizer = open_clip.get_tokenizer('ViT-L-14')
-            _model.to(_device).eval()
-        except:
-            import clip
-            _model, _preprocess = clip.load("ViT-B/32", device=_device)
-            _tokenizer = clip.tokenize
-    return _model, _preprocess, _tokenizer, _device
-
-def classify_attributes(image_path):
+    return registry.get(REGISTRY_NAME, _load_model)[:4]
+
+def get_text_bank():
+    """
+    Returns the precomputed prompt embeddings, loading the model if needed
+
+    Returns:
+        Tuple of (features, slices): a [num_prompts, dim] tensor of normalized
+        text embeddings and a dict mapping each category to its (start, end) rows
+    """
+    return registry.get(REGISTRY_NAME, _load_model)[4]
+
+def _build_prompts():
+    prompts, slices = [], {}
+    for category, options in ATTRIBUTES.items():
+        start = len(prompts)
+        prompts.extend(PROMPT_TEMPLATE.format(opt) for opt in options)
+        slices[category] = (start, len(prompts))
+    return prompts, slices
+
+register_head(REGISTRY_NAME, lambda encoder: encoder.encode_text(_build_prompts()[0]))
+
+def build_text_bank(model, tokenizer, device):
+    """Encode every attribute prompt once into one stacked, normalized tensor"""
+    prompts, slices = _build_prompts()
+    with torch.no_grad():
+        features = model.encode_text(tokenizer(prompts).to(device))
+        features /= features.norm(dim=-1, keepdim=True)
+    return features, slices
+
+def save_text_bank(model_name, text_bank, path=TEXT_CACHE_PATH):
+    """Persist the text bank so restarts can skip the text tower"""
+    try:
+        features, slices = text_bank
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        torch.save({
+            'model': model_name,
+            'prompts': _build_prompts()[0],
+            'features': features.cpu(),
+            'slices': slices
+        }, path)
+        return True
+    except Exception as e:
+        print(f"Error saving CLIP text cache: {e}")
+        return False
+
+def load_text_bank(model_name, device, path=TEXT_CACHE_PATH):
+    """Load a saved text bank, or None if missing or built for other prompts/weights"""
+    if not os.path.exists(path):
+        return None
     try:
-        model, preprocess, tokenizer, device = get_model()
-        image = preprocess(Image.open(image_path)).unsqueeze(0).to(device)
-
-        attributes = {
-            'setting': ['indoor', 'outdoor'],
-            'time_of_day': ['daytime', 'nighttime', 'sunrise', 'sunset'],
-            'weather': ['sunny', 'cloudy', 'rainy', 'snowy', 'foggy'],
-            'season': ['spring', 'summer', 'fall', 'winter'],
-            'lighting': ['bright', 'dim', 'natural light', 'artificial light'],
-            'mood': ['happy', 'calm', 'energetic', 'peaceful', 'dramatic'],
-            'scene_type': ['urban', 'rural', 'beach', 'mountain', 'forest', 'desert'],
-            'activity': ['busy', 'calm', 'empty']
-        }
+        cached = torch.load(path, map_location=device)
+        if cached.get('model') != model_name or cached.get('prompts') != _build_prompts()[0]:
+            return None
+        return cached['features'], {k: tuple(v) for k, v in cached['slices'].items()}
+    except Exception as e:
+        print(f"Error loading CLIP text cache: {e}")
+        return None
+
+def classify_attributes_batch(images, return_distribution=False):
+    """
+    Zero-shot classification of scene attributes for several images at once
+
+    Args:
+        images: List of image paths or ImageContexts
+        return_distribution: Also return every option's probability per category
 
+    Returns:
+        List with one dictionary per image mapping each category to its top
+        value and confidence, or the exception for images that could not be
+        decoded
+    """
+    logits = []
+    if shared_encoder():
+        # Score the embedding the geo head shares instead of running a second vision tower
+        embeddings, encoder = image_embeddings(images)
+        batch_results, ready = prepare_each(embeddings, raise_if_error)
+        slices = _build_prompts()[1]
+        if ready:
+            logits = 100.0 * torch.stack([features for _, features in ready]) @ encoder.head_state(REGISTRY_NAME).T
+    else:
+        with registry.use(REGISTRY_NAME, _load_model) as (model, preprocess, _, device, text_bank):
+            text_features, slices = text_bank
+            batch_results, ready = prepare_each(
+                images, lambda image: preprocess(load_image_context(image).pil_reduced(INPUT_SIZE)))
+
+            # One image encode and one matmul against the whole prompt bank
+            if ready:
+                with torch.no_grad():
+                    image_features = model.encode_image(torch.stack([pixels for _, pixels in ready]).to(device))
+                    image_features /= image_features.norm(dim=-1, keepdim=True)
+                    logits = 100.0 * image_features @ text_features.T
+
+    for (i, _), row in zip(ready, logits):
         results = {}
-        for category, options in attributes.items():
-            prompts = [f"a photo that is {opt}" for opt in options]
-            text_inputs = tokenizer(prompts).to(device)
-
-            with torch.no_grad():
-                image_features = model.encode_image(image)
-                text_features = model.encode_text(text_inputs)
-                image_features /= image_features.norm(dim=-1, keepdim=True)
-                text_features /= text_features.norm(dim=-1, keepdim=True)
-                similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-
-            values, indices = similarity[0].topk(1)
+        for category, options in ATTRIBUTES.items():
+            start, end = slices[category]
+            probs = row[start:end].softmax(dim=-1)
+            values, indices = probs.topk(1)
             results[category] = {'value': options[indices[0].item()], 'confidence': float(values[0])}
+            if return_distribution:
+                results[category]['distribution'] = {opt: float(p) for opt, p in zip(options, probs.tolist())}
+        batch_results[i] = results
+    return batch_results
+
+def _classify_batch(items):
+    """Micro-batcher entry point; items are (image, return_distribution)"""
+    results = classify_attributes_batch([item[0] for item in items], return_distribution=True)
+    for (_, return_distribution), result in zip(items, results):
+        if not return_distribution and not isinstance(result, Exception):
+            for category in result.values():
+                del category['distribution']
+    return results
 
-        return results
-    except:
-        return {}
+def classify_attributes(image, return_distribution=False, batched=False):
+    """
+    Zero-shot classification of scene attributes
+
+    Args:
+        image: Path to the image file or a shared ImageContext
+        return_distribution: Also return every option's probability per category
+        batched: Share a forward pass with concurrent requests via the micro-batcher
+
+    Returns:
+        Dictionary mapping each category to its top value and confidence
+        (raises on failure, so an empty result is never mistaken for one)
+    """
+    try:
+        if batched:
+            return get_batcher('attributes', _classify_batch)((load_image_context(image), return_distribution))
+        return raise_if_error(classify_attributes_batch([image], return_distribution=return_distribution)[0])
+    except Exception as e:
+        print(f"Error classifying attributes: {e}")
+        raise
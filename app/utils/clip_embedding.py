@@ -0,0 +1,240 @@
+"""
+Shared CLIP Embedding Module
+One vision encoder for both zero-shot heads (scene attributes and country)
+
+By default the attribute head runs OpenCLIP ViT-L/14 (laion2b) and the geo
+head runs StreetCLIP, two ViT-L/14 CLIPs that each encode every image. In
+shared mode a single encoder is loaded instead: each image is embedded once
+and both heads score that embedding against their own prompt embeddings,
+which halves vision compute and resident weights.
+
+Heads register how to build their text side (prompt embeddings, label
+index) at import; it is built once when the encoder loads, before any int8
+quantization.
+"""
+from concurrent.futures import Future
+import threading
+
+import torch
+
+from app.utils.image_context import load_image_context
+from app.utils.micro_batcher import prepare_each
+from app.utils.model_registry import registry
+from app.utils.quantization import quantize_model
+
+REGISTRY_NAME = 'clip'
+
+# Encoders that can serve both heads: (library, model, input size)
+ENCODERS = {
+    'streetclip': ('transformers', 'geolocal/StreetCLIP', 336),
+    'open_clip': ('open_clip', ('ViT-L-14', 'laion2b_s32b_b82k'), 224),
+}
+
+# None = each head loads its own model; change with configure_shared_clip()
+SHARED_CLIP_CONFIG = {'encoder': None}
+_config_lock = threading.Lock()
+
+_heads = {}
+
+def register_head(name, build_text_state):
+    """
+    Declare a zero-shot head that can score shared embeddings
+
+    Args:
+        name: Head name
+        build_text_state: Function of a ClipEncoder returning whatever the
+            head scores against (e.g. its normalized prompt embeddings)
+    """
+    _heads[name] = build_text_state
+
+def configure_shared_clip(encoder):
+    """
+    Select the shared encoder ('streetclip' or 'open_clip'), or None for separate models
+
+    The encoder and both heads' models are dropped so the next call loads
+    whatever the new mode needs.
+    """
+    if encoder not in ENCODERS and encoder is not None:
+        raise ValueError(f"Unknown shared CLIP encoder: {encoder}")
+    with _config_lock:
+        changed = SHARED_CLIP_CONFIG['encoder'] != encoder
+        SHARED_CLIP_CONFIG['encoder'] = encoder
+    if changed:
+        for name in (REGISTRY_NAME, 'attributes', 'geo'):
+            registry.unload(name)
+
+def shared_encoder():
+    """Name of the shared encoder, or None when the heads use separate models"""
+    return SHARED_CLIP_CONFIG['encoder']
+
+def shared_tag():
+    """Suffix for cache versions of the attribute and geo stages"""
+    encoder = shared_encoder()
+    return f'-shared-{encoder}' if encoder else ''
+
+class ClipEncoder:
+    """
+    Either CLIP implementation behind one interface
+
+    Args:
+        name: Name of the encoder
+        model, preprocess, tokenizer: Loaded model parts (preprocess is a
+            CLIPProcessor and tokenizer None for transformers models)
+        device: Device the model runs on
+        input_size: Shorter side the preprocessing resizes to
+    """
+
+    def __init__(self, name, model, preprocess, tokenizer, device, input_size):
+        self.name = name
+        self.model = model
+        self.preprocess = preprocess
+        self.tokenizer = tokenizer
+        self.device = device
+        self.input_size = input_size
+        self.logit_scale = float(model.logit_scale.exp())
+        self.heads = {}
+        self._heads_lock = threading.Lock()
+
+    @property
+    def is_open_clip(self):
+        return self.tokenizer is not None
+
+    def preprocess_image(self, pil_image):
+        """Model input tensor [3, H, W] for one image"""
+        if self.is_open_clip:
+            return self.preprocess(pil_image)
+        return self.preprocess(images=pil_image, return_tensors='pt')['pixel_values'][0]
+
+    def encode_pixels(self, batch):
+        """Normalized image embeddings [n, dim] of stacked preprocessed images"""
+        with torch.no_grad():
+            if self.is_open_clip:
+                features = self.model.encode_image(batch.to(self.device))
+            else:
+                features = self.model.get_image_features(pixel_values=batch.to(self.device))
+        return features / features.norm(dim=-1, keepdim=True)
+
+    def encode_images(self, pil_images):
+        """Normalized image embeddings [n, dim]"""
+        return self.encode_pixels(torch.stack([self.preprocess_image(image) for image in pil_images]))
+
+    def encode_text(self, prompts):
+        """Normalized text embeddings [n, dim]"""
+        with torch.no_grad():
+            if self.is_open_clip:
+                features = self.model.encode_text(self.tokenizer(prompts).to(self.device))
+            else:
+                inputs = self.preprocess(text=prompts, return_tensors='pt', padding=True)
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                features = self.model.get_text_features(**inputs)
+        return features / features.norm(dim=-1, keepdim=True)
+
+    def head_state(self, name):
+        """Text side of a registered head (built now if it was registered after loading)"""
+        with self._heads_lock:
+            if name not in self.heads:
+                self.heads[name] = _heads[name](self)
+            return self.heads[name]
+
+def load_clip_encoder(name, library, weights, input_size):
+    """
+    Load a CLIP model in fp32 as a ClipEncoder
+
+    Args:
+        name: Name for the encoder
+        library: 'open_clip' or 'transformers'
+        weights: (architecture, pretrained tag) for open_clip, a model id for transformers
+        input_size: Shorter side the preprocessing resizes to
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if library == 'open_clip':
+        import open_clip
+        model, _, preprocess = open_clip.create_model_and_transforms(weights[0], pretrained=weights[1])
+        tokenizer = open_clip.get_tokenizer(weights[0])
+    else:
+        from transformers import CLIPProcessor, CLIPModel
+        model = CLIPModel.from_pretrained(weights)
+        preprocess = CLIPProcessor.from_pretrained(weights)
+        tokenizer = None
+    model.to(device).eval()
+    return ClipEncoder(name, model, preprocess, tokenizer, device, input_size)
+
+def _load_encoder():
+    name = shared_encoder() or 'streetclip'
+    encoder = load_clip_encoder(name, *ENCODERS[name])
+    for head in list(_heads):
+        encoder.head_state(head)
+    encoder.model = quantize_model(encoder.model, encoder.device)
+    return encoder
+
+def get_encoder():
+    """Load the shared encoder (shared, thread-safe registry entry)"""
+    return registry.get(REGISTRY_NAME, _load_encoder)
+
+_claim_lock = threading.Lock()
+_in_progress = set()
+
+def image_embeddings(images):
+    """
+    Shared embeddings of several images, computing only the ones not seen yet
+
+    Each image's embedding is kept on its ImageContext, so when the
+    attribute and geo heads both ask for the same image (even concurrently)
+    the vision tower runs once.
+
+    Args:
+        images: List of image paths or ImageContexts
+
+    An image that fails to decode fails only itself; if the encoder fails,
+    the claimed embeddings are dropped from their contexts so a later call
+    retries them.
+
+    Returns:
+        Tuple of (embeddings, encoder): one [dim] tensor per image, or the
+        exception for images that could not be embedded
+    """
+    contexts = [load_image_context(image) for image in images]
+    with registry.use(REGISTRY_NAME, _load_encoder) as encoder:
+        key = ('clip_embedding', encoder.name)
+        futures = [ctx.derived(key, Future) for ctx in contexts]
+
+        # Claim the embeddings nobody else is computing; wait for the rest below
+        claimed = []
+        with _claim_lock:
+            for ctx, future in zip(contexts, futures):
+                if not future.done() and future not in _in_progress:
+                    _in_progress.add(future)
+                    claimed.append((ctx, future))
+
+        if claimed:
+            try:
+                errors, ready = prepare_each(
+                    claimed, lambda item: encoder.preprocess_image(item[0].pil_reduced(encoder.input_size)))
+                for (_, future), error in zip(claimed, errors):
+                    if error is not None:
+                        future.set_exception(error)
+                if ready:
+                    try:
+                        features = encoder.encode_pixels(torch.stack([pixels for _, pixels in ready]))
+                    except Exception as e:
+                        for i, _ in ready:
+                            claimed[i][0].discard_derived(key)
+                            claimed[i][1].set_exception(e)
+                    else:
+                        for (i, _), row in zip(ready, features):
+                            claimed[i][1].set_result(row)
+            finally:
+                with _claim_lock:
+                    _in_progress.difference_update(future for _, future in claimed)
+
+        embeddings = []
+        for future in futures:
+            try:
+                embeddings.append(future.result())
+            except Exception as e:
+                embeddings.append(e)
+        return embeddings, encoder
+
+def shared_info():
+    """Summary for /metrics"""
+    return {'encoder': shared_encoder(), 'heads': sorted(_heads)}
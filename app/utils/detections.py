@@ -0,0 +1,67 @@
+"""
+Detections Module
+Columnar object-detection results
+
+Boxes stay in NumPy arrays from the detector to the counting rules; lists
+of dicts are only built when a result is serialized for the API.
+"""
+import numpy as np
+
+def class_names(names):
+    """Tuple indexed by class id from a model's {id: name} mapping (or a sequence)"""
+    if isinstance(names, dict):
+        size = max(names, default=-1) + 1
+        return tuple(names.get(i, str(i)) for i in range(size))
+    return tuple(names)
+
+class Detections:
+    """
+    Boxes found in one image
+
+    Args:
+        class_ids: int32 array [n]
+        confidences: float32 array [n]
+        boxes: float32 array [n, 4] of x1, y1, x2, y2 in pixels
+        names: Tuple of class names indexed by class id
+    """
+
+    __slots__ = ('class_ids', 'confidences', 'boxes', 'names')
+
+    def __init__(self, class_ids, confidences, boxes, names):
+        self.class_ids = class_ids
+        self.confidences = confidences
+        self.boxes = boxes
+        self.names = names
+
+    @classmethod
+    def from_rows(cls, rows, names):
+        """From detector rows [n, 6]: x1, y1, x2, y2, confidence, class id"""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+        return cls(rows[:, 5].astype(np.int32), rows[:, 4].copy(), rows[:, :4].copy(), names)
+
+    @classmethod
+    def empty(cls, names=()):
+        return cls(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32),
+                   np.zeros((0, 4), dtype=np.float32), names)
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def class_counts(self):
+        """Boxes per class id (np.bincount over all classes)"""
+        return np.bincount(self.class_ids, minlength=len(self.names))
+
+    def counts(self):
+        """{class name: count} in order of first appearance, for the API"""
+        ids, first = np.unique(self.class_ids, return_index=True)
+        counts = self.class_counts()
+        return {self.names[i]: int(counts[i]) for i in ids[np.argsort(first)].tolist()}
+
+    def to_list(self):
+        """Per-box dictionaries, for the API"""
+        return [{
+            'class': self.names[class_id],
+            'confidence': confidence,
+            'bbox': box
+        } for class_id, confidence, box in zip(self.class_ids.tolist(), self.confidences.tolist(),
+                                               self.boxes.tolist())]
@@ -2,32 +2,37 @@
 EXIF Location Extraction Module
 Extracts GPS coordinates and location data from image EXIF metadata
 """
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.ExifTags import GPSTAGS
 from geopy.geocoders import Nominatim
 from datetime import datetime
+import asyncio
+import threading
 
-def get_exif_data(image_path):
+from app.utils.http_client import api_url, fetch_json_async
+from app.utils.geocode_cache import CACHE_PATH, DEFAULT_PRECISION, GeocodeCache
+from app.utils.image_context import load_image_context
+from app.utils.offline_geocoder import get_offline_geocoder
+from app.utils.rate_limit import get_rate_limiter
+
+# Nominatim usage policy: at most one request per second
+NOMINATIM_MIN_INTERVAL = 1.0
+
+_geolocator = None
+_geocode_cache = None
+_geocode_lock = threading.Lock()
+
+def get_exif_data(image):
     """
     Extract all EXIF data from an image
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
 
     Returns:
-        Dictionary of EXIF data
+        Dictionary of EXIF data (parsed once per ImageContext)
     """
     try:
-        image = Image.open(image_path)
-        exif_data = {}
-
-        info = image._getexif()
-        if info:
-            for tag, value in info.items():
-                decoded = TAGS.get(tag, tag)
-                exif_data[decoded] = value
-
-        return exif_data
+        return load_image_context(image).exif
 
     except Exception as e:
         print(f"Error extracting EXIF data: {e}")
@@ -95,49 +100,154 @@ def get_coordinates(gps_data):
         print(f"Error converting coordinates: {e}")
         return None
 
-def get_location_name(latitude, longitude):
+def configure_geocoding(cache_path=CACHE_PATH, precision=DEFAULT_PRECISION):
+    """
+    Set up the persistent reverse-geocode cache
+
+    Args:
+        cache_path: SQLite file for the cache (':memory:' to keep it per process)
+        precision: Grid precision in decimal degrees (3 = ~110 m)
+    """
+    global _geocode_cache
+    try:
+        cache = GeocodeCache(cache_path, precision)
+    except Exception as e:
+        print(f"Error opening geocode cache {cache_path}: {e}; using memory only")
+        cache = GeocodeCache(':memory:', precision)
+    with _geocode_lock:
+        _geocode_cache = cache
+    return cache
+
+def get_geocode_cache():
+    if _geocode_cache is None:
+        configure_geocoding()
+    return _geocode_cache
+
+def get_geolocator():
+    """Nominatim client, created once per process"""
+    global _geolocator
+    with _geocode_lock:
+        if _geolocator is None:
+            _geolocator = Nominatim(user_agent="image_insight_analyzer")
+        return _geolocator
+
+def _address_result(full_address, address):
+    """Location dictionary from a Nominatim address block"""
+    return {
+        'full_address': full_address,
+        'city': address.get('city') or address.get('town') or address.get('village'),
+        'country': address.get('country'),
+        'state': address.get('state'),
+        'postal_code': address.get('postcode')
+    }
+
+def _lookup_local(latitude, longitude, offline):
+    """
+    Answer from the offline gazetteer or the geocode cache when possible
+
+    Returns:
+        Tuple of (answered, result)
+    """
+    offline_geocoder = get_offline_geocoder()
+    if offline is None:
+        offline = offline_geocoder is not None
+    if offline:
+        if offline_geocoder is None:
+            print("Offline geocoding requested but no gazetteer is loaded")
+            return True, None
+        try:
+            return True, offline_geocoder.lookup(latitude, longitude)
+        except Exception as e:
+            print(f"Error in offline reverse geocoding: {e}")
+            return True, None
+
+    return get_geocode_cache().get(latitude, longitude)
+
+def get_location_name(latitude, longitude, offline=None):
     """
     Get location name from coordinates using reverse geocoding
 
+    Online results (including "no address") are cached by grid cell, and
+    cache misses are spaced out to respect Nominatim's one request per second.
+
     Args:
         latitude: Latitude coordinate
         longitude: Longitude coordinate
+        offline: Use the local gazetteer instead of Nominatim; defaults to
+            offline whenever an offline geocoder has been loaded
 
     Returns:
         Dictionary with location information
     """
+    answered, result = _lookup_local(latitude, longitude, offline)
+    if answered:
+        return result
+
     try:
-        geolocator = Nominatim(user_agent="image_insight_analyzer")
-        location = geolocator.reverse(f"{latitude}, {longitude}", language='en')
+        get_rate_limiter('nominatim', NOMINATIM_MIN_INTERVAL).wait()
+        location = get_geolocator().reverse(f"{latitude}, {longitude}", language='en')
 
+        result = None
         if location:
-            address = location.raw.get('address', {})
-            return {
-                'full_address': location.address,
-                'city': address.get('city') or address.get('town') or address.get('village'),
-                'country': address.get('country'),
-                'state': address.get('state'),
-                'postal_code': address.get('postcode')
-            }
+            result = _address_result(location.address, location.raw.get('address', {}))
+
+        get_geocode_cache().put(latitude, longitude, result)
+        return result
 
     except Exception as e:
         print(f"Error getting location name: {e}")
 
     return None
 
-def extract_location(image_path):
+async def get_location_name_async(latitude, longitude, offline=None):
     """
-    Main function to extract complete location information from image
+    Async get_location_name; same arguments, result, caching and rate limit
+
+    Calls Nominatim's reverse endpoint directly so the lookup waits on the
+    event loop rather than a thread.
+    """
+    answered, result = _lookup_local(latitude, longitude, offline)
+    if answered:
+        return result
+
+    try:
+        delay = get_rate_limiter('nominatim', NOMINATIM_MIN_INTERVAL).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        params = {
+            'lat': latitude,
+            'lon': longitude,
+            'format': 'json',
+            'addressdetails': 1,
+            'accept-language': 'en'
+        }
+        data = await fetch_json_async('reverse', api_url('nominatim', '/reverse'), params, None)
+
+        result = None
+        if data and 'error' not in data:
+            result = _address_result(data.get('display_name'), data.get('address', {}))
+
+        get_geocode_cache().put(latitude, longitude, result)
+        return result
+
+    except Exception as e:
+        print(f"Error getting location name: {e}")
+
+    return None
+
+def extract_coordinates(image):
+    """
+    Extract GPS coordinates from image EXIF without any network lookup
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
 
     Returns:
-        Dictionary with location data or None
+        Dictionary with latitude, longitude and altitude or None
     """
     try:
         # Get EXIF data
-        exif_data = get_exif_data(image_path)
+        exif_data = get_exif_data(image)
         if not exif_data:
             return None
 
@@ -153,16 +263,35 @@ def extract_location(image_path):
 
         latitude, longitude = coords
 
-        # Get location name
-        location_info = get_location_name(latitude, longitude)
-
-        # Combine all information
-        result = {
+        return {
             'latitude': latitude,
             'longitude': longitude,
             'altitude': gps_data.get('GPSAltitude'),
         }
 
+    except Exception as e:
+        print(f"Error extracting coordinates: {e}")
+        return None
+
+def extract_location(image, offline=None):
+    """
+    Main function to extract complete location information from image
+
+    Args:
+        image: Path to the image file or a shared ImageContext
+        offline: Reverse-geocode with the local gazetteer (see get_location_name)
+
+    Returns:
+        Dictionary with location data or None
+    """
+    try:
+        result = extract_coordinates(image)
+        if not result:
+            return None
+
+        # Get location name
+        location_info = get_location_name(result['latitude'], result['longitude'], offline=offline)
+
         if location_info:
             result.update(location_info)
 
@@ -172,18 +301,18 @@ def extract_location(image_path):
         print(f"Error extracting location: {e}")
         return None
 
-def get_datetime(image_path):
+def get_datetime(image):
     """
     Extract date and time when photo was taken
 
     Args:
-        image_path: Path to the image file
+        image: Path to the image file or a shared ImageContext
 
     Returns:
         Datetime object or None
     """
     try:
-        exif_data = get_exif_data(image_path)
+        exif_data = get_exif_data(image)
         if 'DateTime' in exif_data:
             dt_str = exif_data['DateTime']
             return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
@@ -0,0 +1,163 @@
+"""
+Geo Label Index
+Precomputed label embeddings and top-k search for zero-shot geo prediction
+
+Prompt embeddings are encoded once per model and label set and saved as a
+plain float32 .npy matrix (memory-mapped on load), so requests only run the
+image tower and a matrix product. Because the labels are grouped by parent
+(see geo_labels), each refinement step scores one contiguous block of rows:
+continents, then the countries of the best continents, then the regions of
+the best country, then that region's cities.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from app.utils.geo_labels import GeoLabels
+
+INDEX_DIR = os.path.join('app', 'models', 'geo_index')
+ENCODE_BATCH = 256
+
+# Candidates kept at each refinement step
+CONTINENT_BEAM = 3
+REGION_TOP_K = 3
+CITY_TOP_K = 3
+
+def _embedding_path(model_name, prompts, index_dir):
+    digest = hashlib.sha1('\n'.join([model_name] + list(prompts)).encode()).hexdigest()[:16]
+    return os.path.join(index_dir, f'{digest}.npy')
+
+def load_or_encode(model_name, prompts, encode_text, index_dir=INDEX_DIR):
+    """
+    Prompt embeddings from disk, encoding and saving them on first use
+
+    Files are named by a hash of the model name and every prompt, so a new
+    model or label set never picks up stale embeddings.
+
+    Args:
+        model_name: Identifies the text encoder (weights and precision)
+        prompts: List of prompt strings
+        encode_text: Function mapping a list of prompts to normalized embeddings
+        index_dir: Directory of saved matrices
+
+    Returns:
+        float32 array [len(prompts), dim], rows L2-normalized
+    """
+    path = _embedding_path(model_name, prompts, index_dir)
+    if os.path.exists(path):
+        try:
+            return np.load(path, mmap_mode='r')
+        except Exception as e:
+            print(f"Error loading label embeddings, re-encoding: {e}")
+
+    print(f"Encoding {len(prompts)} geo label prompts...")
+    chunks = [np.asarray(encode_text(prompts[start:start + ENCODE_BATCH]), dtype=np.float32)
+              for start in range(0, len(prompts), ENCODE_BATCH)]
+    features = np.concatenate(chunks)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, features)
+        os.replace(tmp_path, path)
+        with open(path[:-4] + '.json', 'w') as f:
+            json.dump({'model': model_name, 'labels': len(prompts)}, f)
+    except Exception as e:
+        print(f"Error saving label embeddings: {e}")
+    return features
+
+class GeoLabelIndex:
+    """
+    Label embeddings with hierarchical top-k search
+
+    Args:
+        labels: GeoLabels
+        features: float32 array [len(labels), dim] of normalized prompt embeddings
+    """
+
+    def __init__(self, labels, features):
+        self.labels = labels
+        self.features = features
+        self.codes = {code: row for row, code in enumerate(labels.codes)}
+
+        # (level, parent) -> (start, end) rows; labels of one group are contiguous
+        self.groups = {}
+        for row, key in enumerate(zip(labels.levels, labels.parents)):
+            start, _ = self.groups.get(key, (row, row))
+            self.groups[key] = (start, row + 1)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _candidates(self, level, parents):
+        ranges = [self.groups[(level, parent)] for parent in parents if (level, parent) in self.groups]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+    def top_k(self, vector, level, parents, k, logit_scale):
+        """
+        Best labels of one level among the children of parents
+
+        Probabilities are a softmax over the candidate block only.
+
+        Returns:
+            List of (row, probability), best first
+        """
+        rows = self._candidates(level, parents)
+        if not len(rows):
+            return []
+        logits = logit_scale * (self.features[rows] @ vector)
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        k = min(k, len(rows))
+        best = np.argpartition(-probs, k - 1)[:k]
+        best = best[np.argsort(-probs[best])]
+        return [(int(rows[i]), float(probs[i])) for i in best]
+
+    def _entry(self, row, confidence, name_key):
+        return {
+            name_key: self.labels.names[row],
+            'code': self.labels.codes[row],
+            'confidence': confidence,
+        }
+
+    def refine(self, image_features, top_k=5, logit_scale=100.0):
+        """
+        Continent, country, region and city predictions for each image
+
+        Args:
+            image_features: float32 array [n, dim] of normalized image embeddings
+            top_k: Countries to return per image
+            logit_scale: CLIP temperature (logit_scale.exp() of the model)
+
+        Returns:
+            List of dictionaries with 'continent', 'countries', 'regions' and 'cities'
+        """
+        results = []
+        for vector in np.asarray(image_features, dtype=np.float32):
+            continents = self.top_k(vector, 'continent', [None], CONTINENT_BEAM, logit_scale)
+            countries = self.top_k(vector, 'country', [self.labels.codes[row] for row, _ in continents],
+                                   top_k, logit_scale)
+            regions = self.top_k(vector, 'region', [self.labels.codes[countries[0][0]]],
+                                 REGION_TOP_K, logit_scale) if countries else []
+            cities = self.top_k(vector, 'city', [self.labels.codes[regions[0][0]]],
+                                CITY_TOP_K, logit_scale) if regions else []
+
+            results.append({
+                'continent': self._entry(*continents[0], 'continent') if continents else None,
+                'countries': [dict(self._entry(row, p, 'country'),
+                                   continent=self.labels.names[self.codes[self.labels.parents[row]]])
+                              for row, p in countries],
+                'regions': [self._entry(row, p, 'region') for row, p in regions],
+                'cities': [self._entry(row, p, 'city') for row, p in cities],
+            })
+        return results
+
+def build_index(model_name, encode_text, labels=None, index_dir=INDEX_DIR):
+    """GeoLabelIndex over labels (the bundled continents and countries by default)"""
+    if labels is None:
+        labels = GeoLabels()
+    return GeoLabelIndex(labels, load_or_encode(model_name, labels.prompts, encode_text, index_dir))
@@ -0,0 +1,317 @@
+"""
+Geo Labels Module
+Hierarchical label set for zero-shot geo prediction: continent > country > region > city
+
+Continents and countries are bundled. Regions (first-level divisions) and
+cities are optional and come from the same GeoNames files the offline
+geocoder reads (admin1CodesASCII.txt and cities*.txt).
+
+Labels are ordered level by level, and within a level grouped by parent,
+so every (level, parent) group is one contiguous block of rows.
+"""
+import hashlib
+
+from app.utils.offline_geocoder import read_table
+
+# GeoNames continent codes
+CONTINENTS = {
+    'AF': 'Africa',
+    'AS': 'Asia',
+    'EU': 'Europe',
+    'NA': 'North America',
+    'OC': 'Oceania',
+    'SA': 'South America',
+}
+
+# ISO 3166-1 alpha-2 code, name, continent code
+COUNTRY_TABLE = """
+DZ|Algeria|AF
+AO|Angola|AF
+BJ|Benin|AF
+BW|Botswana|AF
+BF|Burkina Faso|AF
+BI|Burundi|AF
+CV|Cape Verde|AF
+CM|Cameroon|AF
+CF|Central African Republic|AF
+TD|Chad|AF
+KM|Comoros|AF
+CD|Democratic Republic of the Congo|AF
+CG|Republic of the Congo|AF
+CI|Ivory Coast|AF
+DJ|Djibouti|AF
+EG|Egypt|AF
+GQ|Equatorial Guinea|AF
+ER|Eritrea|AF
+SZ|Eswatini|AF
+ET|Ethiopia|AF
+GA|Gabon|AF
+GM|Gambia|AF
+GH|Ghana|AF
+GN|Guinea|AF
+GW|Guinea-Bissau|AF
+KE|Kenya|AF
+LS|Lesotho|AF
+LR|Liberia|AF
+LY|Libya|AF
+MG|Madagascar|AF
+MW|Malawi|AF
+ML|Mali|AF
+MR|Mauritania|AF
+MU|Mauritius|AF
+MA|Morocco|AF
+MZ|Mozambique|AF
+NA|Namibia|AF
+NE|Niger|AF
+NG|Nigeria|AF
+RE|Reunion|AF
+RW|Rwanda|AF
+ST|Sao Tome and Principe|AF
+SN|Senegal|AF
+SC|Seychelles|AF
+SL|Sierra Leone|AF
+SO|Somalia|AF
+ZA|South Africa|AF
+SS|South Sudan|AF
+SD|Sudan|AF
+TZ|Tanzania|AF
+TG|Togo|AF
+TN|Tunisia|AF
+UG|Uganda|AF
+ZM|Zambia|AF
+ZW|Zimbabwe|AF
+AF|Afghanistan|AS
+AM|Armenia|AS
+AZ|Azerbaijan|AS
+BH|Bahrain|AS
+BD|Bangladesh|AS
+BT|Bhutan|AS
+BN|Brunei|AS
+KH|Cambodia|AS
+CN|China|AS
+GE|Georgia|AS
+HK|Hong Kong|AS
+IN|India|AS
+ID|Indonesia|AS
+IR|Iran|AS
+IQ|Iraq|AS
+IL|Israel|AS
+JP|Japan|AS
+JO|Jordan|AS
+KZ|Kazakhstan|AS
+KW|Kuwait|AS
+KG|Kyrgyzstan|AS
+LA|Laos|AS
+LB|Lebanon|AS
+MO|Macau|AS
+MY|Malaysia|AS
+MV|Maldives|AS
+MN|Mongolia|AS
+MM|Myanmar|AS
+NP|Nepal|AS
+KP|North Korea|AS
+OM|Oman|AS
+PK|Pakistan|AS
+PS|Palestine|AS
+PH|Philippines|AS
+QA|Qatar|AS
+SA|Saudi Arabia|AS
+SG|Singapore|AS
+KR|South Korea|AS
+LK|Sri Lanka|AS
+SY|Syria|AS
+TW|Taiwan|AS
+TJ|Tajikistan|AS
+TH|Thailand|AS
+TL|Timor-Leste|AS
+TR|Turkey|AS
+TM|Turkmenistan|AS
+AE|United Arab Emirates|AS
+UZ|Uzbekistan|AS
+VN|Vietnam|AS
+YE|Yemen|AS
+AL|Albania|EU
+AD|Andorra|EU
+AT|Austria|EU
+BY|Belarus|EU
+BE|Belgium|EU
+BA|Bosnia and Herzegovina|EU
+BG|Bulgaria|EU
+HR|Croatia|EU
+CY|Cyprus|EU
+CZ|Czechia|EU
+DK|Denmark|EU
+EE|Estonia|EU
+FO|Faroe Islands|EU
+FI|Finland|EU
+FR|France|EU
+DE|Germany|EU
+GI|Gibraltar|EU
+GR|Greece|EU
+HU|Hungary|EU
+IS|Iceland|EU
+IE|Ireland|EU
+IT|Italy|EU
+XK|Kosovo|EU
+LV|Latvia|EU
+LI|Liechtenstein|EU
+LT|Lithuania|EU
+LU|Luxembourg|EU
+MT|Malta|EU
+MD|Moldova|EU
+MC|Monaco|EU
+ME|Montenegro|EU
+NL|Netherlands|EU
+MK|North Macedonia|EU
+NO|Norway|EU
+PL|Poland|EU
+PT|Portugal|EU
+RO|Romania|EU
+RU|Russia|EU
+SM|San Marino|EU
+RS|Serbia|EU
+SK|Slovakia|EU
+SI|Slovenia|EU
+ES|Spain|EU
+SE|Sweden|EU
+CH|Switzerland|EU
+UA|Ukraine|EU
+GB|United Kingdom|EU
+VA|Vatican City|EU
+AG|Antigua and Barbuda|NA
+BS|Bahamas|NA
+BB|Barbados|NA
+BZ|Belize|NA
+BM|Bermuda|NA
+CA|Canada|NA
+CR|Costa Rica|NA
+CU|Cuba|NA
+DM|Dominica|NA
+DO|Dominican Republic|NA
+SV|El Salvador|NA
+GL|Greenland|NA
+GD|Grenada|NA
+GP|Guadeloupe|NA
+GT|Guatemala|NA
+HT|Haiti|NA
+HN|Honduras|NA
+JM|Jamaica|NA
+MQ|Martinique|NA
+MX|Mexico|NA
+NI|Nicaragua|NA
+PA|Panama|NA
+PR|Puerto Rico|NA
+KN|Saint Kitts and Nevis|NA
+LC|Saint Lucia|NA
+VC|Saint Vincent and the Grenadines|NA
+TT|Trinidad and Tobago|NA
+US|United States|NA
+AS|American Samoa|OC
+AU|Australia|OC
+FJ|Fiji|OC
+PF|French Polynesia|OC
+GU|Guam|OC
+KI|Kiribati|OC
+MH|Marshall Islands|OC
+FM|Micronesia|OC
+NR|Nauru|OC
+NC|New Caledonia|OC
+NZ|New Zealand|OC
+PW|Palau|OC
+PG|Papua New Guinea|OC
+WS|Samoa|OC
+SB|Solomon Islands|OC
+TO|Tonga|OC
+TV|Tuvalu|OC
+VU|Vanuatu|OC
+AR|Argentina|SA
+BO|Bolivia|SA
+BR|Brazil|SA
+CL|Chile|SA
+CO|Colombia|SA
+EC|Ecuador|SA
+FK|Falkland Islands|SA
+GF|French Guiana|SA
+GY|Guyana|SA
+PY|Paraguay|SA
+PE|Peru|SA
+SR|Suriname|SA
+UY|Uruguay|SA
+VE|Venezuela|SA
+"""
+
+LEVELS = ('continent', 'country', 'region', 'city')
+
+PROMPT_TEMPLATES = {
+    'continent': "a street view photo from {name}",
+    'country': "a street view photo from {name}",
+    'region': "a street view photo from {name}, {country}",
+    'city': "a street view photo from {name}, {country}",
+}
+
+def continent_code(code):
+    """Label code of a continent; GeoNames continent codes clash with country codes (NA, SA...)"""
+    return f'continent:{code}'
+
+def countries():
+    """List of (code, name, continent code) from the bundled table"""
+    return [tuple(line.split('|')) for line in COUNTRY_TABLE.strip().splitlines()]
+
+class GeoLabels:
+    """
+    Flat, ordered label table
+
+    Attributes (parallel lists, one entry per label):
+        codes: Unique code ('continent:EU', 'FR', 'FR.11', 'FR.11.2988507')
+        names: Display name
+        levels: One of LEVELS
+        parents: Code of the parent label (None for continents)
+        countries: Country name the label lies in (None for continents)
+        prompts: Text prompt encoded for the label
+    """
+
+    def __init__(self, regions_path=None, cities_path=None, min_city_population=500000):
+        self.codes, self.names, self.levels, self.parents, self.countries, self.prompts = [], [], [], [], [], []
+        table = countries()
+        country_names = {code: name for code, name, _ in table}
+
+        for code, name in CONTINENTS.items():
+            self._add(continent_code(code), name, 'continent', None, None)
+        for continent in CONTINENTS:
+            for code, name, parent in table:
+                if parent == continent:
+                    self._add(code, name, 'country', continent_code(continent), name)
+
+        region_names = {}
+        if regions_path:
+            regions = sorted((row[0], row[1]) for row in read_table(regions_path, 2)
+                             if row[0].split('.')[0] in country_names)
+            for code, name in regions:
+                country = country_names[code.split('.')[0]]
+                region_names[code] = name
+                self._add(code, name, 'region', code.split('.')[0], country)
+
+        if cities_path:
+            # geoname table: 0 id, 1 name, 8 country code, 10 admin1 code, 14 population
+            cities = []
+            for row in read_table(cities_path, 15):
+                region = f'{row[8]}.{row[10]}'
+                if region in region_names and int(row[14] or 0) >= min_city_population:
+                    cities.append((region, row[1], row[0]))
+            for region, name, geoname_id in sorted(cities):
+                self._add(f'{region}.{geoname_id}', name, 'city', region, country_names[region.split('.')[0]])
+
+    def _add(self, code, name, level, parent, country):
+        self.codes.append(code)
+        self.names.append(name)
+        self.levels.append(level)
+        self.parents.append(parent)
+        self.countries.append(country)
+        self.prompts.append(PROMPT_TEMPLATES[level].format(name=name, country=country))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def signature(self):
+        """Short hash of every prompt; changes whenever the label set does"""
+        return hashlib.sha1('\n'.join(self.prompts).encode()).hexdigest()[:8]
@@ -1,60 +1,266 @@
 """
-Geo Prediction using StreetCLIP
+Geo Prediction
+Zero-shot country (and continent, region, city) prediction with CLIP
+
+Scores the image embedding against a precomputed label index (see
+geo_index): about 200 countries grouped by continent, plus regions and
+cities when GeoNames files are configured. Only the vision tower runs per
+request; label embeddings are encoded once and kept on disk.
+
+The image encoder is a backend: StreetCLIP (street-view fine-tuned
+ViT-L/14-336) or the smaller OpenCLIP ViT-B-32, which 'auto' falls back to
+when StreetCLIP cannot load. After falling back, StreetCLIP is retried
+periodically (with a growing interval while it keeps failing). The backend
+used is reported in each result; load and prediction errors by geo_info().
 """
+import threading
+import time
+
 import torch
-from PIL import Image
 
-_model = None
-_processor = None
-_device = None
+from app.utils.clip_embedding import REGISTRY_NAME as CLIP_REGISTRY_NAME
+from app.utils.clip_embedding import image_embeddings, load_clip_encoder, register_head, shared_encoder
+from app.utils.geo_index import build_index
+from app.utils.geo_labels import GeoLabels
+from app.utils.image_context import load_image_context
+from app.utils.micro_batcher import get_batcher, prepare_each, raise_if_error
+from app.utils.model_registry import registry
+from app.utils.quantization import quantize_model
 
-COUNTRIES = [
-    "United States", "United Kingdom", "Canada", "Australia", "Germany",
-    "France", "Italy", "Spain", "Japan", "China", "South Korea", "India",
-    "Brazil", "Mexico", "Russia", "Netherlands", "Sweden", "Norway",
-    "Poland", "Switzerland", "Portugal", "Greece", "Turkey", "Thailand",
-    "Indonesia", "Singapore", "South Africa", "Argentina", "New Zealand"
-]
+REGISTRY_NAME = 'geo'
 
-def get_model():
-    global _model, _processor, _device
-    if _model is None:
-        _device = "cuda" if torch.cuda.is_available() else "cpu"
+# Image encoders: (library, weights, input size the preprocessing resizes to)
+GEO_BACKENDS = {
+    'streetclip': ('transformers', 'geolocal/StreetCLIP', 336),
+    'open_clip': ('open_clip', ('ViT-B-32', 'laion2b_s34b_b79k'), 224),
+}
+# Tried in order when the backend is 'auto'
+AUTO_BACKENDS = ('streetclip', 'open_clip')
+
+# Seconds on the fallback before 'auto' retries the preferred backend; doubles after each failed retry
+FALLBACK_RETRY_SECONDS = 300
+FALLBACK_RETRY_MAX_SECONDS = 3600
+
+# Bump when the weights or scoring change; the backend and label set have their own tag (geo_tag)
+MODEL_VERSION = 'geo-2'
+
+# Change with configure_geo_backend() / configure_geo_labels()
+GEO_CONFIG = {'backend': 'auto'}
+_labels = GeoLabels()
+_config_lock = threading.Lock()
+
+# Load and prediction outcomes, for geo_info()
+_status = {'backend': None, 'load_errors': {}, 'failures': 0, 'last_error': None,
+           'retry_at': None, 'retry_interval': FALLBACK_RETRY_SECONDS}
+_status_lock = threading.Lock()
+
+def configure_geo_backend(backend):
+    """
+    Select 'auto' (StreetCLIP, falling back to OpenCLIP), 'streetclip' or 'open_clip'
+
+    The loaded backend is dropped so the next call loads the new one.
+    """
+    if backend != 'auto' and backend not in GEO_BACKENDS:
+        raise ValueError(f"Unknown geo backend: {backend}")
+    with _config_lock:
+        GEO_CONFIG['backend'] = backend
+    with _status_lock:
+        _status.update(retry_at=None, retry_interval=FALLBACK_RETRY_SECONDS)
+    registry.unload(REGISTRY_NAME)
+
+def configure_geo_labels(regions_path=None, cities_path=None, min_city_population=500000):
+    """
+    Add regions and cities from GeoNames files to the bundled continents and countries
+
+    Args:
+        regions_path: admin1CodesASCII.txt (first-level divisions)
+        cities_path: cities*.txt geoname table; needs regions_path
+        min_city_population: Smallest city to include
+
+    Loaded geo models are dropped; the new label index is encoded (once per
+    label set) on the next load.
+    """
+    global _labels
+    labels = GeoLabels(regions_path, cities_path, min_city_population)
+    with _config_lock:
+        _labels = labels
+    registry.unload(REGISTRY_NAME)
+    registry.unload(CLIP_REGISTRY_NAME)
+
+def preferred_backend():
+    """Backend results should come from; anything else is a fallback"""
+    if shared_encoder():
+        return f'shared-{shared_encoder()}'
+    backend = GEO_CONFIG['backend']
+    return AUTO_BACKENDS[0] if backend == 'auto' else backend
+
+def geo_tag():
+    """Suffix for cache versions; changes with the label set and the preferred backend"""
+    return f'-{preferred_backend()}-labels{_labels.signature()}'
+
+def _text_encoder(encoder):
+    return lambda prompts: encoder.encode_text(prompts).float().cpu().numpy()
+
+def _shared_index(encoder):
+    return build_index(f'shared-{encoder.name}', _text_encoder(encoder), _labels)
+
+register_head(REGISTRY_NAME, _shared_index)
+
+def _load_backend(name):
+    library, weights, input_size = GEO_BACKENDS[name]
+    encoder = load_clip_encoder(name, library, weights, input_size)
+    # Label embeddings are encoded in fp32, before any quantization
+    index = build_index(f'{library}/{weights}', _text_encoder(encoder), _labels)
+    encoder.model = quantize_model(encoder.model, encoder.device)
+    return encoder, index
+
+def _load_model():
+    backend = GEO_CONFIG['backend']
+    names = AUTO_BACKENDS if backend == 'auto' else (backend,)
+    errors = {}
+    for name in names:
         try:
-            from transformers import CLIPProcessor, CLIPModel
-            _model = CLIPModel.from_pretrained("geolocal/StreetCLIP")
-            _processor = CLIPProcessor.from_pretrained("geolocal/StreetCLIP")
-            _model.to(_device).eval()
-        except:
-            print("StreetCLIP not found or error, falling back to OpenCLIP ViT-B-32")
-            import open_clip
-            _model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='laion2b_s34b_b79k')
-            _processor = preprocess
-            _model.to(_device).eval()
-    return _model, _processor, _device
-
-def predict_country(image_path, top_k=5):
+            loaded = _load_backend(name)
+        except Exception as e:
+            print(f"Error loading geo backend '{name}': {e}")
+            errors[name] = str(e)
+            continue
+        with _status_lock:
+            _status.update(backend=name, load_errors=errors)
+            if errors:
+                interval = _status['retry_interval']
+                _status.update(retry_at=time.monotonic() + interval,
+                               retry_interval=min(interval * 2, FALLBACK_RETRY_MAX_SECONDS))
+            else:
+                _status.update(retry_at=None, retry_interval=FALLBACK_RETRY_SECONDS)
+        if errors:
+            print(f"Geo prediction is using the fallback backend '{name}'; "
+                  f"retrying '{names[0]}' in {interval}s")
+        return loaded
+    with _status_lock:
+        _status.update(backend=None, load_errors=errors)
+    raise RuntimeError(f"No geo backend could be loaded: {errors}")
+
+def _maybe_retry_preferred():
+    """Drop a fallback backend once its retry time has come, so the next load tries the preferred one"""
+    with _status_lock:
+        due = _status['retry_at'] is not None and time.monotonic() >= _status['retry_at']
+        if due:
+            _status['retry_at'] = None
+    if due:
+        print("Retrying the preferred geo backend...")
+        registry.unload(REGISTRY_NAME)
+
+def get_model():
+    """Load the geo backend; returns (ClipEncoder, GeoLabelIndex)"""
+    _maybe_retry_preferred()
+    return registry.get(REGISTRY_NAME, _load_model)
+
+def geo_info():
+    """Configured and active backend, load errors, fallback retry and prediction failures, for /metrics"""
+    with _status_lock:
+        status = dict(_status, load_errors=dict(_status['load_errors']))
+    retry_at = status.pop('retry_at')
+    status['retry_in_seconds'] = round(max(0.0, retry_at - time.monotonic()), 1) if retry_at is not None else None
+    if shared_encoder():
+        status['backend'] = preferred_backend()
+    status.update(configured=GEO_CONFIG['backend'], labels=len(_labels))
+    return status
+
+def predict_location_batch(images, top_k=5):
+    """
+    Hierarchical location predictions for several images in one forward pass
+
+    Args:
+        images: List of image paths or ImageContexts
+        top_k: Countries to return per image
+
+    Returns:
+        List of dictionaries (one per image) with 'continent', 'countries'
+        (top_k, best first), 'regions' and 'cities' (empty without those
+        labels) and the 'backend' that produced them; the exception instead
+        for images that could not be decoded
+    """
+    if shared_encoder():
+        # Score the embedding the attribute head shares instead of running a second vision tower
+        embeddings, encoder = image_embeddings(images)
+        locations, ready = prepare_each(embeddings, raise_if_error)
+        index, backend = encoder.head_state(REGISTRY_NAME), f'shared-{encoder.name}'
+        if ready:
+            image_features = torch.stack([features for _, features in ready])
+    else:
+        _maybe_retry_preferred()
+        with registry.use(REGISTRY_NAME, _load_model) as (encoder, index):
+            locations, ready = prepare_each(images, lambda image: encoder.preprocess_image(
+                load_image_context(image).pil_reduced(encoder.input_size)))
+            if ready:
+                image_features = encoder.encode_pixels(torch.stack([pixels for _, pixels in ready]))
+        backend = encoder.name
+
+    if ready:
+        refined = index.refine(image_features.float().cpu().numpy(), top_k=top_k, logit_scale=encoder.logit_scale)
+        for (i, _), location in zip(ready, refined):
+            location['backend'] = backend
+            locations[i] = location
+    return locations
+
+def predict_country_batch(images, top_k=5):
+    """Country predictions for several images in one forward pass; one list (or exception) per image"""
+    return [location if isinstance(location, Exception) else location['countries']
+            for location in predict_location_batch(images, top_k=top_k)]
+
+def _predict_batch(items):
+    """Micro-batcher entry point; items are (image, top_k)"""
+    max_k = max(top_k for _, top_k in items)
+    locations = predict_location_batch([image for image, _ in items], top_k=max_k)
+    return [location if isinstance(location, Exception) else dict(location, countries=location['countries'][:top_k])
+            for (_, top_k), location in zip(items, locations)]
+
+def _record_failure(error):
+    print(f"Error in geo prediction: {error}")
+    with _status_lock:
+        _status['failures'] += 1
+        _status['last_error'] = str(error)
+
+def predict_location(image, top_k=5, batched=False):
+    """Hierarchical prediction for one image (raises on failure)"""
+    if batched:
+        return get_batcher('geo', _predict_batch)((load_image_context(image), top_k))
+    return raise_if_error(predict_location_batch([image], top_k=top_k)[0])
+
+def predict_country(image, top_k=5, batched=False):
     try:
-        model, processor, device = get_model()
-        image = Image.open(image_path).convert('RGB')
-        
-        prompts = [f"a street view photo from {c}" for c in COUNTRIES]
-        inputs = processor(text=prompts, images=image, return_tensors="pt", padding=True)
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = outputs.logits_per_image.softmax(dim=1)
-        
-        values, indices = probs[0].topk(top_k)
-        return [{'country': COUNTRIES[indices[i].item()], 'confidence': float(values[i])} for i in range(top_k)]
-    except:
+        return predict_location(image, top_k=top_k, batched=batched)['countries']
+    except Exception as e:
+        _record_failure(e)
         return []
 
-def get_geo_prediction(image_path):
-    predictions = predict_country(image_path, top_k=5)
-    return {
+def get_geo_prediction(image, batched=False):
+    """
+    Geo prediction for the API
+
+    Returns:
+        Dictionary with the top 5 'predictions', 'top_country', 'continent',
+        'regions', 'cities', the 'backend' used and whether it was a
+        'fallback'. Failures are counted for geo_info() and re-raised, so
+        an empty prediction is never mistaken for a result.
+    """
+    try:
+        location = predict_location(image, top_k=5, batched=batched)
+    except Exception as e:
+        _record_failure(e)
+        raise
+
+    predictions = location.get('countries', [])
+    backend = location.get('backend')
+    result = {
         'predictions': predictions,
         'top_country': predictions[0] if predictions else None,
+        'continent': location.get('continent'),
+        'regions': location.get('regions', []),
+        'cities': location.get('cities', []),
+        'backend': backend,
+        'fallback': backend is not None and backend != preferred_backend(),
         'reasoning': 'Based on visual patterns' if predictions else ''
     }
+    return result
@@ -0,0 +1,95 @@
+"""
+Geocode Cache Module
+Persistent reverse-geocoding cache indexed by a lat/lon grid
+
+Coordinates are bucketed into grid cells of 10^-precision degrees. A lookup
+checks the cell and its eight neighbours and returns the nearest cached
+point, so photos taken a few metres apart share one reverse-geocode call.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+
+CACHE_PATH = os.path.join('cache', 'geocode.sqlite3')
+DEFAULT_PRECISION = 3  # ~110 m cells
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocode (
+    cell_lat INTEGER NOT NULL,
+    cell_lon INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (cell_lat, cell_lon, latitude, longitude)
+)
+"""
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 6371.0088 * 2 * math.asin(math.sqrt(a))
+
+class GeocodeCache:
+    """
+    Reverse-geocode results stored in SQLite, keyed by grid cell
+
+    Args:
+        path: SQLite file, or ':memory:' for a per-process cache
+        precision: Decimal places of the grid (3 = ~110 m, 2 = ~1.1 km)
+    """
+
+    def __init__(self, path=CACHE_PATH, precision=DEFAULT_PRECISION):
+        self.path = path
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def _cell(self, latitude, longitude):
+        scale = 10 ** self.precision
+        return int(math.floor(latitude * scale)), int(math.floor(longitude * scale))
+
+    def get(self, latitude, longitude):
+        """
+        Nearest cached result in the surrounding 3x3 cells
+
+        Returns:
+            Tuple of (hit, result); result may be None for a cached "no address"
+        """
+        cell_lat, cell_lon = self._cell(latitude, longitude)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT latitude, longitude, result FROM geocode "
+                "WHERE cell_lat BETWEEN ? AND ? AND cell_lon BETWEEN ? AND ?",
+                (cell_lat - 1, cell_lat + 1, cell_lon - 1, cell_lon + 1)
+            ).fetchall()
+            if not rows:
+                self._stats['misses'] += 1
+                return False, None
+            self._stats['hits'] += 1
+
+        nearest = min(rows, key=lambda row: haversine_km(latitude, longitude, row[0], row[1]))
+        return True, json.loads(nearest[2])
+
+    def put(self, latitude, longitude, result):
+        cell_lat, cell_lon = self._cell(latitude, longitude)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+                (cell_lat, cell_lon, latitude, longitude, json.dumps(result))
+            )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        stats['precision'] = self.precision
+        return stats
@@ -0,0 +1,210 @@
+"""
+HTTP Client Module
+Shared pooled session, bounded retries and TTL caching for external APIs
+"""
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
+import os
+import requests
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Base URLs; point them at a local stub server (see app/utils/api_stub.py) for tests
+BASE_URLS = {
+    'open_meteo': os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com'),
+    'timeapi': os.environ.get('TIMEAPI_URL', 'https://timeapi.io'),
+    'sunrise_sunset': os.environ.get('SUNRISE_SUNSET_URL', 'https://api.sunrise-sunset.org'),
+    'nominatim': os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org'),
+}
+
+REQUEST_TIMEOUT = 10
+POOL_SIZE = 32
+MAX_RETRIES = 2
+BACKOFF_FACTOR = 0.3
+BACKOFF_MAX = 2.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = 'image_insight_analyzer'
+
+# Seconds each endpoint's answers stay fresh
+CACHE_TTLS = {
+    'weather': 10 * 60,
+    'forecast': 60 * 60,
+    'timezone': 24 * 60 * 60,
+    'sun_times': 7 * 24 * 60 * 60,
+}
+COORD_PRECISION = 2  # ~1 km; plenty for weather, time zone and sun times
+
+_session = None
+_session_lock = threading.Lock()
+_async_sessions = {}
+
+def _retry_policy():
+    options = dict(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=False,
+    )
+    try:
+        return Retry(backoff_max=BACKOFF_MAX, **options)
+    except TypeError:
+        # urllib3 < 2 has no backoff_max argument; cap through the class default instead
+        retry = Retry(**options)
+        retry.DEFAULT_BACKOFF_MAX = BACKOFF_MAX
+        return retry
+
+def api_url(service, path):
+    return BASE_URLS[service].rstrip('/') + path
+
+def set_base_url(service, url):
+    """Redirect one service (e.g. to a stub server); cached answers are dropped"""
+    BASE_URLS[service] = url
+    api_cache.clear()
+
+def get_session():
+    """Process-wide keep-alive session with a connection pool per host"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE, max_retries=_retry_policy())
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            _session = session
+        return _session
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a per-entry TTL
+
+    Args:
+        max_entries: Capacity before the least recently used entry is evicted
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        """Returns (hit, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+api_cache = TTLCache()
+
+def round_coords(latitude, longitude, precision=COORD_PRECISION):
+    return round(float(latitude), precision), round(float(longitude), precision)
+
+def cache_key(endpoint, latitude, longitude, *extra):
+    """Cache key from the endpoint, rounded coordinates and e.g. the date"""
+    return (endpoint, *round_coords(latitude, longitude), *extra)
+
+def fetch_json(endpoint, url, params, key):
+    """
+    GET a JSON document through the shared session, cached for the endpoint's TTL
+
+    Args:
+        endpoint: Name in CACHE_TTLS (selects the TTL)
+        url: Request URL
+        params: Query parameters
+        key: Cache key (see cache_key), or None to bypass the cache
+
+    Returns:
+        Parsed JSON; raises requests exceptions on failure (failures are not cached)
+    """
+    if key is not None:
+        hit, data = api_cache.get(key)
+        if hit:
+            return data
+
+    response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    if key is not None:
+        api_cache.put(key, data, CACHE_TTLS[endpoint])
+    return data
+
+def get_async_session():
+    """aiohttp session for the running event loop (sessions cannot be shared across loops)"""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            headers={'User-Agent': USER_AGENT}
+        )
+        _async_sessions[loop] = session
+    return session
+
+async def _get_json_async(url, params):
+    # aiohttp rejects bool query values; send them the way requests does
+    params = {k: str(v) if isinstance(v, bool) else v for k, v in params.items()}
+    for attempt in range(MAX_RETRIES + 1):
+        retry = attempt < MAX_RETRIES
+        try:
+            async with get_async_session().get(url, params=params) as response:
+                if not (retry and response.status in RETRY_STATUSES):
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if not retry:
+                raise
+        await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_FACTOR * 2 ** attempt))
+
+async def fetch_json_async(endpoint, url, params, key):
+    """
+    Async fetch_json sharing the same TTL cache
+
+    Uses aiohttp when installed, so many lookups can wait on one event loop;
+    otherwise the blocking fetch runs in the loop's default thread pool.
+    """
+    if key is not None:
+        hit, data = api_cache.get(key)
+        if hit:
+            return data
+
+    if aiohttp is None:
+        data = await asyncio.to_thread(fetch_json, endpoint, url, params, None)
+    else:
+        data = await _get_json_async(url, params)
+    if key is not None:
+        api_cache.put(key, data, CACHE_TTLS[endpoint])
+    return data
@@ -0,0 +1,187 @@
+"""
+Image Context Module
+Decodes an uploaded image once and shares it across every analysis stage
+
+Stages that only need a small image (model preprocessors resize to 224-384
+px, the color heuristics need global ratios) can ask for a reduced decode:
+JPEGs are then decoded with DCT scaling straight to 1/2, 1/4 or 1/8 size,
+which is several times faster than a full decode and a resize.
+"""
+from PIL import Image, ImageOps
+from PIL.ExifTags import TAGS
+import cv2
+import hashlib
+import io
+import numpy as np
+import threading
+
+# Reduced (DCT-scaled) decoding for stages that ask for it; see configure_decoding
+DRAFT_DECODE = True
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def configure_decoding(draft=True):
+    """Enable or disable reduced decoding process-wide"""
+    global DRAFT_DECODE
+    DRAFT_DECODE = bool(draft)
+
+def decode_tag():
+    """Suffix for cache versions of results computed from reduced decodes"""
+    return '-draft' if DRAFT_DECODE else ''
+
+class ImageContext:
+    """
+    Per-request image holder.
+
+    The file is read once; the PIL RGB image, the NumPy BGR/HSV arrays and
+    the parsed EXIF are decoded on first access and reused afterwards.
+    Each value is computed under its own lock, so stages asking for
+    different representations decode concurrently while stages asking for
+    the same one wait for a single computation.
+    """
+
+    def __init__(self, data, filename=None):
+        self.data = data
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._cache = {}
+
+    @classmethod
+    def from_path(cls, image_path):
+        with open(image_path, 'rb') as f:
+            return cls(f.read(), filename=image_path)
+
+    @classmethod
+    def from_bytes(cls, data, filename=None):
+        return cls(data, filename=filename)
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._cache:
+                    return self._cache[key]
+            value = compute()
+            with self._lock:
+                self._cache[key] = value
+                self._key_locks.pop(key, None)
+            return value
+
+    def derived(self, key, compute):
+        """Compute a value from this image once (e.g. color statistics) and share it"""
+        return self._cached(('derived', key), compute)
+
+    def discard_derived(self, key):
+        """Forget a derived value so the next derived() call computes it again"""
+        with self._lock:
+            self._cache.pop(('derived', key), None)
+
+    @property
+    def sha256(self):
+        """Hex digest of the raw file bytes, used as the content address"""
+        return self._cached('sha256', lambda: hashlib.sha256(self.data).hexdigest())
+
+    @property
+    def source(self):
+        """Opened (not yet decoded) PIL image, kept for its metadata"""
+        return self._cached('source', lambda: Image.open(io.BytesIO(self.data)))
+
+    @property
+    def pil(self):
+        """Decoded PIL image in RGB mode"""
+        # Decoded from its own file object: the shared source may be read for EXIF at the same time
+        return self._cached('pil', lambda: Image.open(io.BytesIO(self.data)).convert('RGB'))
+
+    @property
+    def bgr(self):
+        """
+        Decoded image as a NumPy uint8 array in OpenCV BGR order
+
+        The EXIF orientation is applied, as cv2.imread does, so detectors see
+        the photo upright.
+        """
+        return self._cached('bgr', lambda: cv2.cvtColor(
+            np.asarray(ImageOps.exif_transpose(self.pil)), cv2.COLOR_RGB2BGR))
+
+    @property
+    def hsv(self):
+        """Decoded image as a NumPy uint8 array in OpenCV HSV space"""
+        return self._cached('hsv', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV))
+
+    def pil_reduced(self, size):
+        """
+        RGB image decoded at the smallest JPEG scale with both sides >= size
+
+        Falls back to the full decode for other formats or when reduced
+        decoding is disabled.
+        """
+        if not DRAFT_DECODE or self.source.format != 'JPEG':
+            return self.pil
+        return self._cached(('pil_reduced', size), lambda: self._draft_pil(size))
+
+    def _draft_pil(self, size):
+        image = Image.open(io.BytesIO(self.data))
+        image.draft('RGB', (size, size))
+        return image.convert('RGB')
+
+    def bgr_reduced(self, size):
+        """
+        BGR array decoded at 1/2, 1/4 or 1/8 scale, keeping both sides >= size
+
+        Uses OpenCV's reduced decode modes (DCT scaling for JPEG). Unlike bgr,
+        the EXIF orientation is not applied: this is meant for statistics
+        that do not depend on it (e.g. color histograms).
+        """
+        if not DRAFT_DECODE:
+            return self.bgr
+        return self._cached(('bgr_reduced', size), lambda: self._reduced_bgr(size))
+
+    def _reduced_bgr(self, size):
+        shorter = min(self.source.size)
+        for factor, flag in _REDUCED_FLAGS:
+            if shorter // factor >= size:
+                buffer = np.frombuffer(self.data, dtype=np.uint8)
+                image = cv2.imdecode(buffer, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+                if image is not None:
+                    return image
+                break
+        return self.bgr
+
+    @property
+    def exif(self):
+        """EXIF tags keyed by their decoded names"""
+        return self._cached('exif', self._parse_exif)
+
+    def _parse_exif(self):
+        try:
+            exif_data = {}
+            getexif = getattr(self.source, '_getexif', None)
+            info = getexif() if getexif else None
+            if info:
+                for tag, value in info.items():
+                    decoded = TAGS.get(tag, tag)
+                    exif_data[decoded] = value
+            return exif_data
+
+        except Exception as e:
+            print(f"Error extracting EXIF data: {e}")
+            return {}
+
+
+def load_image_context(image):
+    """
+    Return an ImageContext for the given image
+
+    Args:
+        image: Path to the image file or an existing ImageContext
+
+    Returns:
+        ImageContext (the same object if one was passed in)
+    """
+    if isinstance(image, ImageContext):
+        return image
+    return ImageContext.from_path(image)
@@ -0,0 +1,46 @@
+"""
+Location Enrichment Module
+Runs the network lookups for a GPS fix together under one deadline
+
+Reverse geocoding, weather, time zone and sun times are independent, so
+they run concurrently on the shared event loop; the slowest one bounds the
+wait instead of their sum, and anything still pending at the deadline is
+dropped while the finished lookups are kept.
+"""
+from app.utils.async_runner import gather_with_deadline, run_sync
+from app.utils.exif_location import get_location_name_async
+from app.utils.time_api import get_sun_times_async, get_timezone_info_async
+from app.utils.weather_api import get_weather_async
+
+ENRICH_DEADLINE = 10.0
+
+async def enrich_location_async(location, date=None, deadline=ENRICH_DEADLINE, offline=None):
+    """
+    Look up place, weather, time zone and sun times for a location
+
+    Args:
+        location: Dictionary with 'latitude' and 'longitude' keys
+        date: Date string (YYYY-MM-DD) for the sun times, or None for today
+        deadline: Seconds for all lookups together
+        offline: Reverse-geocoding mode (see exif_location.get_location_name)
+
+    Returns:
+        Tuple of (results, report) keyed by 'place', 'weather', 'timezone'
+        and 'sun_times'; late or failed lookups are None
+    """
+    return await gather_with_deadline({
+        'place': get_location_name_async(location['latitude'], location['longitude'], offline=offline),
+        'weather': get_weather_async(location),
+        'timezone': get_timezone_info_async(location),
+        'sun_times': get_sun_times_async(location, date),
+    }, deadline)
+
+def enrich_location(location, date=None, deadline=ENRICH_DEADLINE, offline=None):
+    """
+    Blocking enrich_location_async for sync callers
+
+    The lookups run on the background event loop; the caller's thread only
+    waits for the group, not for each request in turn.
+    """
+    # The group enforces the deadline itself; the margin only covers scheduling
+    return run_sync(enrich_location_async(location, date, deadline, offline), timeout=deadline + 1)
@@ -0,0 +1,180 @@
+"""
+Micro-Batching Module
+Collects concurrent inference requests into batched forward passes
+"""
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+# Per-model defaults; override with configure_batching()
+BATCH_CONFIG = {
+    'caption': {'max_batch_size': 8, 'max_wait_ms': 20},
+    'objects': {'max_batch_size': 16, 'max_wait_ms': 10},
+    'attributes': {'max_batch_size': 16, 'max_wait_ms': 10},
+    'geo': {'max_batch_size': 16, 'max_wait_ms': 10},
+}
+DEFAULT_CONFIG = {'max_batch_size': 8, 'max_wait_ms': 10}
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+class MicroBatcher:
+    """
+    Runs batch_fn on up to max_batch_size items gathered within max_wait_ms
+
+    batch_fn receives a list of items and must return a list of results in
+    the same order; a result that is an exception fails only that item's
+    caller (see prepare_each). Each caller gets its own result, or the
+    batch's error if batch_fn itself raises, through a Future.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_ms=10):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        # errors counts failed items (whether alone or with their whole batch); batch_errors failed batches
+        self._stats = {'batches': 0, 'items': 0, 'errors': 0, 'batch_errors': 0, 'max_queue_depth': 0,
+                       'last_batch_size': 0, 'busy_seconds': 0.0}
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        future = Future()
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f'batcher-{self.name}', daemon=True)
+                self._worker.start()
+            self._queue.put((item, future))
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def configure(self, max_batch_size=None, max_wait_ms=None):
+        if max_batch_size is not None:
+            self.max_batch_size = max(1, int(max_batch_size))
+        if max_wait_ms is not None:
+            self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait_ms
+        return stats
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            started = time.monotonic()
+            failed = 0
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(items)} items")
+                for (_, future), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                        failed += 1
+                    else:
+                        future.set_result(result)
+            except Exception as e:
+                print(f"Batch error in {self.name}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                failed = len(items)
+                with self._lock:
+                    self._stats['batch_errors'] += 1
+            with self._lock:
+                self._stats['errors'] += failed
+                self._stats['batches'] += 1
+                self._stats['items'] += len(items)
+                self._stats['last_batch_size'] = len(items)
+                self._stats['busy_seconds'] = round(self._stats['busy_seconds'] + time.monotonic() - started, 3)
+
+def get_batcher(name, batch_fn):
+    """Return the shared batcher for a model, creating it from BATCH_CONFIG"""
+    with _batchers_lock:
+        if name not in _batchers:
+            config = BATCH_CONFIG.get(name, DEFAULT_CONFIG)
+            _batchers[name] = MicroBatcher(name, batch_fn, **config)
+        return _batchers[name]
+
+def configure_batching(name, max_batch_size=None, max_wait_ms=None):
+    """Change a model's batch size / wait window, now and for batchers created later"""
+    with _batchers_lock:
+        config = dict(BATCH_CONFIG.get(name, DEFAULT_CONFIG))
+        if max_batch_size is not None:
+            config['max_batch_size'] = max_batch_size
+        if max_wait_ms is not None:
+            config['max_wait_ms'] = max_wait_ms
+        BATCH_CONFIG[name] = config
+        if name in _batchers:
+            _batchers[name].configure(max_batch_size, max_wait_ms)
+
+def batcher_metrics():
+    """Queue depth and batch statistics for every batcher created so far"""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {b.name: b.metrics() for b in batchers}
+
+def group_by(items, key):
+    """
+    Split a batch into runs sharing the same key (e.g. generation settings)
+
+    Returns:
+        Dict mapping key to a list of (original_index, item)
+    """
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(key(item), []).append((i, item))
+    return groups
+
+def prepare_each(items, prepare):
+    """
+    Decode/preprocess every item of a batch separately, so one bad image
+    fails only itself
+
+    Args:
+        items: Batch items
+        prepare: Function of one item returning the model input for it
+
+    Returns:
+        Tuple of (results, ready): results has one slot per item holding the
+        exception for items that failed and None for the rest; ready lists
+        (index, prepared input) of the items to run the model on
+    """
+    results, ready = [None] * len(items), []
+    for i, item in enumerate(items):
+        try:
+            ready.append((i, prepare(item)))
+        except Exception as e:
+            print(f"Error preparing batch item {i}: {e}")
+            results[i] = e
+    return results, ready
+
+def raise_if_error(result):
+    """Return a batch function's per-item result, raising it if it is an exception"""
+    if isinstance(result, Exception):
+        raise result
+    return result
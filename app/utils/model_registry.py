@@ -0,0 +1,257 @@
+"""
+Model Registry Module
+Thread-safe loading, reference counting and memory budgeting for all models
+"""
+from contextlib import contextmanager
+import gc
+import threading
+import time
+
+class _Entry:
+    __slots__ = ('loader', 'value', 'refcount', 'size_bytes', 'load_seconds', 'last_used', 'loads', 'lock', 'stale')
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.value = None
+        self.refcount = 0
+        self.size_bytes = 0
+        self.load_seconds = None
+        self.last_used = 0.0
+        self.loads = 0
+        self.lock = threading.Lock()
+        # Set when unload() is asked for while the model is in use or loading
+        self.stale = False
+
+def estimate_size(value):
+    """
+    Approximate resident bytes of a loaded model bundle
+
+    Walks tuples/lists/dicts and counts parameters and buffers of torch modules
+    (including wrappers such as ultralytics YOLO that hold one in .model) and
+    standalone tensors. Dynamically quantized Linear layers keep their int8
+    weights in packed params rather than parameters; those are counted too.
+    """
+    try:
+        import torch
+    except ImportError:
+        return 0
+
+    seen = set()
+
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        if isinstance(obj, torch.nn.Module):
+            tensors = list(obj.parameters()) + list(obj.buffers())
+            for module in obj.modules():
+                if hasattr(module, '_packed_params') and callable(getattr(module, 'weight', None)):
+                    tensors.append(module.weight())
+                    bias = module.bias()
+                    if bias is not None:
+                        tensors.append(bias)
+            return sum(t.numel() * t.element_size() for t in tensors)
+        if isinstance(obj, torch.Tensor):
+            return obj.numel() * obj.element_size()
+        if isinstance(obj, (tuple, list)):
+            return sum(size(item) for item in obj)
+        if isinstance(obj, dict):
+            return sum(size(item) for item in obj.values())
+        inner = getattr(obj, 'model', None)
+        if isinstance(inner, torch.nn.Module):
+            return size(inner)
+        return 0
+
+    return size(value)
+
+class ModelRegistry:
+    """
+    Central owner of loaded models
+
+    Each model is loaded at most once even under concurrent first requests.
+    Callers that hold a model through use() pin it; when the total footprint
+    exceeds the memory budget, the least recently used unpinned models are
+    unloaded and reloaded on next use. Unloading a model that is in use
+    (e.g. after a configuration change) marks it stale instead: the next
+    caller gets a freshly loaded model, and the old one is dropped once its
+    last user releases it.
+
+    Args:
+        memory_budget_mb: Soft limit for all loaded models, or None for no limit
+    """
+
+    def __init__(self, memory_budget_mb=None):
+        self.memory_budget_mb = memory_budget_mb
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name, loader):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._entries[name] = _Entry(loader)
+            return entry
+
+    def _load(self, name, entry, pin):
+        while True:
+            with entry.lock:
+                if entry.value is None or entry.stale:
+                    with self._lock:
+                        # This load picks up the current configuration
+                        entry.stale = False
+                    print(f"Loading model '{name}'...")
+                    started = time.monotonic()
+                    value = entry.loader()
+                    entry.load_seconds = round(time.monotonic() - started, 2)
+                    entry.size_bytes = estimate_size(value)
+                    entry.loads += 1
+                    with self._lock:
+                        entry.value = value
+                    print(f"Model '{name}' loaded in {entry.load_seconds}s "
+                          f"({entry.size_bytes / 2**20:.0f} MB)")
+                with self._lock:
+                    value = entry.value
+                    if value is None or entry.stale:
+                        # Unloaded or invalidated between the check and here; load again
+                        continue
+                    entry.last_used = time.monotonic()
+                    if pin:
+                        entry.refcount += 1
+            self._enforce_budget(keep=name)
+            return value
+
+    def loaded(self, name):
+        """The model if it is loaded and current, else None (never loads it)"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.stale:
+                return None
+            return entry.value
+
+    def get(self, name, loader):
+        """Return the loaded model, loading it first if needed (does not pin it)"""
+        return self._load(name, self._entry(name, loader), pin=False)
+
+    @contextmanager
+    def use(self, name, loader):
+        """Pin the model for the duration of the block so it cannot be unloaded"""
+        entry = self._entry(name, loader)
+        value = self._load(name, entry, pin=True)
+        try:
+            yield value
+        finally:
+            with self._lock:
+                entry.refcount -= 1
+                entry.last_used = time.monotonic()
+                drop = entry.stale and entry.refcount == 0
+            if drop:
+                self.unload(name)
+
+    def unload(self, name):
+        """
+        Drop a model if nothing is using it
+
+        A model that is pinned or still loading is marked stale instead, so
+        it is reloaded on next use and dropped when its last user is done.
+
+        Returns:
+            True if it was unloaded now
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return False
+            if entry.value is None:
+                if entry.lock.locked():
+                    entry.stale = True
+                return False
+            if entry.refcount > 0:
+                if not entry.stale:
+                    print(f"Model '{name}' is in use; it will be reloaded on next use")
+                entry.stale = True
+                return False
+            entry.value = None
+            entry.stale = False
+            freed = entry.size_bytes
+        print(f"Unloaded model '{name}' ({freed / 2**20:.0f} MB)")
+        self._release_memory()
+        return True
+
+    def _unload_if_idle(self, name):
+        """
+        Drop a model only if nothing is using or loading it, checked and
+        done in one step; unlike unload() a pinned model is left alone
+        rather than marked stale, since reloading it would not free memory
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.value is None or entry.refcount > 0 or entry.lock.locked():
+                return False
+            entry.value = None
+            entry.stale = False
+            freed = entry.size_bytes
+        print(f"Unloaded model '{name}' ({freed / 2**20:.0f} MB)")
+        self._release_memory()
+        return True
+
+    def unload_idle(self, max_idle_seconds):
+        """Unload every unpinned model unused for longer than max_idle_seconds"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [name for name, e in self._entries.items()
+                    if e.value is not None and e.refcount == 0 and now - e.last_used > max_idle_seconds]
+        return [name for name in idle if self._unload_if_idle(name)]
+
+    def set_memory_budget(self, memory_budget_mb):
+        self.memory_budget_mb = memory_budget_mb
+        self._enforce_budget()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(e.size_bytes for e in self._entries.values() if e.value is not None)
+
+    def _enforce_budget(self, keep=None):
+        if self.memory_budget_mb is None:
+            return
+        budget = self.memory_budget_mb * 2**20
+        while self.total_bytes() > budget:
+            with self._lock:
+                candidates = sorted(
+                    (e.last_used, name) for name, e in self._entries.items()
+                    if name != keep and e.value is not None and e.refcount == 0
+                )
+            # A candidate pinned since the snapshot is skipped, not marked stale
+            if not any(self._unload_if_idle(name) for _, name in candidates):
+                print(f"Model memory {self.total_bytes() / 2**20:.0f} MB exceeds budget "
+                      f"{self.memory_budget_mb} MB but every other model is in use")
+                return
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def stats(self):
+        """Load state, footprint and usage of every registered model"""
+        with self._lock:
+            models = {
+                name: {
+                    'loaded': e.value is not None,
+                    'in_use': e.refcount,
+                    'stale': e.stale,
+                    'size_mb': round(e.size_bytes / 2**20, 1),
+                    'load_seconds': e.load_seconds,
+                    'loads': e.loads,
+                }
+                for name, e in self._entries.items()
+            }
+        return {'models': models, 'total_mb': round(self.total_bytes() / 2**20, 1),
+                'memory_budget_mb': self.memory_budget_mb}
+
+# Shared by every model module
+registry = ModelRegistry()
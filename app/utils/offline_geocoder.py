@@ -0,0 +1,271 @@
+"""
+Offline Reverse Geocoder
+Nearest-city lookup against a local GeoNames-style gazetteer
+
+The gazetteer (e.g. GeoNames cities1000.txt) is turned once into a static
+KD-tree stored as plain .npy arrays. Cities are mapped to 3D unit vectors so
+euclidean nearest neighbour equals great-circle nearest neighbour. The tree
+is implicit: each subrange [lo, hi) keeps its median at (lo + hi) // 2, so
+the index is just reordered arrays that every worker process can
+memory-map and share.
+"""
+import json
+import math
+import os
+import shutil
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 32
+INDEX_VERSION = 1
+
+# GeoNames "geoname" table columns
+_COL_NAME, _COL_LAT, _COL_LON, _COL_COUNTRY, _COL_ADMIN1 = 1, 4, 5, 8, 10
+
+def to_unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def read_table(path, min_columns):
+    """Rows of a tab-separated GeoNames file with at least min_columns fields, skipping comments"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            row = line.rstrip('\n').split('\t')
+            if len(row) >= min_columns:
+                yield row
+
+def load_gazetteer(gazetteer_path, admin1_path=None, country_info_path=None):
+    """
+    Read a GeoNames-style cities table
+
+    Args:
+        gazetteer_path: Tab-separated geoname table (cities1000.txt etc.)
+        admin1_path: Optional admin1CodesASCII.txt for state names
+        country_info_path: Optional countryInfo.txt for country names
+
+    Returns:
+        Tuple of (latitudes, longitudes, cities, states, countries, country_codes)
+    """
+    admin1 = {row[0]: row[1] for row in read_table(admin1_path, 2)} if admin1_path else {}
+    countries = {row[0]: row[4] for row in read_table(country_info_path, 5)} if country_info_path else {}
+
+    lats, lons, cities, states, country_names, codes = [], [], [], [], [], []
+    for row in read_table(gazetteer_path, _COL_ADMIN1 + 1):
+        try:
+            lat, lon = float(row[_COL_LAT]), float(row[_COL_LON])
+        except ValueError:
+            continue
+        code = row[_COL_COUNTRY]
+        lats.append(lat)
+        lons.append(lon)
+        cities.append(row[_COL_NAME])
+        states.append(admin1.get(f"{code}.{row[_COL_ADMIN1]}", row[_COL_ADMIN1]))
+        country_names.append(countries.get(code, code))
+        codes.append(code)
+    return lats, lons, cities, states, country_names, codes
+
+def build_kdtree(points):
+    """
+    Reorder points into an implicit KD-tree
+
+    Returns:
+        Tuple of (order, axes): order permutes the input into tree order and
+        axes[mid] is the split dimension of the node stored at mid
+    """
+    n = len(points)
+    order = np.arange(n)
+    axes = np.zeros(n, dtype=np.int8)
+    stack = [(0, n)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo <= LEAF_SIZE:
+            continue
+        idx = order[lo:hi]
+        pts = points[idx]
+        axis = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        mid = (lo + hi) // 2
+        order[lo:hi] = idx[np.argpartition(pts[:, axis], mid - lo)]
+        axes[mid] = axis
+        stack.append((lo, mid))
+        stack.append((mid + 1, hi))
+    return order, axes
+
+def _source_signature(*paths):
+    return [[os.path.abspath(p), os.path.getsize(p), int(os.path.getmtime(p))] for p in paths if p]
+
+def build_index(gazetteer_path, index_dir, admin1_path=None, country_info_path=None):
+    """Parse the gazetteer, build the KD-tree and write it to index_dir as .npy files"""
+    lats, lons, cities, states, countries, codes = load_gazetteer(gazetteer_path, admin1_path, country_info_path)
+    if not lats:
+        raise ValueError(f"No places found in {gazetteer_path}")
+
+    points = to_unit_vectors(lats, lons)
+    order, axes = build_kdtree(points)
+
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'points.npy'), points[order])
+    np.save(os.path.join(tmp_dir, 'axes.npy'), axes)
+    for name, values in (('cities', cities), ('states', states), ('countries', countries), ('codes', codes)):
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(values, dtype=str)[order])
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': INDEX_VERSION,
+            'count': len(lats),
+            'sources': _source_signature(gazetteer_path, admin1_path, country_info_path)
+        }, f)
+
+    # Move the live index aside instead of deleting it first: readers that
+    # have it memory-mapped keep working, and a concurrent build always
+    # leaves one complete copy in place
+    old_dir = f"{index_dir}.old-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.replace(index_dir, old_dir)
+    except OSError:
+        # No index yet, or another worker just moved it aside
+        old_dir = None
+    try:
+        os.replace(tmp_dir, index_dir)
+    except OSError:
+        # Another worker installed its copy first; use it
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir:
+        # Files still mapped elsewhere may refuse removal (Windows); the next build retries
+        shutil.rmtree(old_dir, ignore_errors=True)
+    _remove_old_copies(index_dir)
+    return index_dir
+
+def _remove_old_copies(index_dir):
+    """Delete copies a previous build moved aside but could not remove"""
+    parent, base = os.path.split(os.path.abspath(index_dir))
+    for name in os.listdir(parent):
+        if name.startswith(f"{base}.old-"):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+def index_is_current(index_dir, gazetteer_path, admin1_path=None, country_info_path=None):
+    try:
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (meta.get('version') == INDEX_VERSION
+            and meta.get('sources') == _source_signature(gazetteer_path, admin1_path, country_info_path))
+
+class OfflineGeocoder:
+    """
+    Memory-mapped nearest-place lookup
+
+    Args:
+        index_dir: Directory written by build_index
+    """
+
+    def __init__(self, index_dir):
+        def load(name):
+            # Plain ndarray views over the shared mapping avoid np.memmap's slicing overhead
+            return np.asarray(np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r'))
+
+        self.points = load('points')
+        self.axes = load('axes')
+        self.cities = load('cities')
+        self.states = load('states')
+        self.countries = load('countries')
+        self.codes = load('codes')
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, latitude, longitude):
+        """
+        Index (in tree order) and great-circle distance of the nearest place
+
+        Returns:
+            Tuple of (index, distance_km)
+        """
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        qx, qy, qz = math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+        q = np.array((qx, qy, qz))
+        points, axes = self.points, self.axes
+        best_d, best_i = math.inf, -1
+        stack = [(0, len(points), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if bound >= best_d:
+                continue
+            if hi - lo <= LEAF_SIZE:
+                d = ((points[lo:hi] - q) ** 2).sum(axis=1)
+                i = int(np.argmin(d))
+                if d[i] < best_d:
+                    best_d, best_i = float(d[i]), lo + i
+                continue
+
+            mid = (lo + hi) // 2
+            px, py, pz = points[mid].tolist()
+            d = (px - qx) ** 2 + (py - qy) ** 2 + (pz - qz) ** 2
+            if d < best_d:
+                best_d, best_i = d, mid
+            axis = int(axes[mid])
+            diff = (qx, qy, qz)[axis] - (px, py, pz)[axis]
+            below, above = (lo, mid), (mid + 1, hi)
+            near, far = (below, above) if diff < 0 else (above, below)
+            stack.append((far[0], far[1], diff * diff))
+            stack.append((near[0], near[1], 0.0))
+
+        return best_i, chord_to_km(math.sqrt(best_d))
+
+    def lookup(self, latitude, longitude):
+        """
+        Reverse-geocode to the nearest gazetteer place
+
+        Returns:
+            Dictionary shaped like exif_location.get_location_name's result
+        """
+        i, distance_km = self.nearest(latitude, longitude)
+        city, state, country = str(self.cities[i]), str(self.states[i]), str(self.countries[i])
+        return {
+            'full_address': ', '.join(part for part in (city, state, country) if part),
+            'city': city or None,
+            'country': country or None,
+            'state': state or None,
+            'postal_code': None,
+            'country_code': str(self.codes[i]) or None,
+            'distance_km': round(distance_km, 3),
+            'source': 'offline'
+        }
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def load_offline_geocoder(gazetteer_path, index_dir=None, admin1_path=None, country_info_path=None):
+    """
+    Build the index if it is missing or stale, then memory-map it (once per process)
+
+    Args:
+        gazetteer_path: GeoNames-style cities table
+        index_dir: Where to keep the index (defaults to <gazetteer>.index)
+        admin1_path, country_info_path: Optional name tables (see load_gazetteer)
+
+    Returns:
+        OfflineGeocoder
+    """
+    global _geocoder
+    index_dir = index_dir or f"{gazetteer_path}.index"
+    with _geocoder_lock:
+        if not index_is_current(index_dir, gazetteer_path, admin1_path, country_info_path):
+            print(f"Building offline geocoder index from {gazetteer_path}...")
+            build_index(gazetteer_path, index_dir, admin1_path, country_info_path)
+        _geocoder = OfflineGeocoder(index_dir)
+        print(f"Offline geocoder ready ({len(_geocoder)} places)")
+        return _geocoder
+
+def get_offline_geocoder():
+    """The geocoder loaded by load_offline_geocoder, or None if offline mode is off"""
+    return _geocoder
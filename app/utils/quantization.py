@@ -0,0 +1,82 @@
+"""
+Quantization Module
+Optional int8 inference for the transformer models on CPU
+
+In int8 mode the nn.Linear layers of BLIP, the OpenCLIP attribute model and
+StreetCLIP are dynamically quantized when they load: weights are stored as
+int8 (about a quarter of the fp32 size) and activations are quantized on the
+fly, so no calibration data is needed. Dynamic quantization only runs on
+CPU; on a CUDA device the models stay in fp32.
+"""
+import threading
+
+import torch
+
+from app.utils.model_registry import registry
+
+QUANTIZATION_MODES = (None, 'int8')
+
+# Models whose Linear layers are quantized in int8 mode (registry names)
+QUANTIZED_MODELS = ('caption', 'attributes', 'geo', 'clip')
+
+# Change with configure_quantization()
+QUANTIZATION_CONFIG = {'mode': None}
+_config_lock = threading.Lock()
+
+def configure_quantization(mode):
+    """
+    Select fp32 (None) or int8 inference for the transformer models
+
+    Loaded models are dropped so the next call loads them in the new mode.
+    """
+    if mode == 'none':
+        mode = None
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    with _config_lock:
+        changed = QUANTIZATION_CONFIG['mode'] != mode
+        QUANTIZATION_CONFIG['mode'] = mode
+    if changed:
+        for name in QUANTIZED_MODELS:
+            registry.unload(name)
+
+def quantization_mode(device=None):
+    """Mode models load in on a device (defaults to the device the models pick)"""
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if str(device).startswith('cuda'):
+        return None
+    return QUANTIZATION_CONFIG['mode']
+
+def quantization_tag():
+    """Suffix for cache versions; results of int8 models are cached separately"""
+    mode = quantization_mode()
+    return f'-{mode}' if mode else ''
+
+def quantize_model(model, device):
+    """
+    Quantize a loaded model's Linear layers if int8 mode is on
+
+    Args:
+        model: torch.nn.Module in eval mode
+        device: Device the model runs on
+
+    Returns:
+        The model, quantized in place (so the fp32 weights are freed) or unchanged
+    """
+    if quantization_mode(device) != 'int8':
+        return model
+    try:
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    except Exception as e:
+        print(f"Error quantizing model, keeping fp32: {e}")
+        return model
+
+def quantization_info():
+    """Summary for /metrics"""
+    return {
+        'mode': QUANTIZATION_CONFIG['mode'],
+        'active': quantization_mode(),
+        'engine': torch.backends.quantized.engine,
+        'models': list(QUANTIZED_MODELS),
+    }
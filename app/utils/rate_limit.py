@@ -0,0 +1,44 @@
+"""
+Rate Limit Module
+Process-wide limiters for external APIs with request-rate policies
+"""
+import threading
+import time
+
+class RateLimiter:
+    """
+    Spaces calls at least min_interval seconds apart across all threads
+
+    Args:
+        min_interval: Minimum seconds between two calls (1.0 for Nominatim)
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Claim the next slot and return how many seconds to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed)
+            self._next_allowed = slot + self.min_interval
+            return slot - now
+
+    def wait(self):
+        """Block until this caller may make its request"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name, min_interval):
+    """Shared limiter per external service"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(min_interval)
+        return _limiters[name]
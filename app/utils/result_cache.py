@@ -0,0 +1,188 @@
+"""
+Result Cache Module
+Content-addressed cache of per-stage analysis results
+
+Entries are keyed by (image hash, stage, stage version), so bumping one
+model's version only invalidates that model's stage. The disk tier is
+trimmed periodically: files older than the maximum age go first (entries of
+retired stage versions are never read again, so they age out), then the
+least recently used until the tier fits its size limit.
+"""
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = os.path.join('cache', 'results')
+MAX_MEMORY_ENTRIES = 2048
+MAX_DISK_BYTES = 512 * 1024 * 1024
+MAX_DISK_AGE_SECONDS = 30 * 24 * 60 * 60
+CLEANUP_INTERVAL_SECONDS = 600
+# Temporary files older than this were left by an interrupted write
+STALE_TMP_SECONDS = 3600
+
+class ResultCache:
+    """
+    Two-tier cache: an in-process LRU in front of JSON files on disk
+
+    Args:
+        cache_dir: Directory for the persistent tier, or None for memory only
+        max_entries: Capacity of the in-process LRU tier
+        max_disk_bytes: Size limit of the persistent tier (None = unlimited)
+        max_age_seconds: Age after which unused disk entries are removed (None = never)
+        cleanup_interval: Minimum seconds between disk cleanups
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_MEMORY_ENTRIES, max_disk_bytes=MAX_DISK_BYTES,
+                 max_age_seconds=MAX_DISK_AGE_SECONDS, cleanup_interval=CLEANUP_INTERVAL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self.cleanup_interval = cleanup_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_cleanup = 0.0
+        self._evicted = 0
+
+    def _path(self, image_hash, stage, version):
+        safe_version = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(version))
+        return os.path.join(self.cache_dir, stage, safe_version, image_hash[:2], f'{image_hash}.json')
+
+    def _count(self, stage, outcome):
+        stats = self._stats.setdefault(stage, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        stats[outcome] += 1
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, image_hash, stage, version):
+        """
+        Look up a stage result
+
+        Returns:
+            Tuple of (hit, value)
+        """
+        key = (image_hash, stage, version)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._count(stage, 'memory_hits')
+                return True, self._memory[key]
+
+        if self.cache_dir:
+            path = self._path(image_hash, stage, version)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                # Refresh the modification time so cleanup evicts least recently used first
+                os.utime(path)
+                with self._lock:
+                    self._remember(key, value)
+                    self._count(stage, 'disk_hits')
+                return True, value
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error reading result cache: {e}")
+
+        with self._lock:
+            self._count(stage, 'misses')
+        return False, None
+
+    def put(self, image_hash, stage, version, value):
+        """Store a JSON-serializable stage result in both tiers"""
+        key = (image_hash, stage, version)
+        with self._lock:
+            self._remember(key, value)
+
+        if self.cache_dir:
+            path = self._path(image_hash, stage, version)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error writing result cache: {e}")
+            self.maybe_cleanup()
+
+    def cleanup_disk(self):
+        """
+        Remove disk entries older than max_age_seconds, then the least
+        recently used ones until the tier is under max_disk_bytes
+
+        Returns:
+            Number of files removed
+        """
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return 0
+
+        files = []
+        stale_tmp = time.time() - STALE_TMP_SECONDS
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    # Only finished entries count; a recent .tmp file is a put() still writing
+                    if not name.endswith('.json'):
+                        if name.endswith('.tmp') and stat.st_mtime < stale_tmp:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        cutoff = time.time() - self.max_age_seconds if self.max_age_seconds is not None else None
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = self.max_disk_bytes is not None and total > self.max_disk_bytes
+            if not too_old and not too_big:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                print(f"Error removing result cache entry {path}: {e}")
+        with self._lock:
+            self._evicted += removed
+        return removed
+
+    def maybe_cleanup(self):
+        """Run cleanup_disk at most once per cleanup_interval; returns files removed"""
+        with self._lock:
+            now = time.time()
+            if now - self._last_cleanup < self.cleanup_interval:
+                return 0
+            self._last_cleanup = now
+        removed = self.cleanup_disk()
+        if removed:
+            print(f"Removed {removed} result cache entries")
+        return removed
+
+    def stats(self):
+        """Hit/miss counts per stage plus the current LRU size"""
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._stats.items()}
+            size = len(self._memory)
+            evicted = self._evicted
+        for counts in stages.values():
+            lookups = counts['memory_hits'] + counts['disk_hits'] + counts['misses']
+            counts['hit_rate'] = round((lookups - counts['misses']) / lookups, 3) if lookups else 0
+        return {'stages': stages, 'memory_entries': size, 'max_memory_entries': self.max_entries,
+                'disk_evictions': evicted}
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
@@ -0,0 +1,266 @@
+"""
+Solar Engine
+Offline sun position, sun times and time zones
+
+Sun position follows the NOAA solar calculator equations (accurate to about
+a minute for sun times between 1800 and 2100). Every function takes arrays,
+so a whole batch of photos is computed in one pass.
+
+Time zones come from timezonefinder's bundled zone boundaries when it is
+installed; otherwise the nautical zone (longitude / 15) is used, which is
+right at sea but can be an hour or more off on land.
+"""
+from datetime import date as date_type, datetime, timezone
+import threading
+
+import numpy as np
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:
+    TimezoneFinder = None
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+# Solar zenith angles of the events (sunrise includes refraction and the sun's radius)
+SUNRISE_ZENITH = 90.833
+CIVIL_ZENITH = 96.0
+
+# Sun elevation (degrees) bounds of each phase, from high to low
+SUN_PHASES = (
+    (6.0, 'day'),
+    (-0.833, 'golden hour'),
+    (-6.0, 'civil twilight'),
+    (-18.0, 'twilight'),
+)
+
+_UNIX_EPOCH_JD = 2440587.5
+_J2000_JD = 2451545.0
+
+def _to_datetime64(values, unit):
+    """Array of datetime64 from dates, datetimes (naive = UTC), strings or datetime64"""
+    if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+        return np.atleast_1d(values.astype(f'datetime64[{unit}]'))
+    if isinstance(values, (str, date_type, np.datetime64)):
+        values = [values]
+
+    def convert(value):
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(value, unit)
+    return np.array([convert(v) for v in values], dtype=f'datetime64[{unit}]')
+
+def _julian_day(times):
+    seconds = times.astype('datetime64[s]').astype(np.float64)
+    return _UNIX_EPOCH_JD + seconds / 86400.0
+
+def _sun_declination_eqtime(jd):
+    """Solar declination (radians) and equation of time (minutes) at Julian day jd"""
+    jc = (jd - _J2000_JD) / 36525.0
+    mean_long = np.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    mean_anom = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccent = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (np.sin(mean_anom) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + np.sin(2 * mean_anom) * (0.019993 - 0.000101 * jc)
+              + np.sin(3 * mean_anom) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    app_long = np.radians(np.degrees(mean_long) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliq = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliq = np.radians(mean_obliq + 0.00256 * np.cos(omega))
+
+    declination = np.arcsin(np.sin(obliq) * np.sin(app_long))
+    y = np.tan(obliq / 2) ** 2
+    eqtime = 4 * np.degrees(
+        y * np.sin(2 * mean_long)
+        - 2 * eccent * np.sin(mean_anom)
+        + 4 * eccent * y * np.sin(mean_anom) * np.cos(2 * mean_long)
+        - 0.5 * y * y * np.sin(4 * mean_long)
+        - 1.25 * eccent * eccent * np.sin(2 * mean_anom)
+    )
+    return declination, eqtime
+
+def solar_position(latitudes, longitudes, times_utc):
+    """
+    Geometric sun elevation and azimuth
+
+    Args:
+        latitudes, longitudes: Degrees (scalars or arrays, broadcast together)
+        times_utc: UTC datetimes (naive datetimes are taken as UTC), ISO
+            strings or datetime64 values
+
+    Returns:
+        Tuple of (elevation, azimuth) arrays in degrees; azimuth is clockwise from north
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.asarray(longitudes, dtype=np.float64)
+    times = _to_datetime64(times_utc, 's')
+
+    declination, eqtime = _sun_declination_eqtime(_julian_day(times))
+    minutes = (times - times.astype('datetime64[D]')).astype(np.float64) / 60.0
+    hour_angle = np.radians((minutes + eqtime + 4 * lon) / 4 - 180)
+
+    cos_zenith = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    elevation = 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    azimuth = (np.degrees(np.arctan2(np.sin(hour_angle),
+                                     np.cos(hour_angle) * np.sin(lat) - np.tan(declination) * np.cos(lat))) + 180) % 360
+    return elevation, azimuth
+
+def _event_hour_angle(lat, declination, zenith):
+    """Hour angle (degrees) of the sun reaching zenith; NaN where it never does"""
+    cos_ha = (np.cos(np.radians(zenith)) / (np.cos(lat) * np.cos(declination))
+              - np.tan(lat) * np.tan(declination))
+    with np.errstate(invalid='ignore'):
+        return np.degrees(np.arccos(np.where(np.abs(cos_ha) <= 1, cos_ha, np.nan)))
+
+def sun_events(latitudes, longitudes, dates):
+    """
+    Sunrise, sunset, solar noon and civil twilight for many places and days
+
+    Args:
+        latitudes, longitudes: Degrees (scalars or arrays, broadcast with dates)
+        dates: Dates, 'YYYY-MM-DD' strings or datetime64[D] values (UTC days)
+
+    Returns:
+        Dictionary of float arrays in minutes after 00:00 UTC of each date
+        ('sunrise', 'sunset', 'solar_noon', 'civil_twilight_begin',
+        'civil_twilight_end'; NaN when the event does not happen that day)
+        and 'day_length' in seconds (0 in polar night, 86400 in polar day)
+    """
+    lat_deg = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    days = _to_datetime64(dates, 'D')
+
+    # Evaluate the sun at approximate local noon, then refine noon once
+    jd_midnight = _julian_day(days)
+    _, eqtime = _sun_declination_eqtime(jd_midnight + (720 - 4 * lon) / 1440)
+    solar_noon = 720 - 4 * lon - eqtime
+    declination, eqtime = _sun_declination_eqtime(jd_midnight + solar_noon / 1440)
+    solar_noon = 720 - 4 * lon - eqtime
+
+    lat = np.radians(lat_deg)
+    sunrise_ha = _event_hour_angle(lat, declination, SUNRISE_ZENITH)
+    civil_ha = _event_hour_angle(lat, declination, CIVIL_ZENITH)
+
+    # With no sunrise, the sun is either always up or always down: compare noon elevation
+    noon_elevation = 90 - np.degrees(np.abs(lat - declination))
+    day_length = np.where(np.isnan(sunrise_ha),
+                          np.where(noon_elevation > 90 - SUNRISE_ZENITH, 86400.0, 0.0),
+                          8 * sunrise_ha * 60)
+    return {
+        'sunrise': solar_noon - 4 * sunrise_ha,
+        'sunset': solar_noon + 4 * sunrise_ha,
+        'solar_noon': solar_noon,
+        'civil_twilight_begin': solar_noon - 4 * civil_ha,
+        'civil_twilight_end': solar_noon + 4 * civil_ha,
+        'day_length': day_length,
+    }
+
+def _format_event(day, minutes):
+    if np.isnan(minutes):
+        return None
+    moment = day.astype('datetime64[s]') + np.timedelta64(int(round(minutes * 60)), 's')
+    return moment.astype(datetime).replace(tzinfo=timezone.utc).isoformat()
+
+def sun_times_batch(latitudes, longitudes, dates):
+    """
+    Sun times for many places/days, one dictionary each
+
+    Returns:
+        List of dictionaries shaped like time_api.get_sun_times' result
+        (ISO 8601 UTC timestamps; events that do not happen are None)
+    """
+    days = _to_datetime64(dates, 'D')
+    events = sun_events(latitudes, longitudes, days)
+    lat, lon, days = np.broadcast_arrays(np.asarray(latitudes, dtype=np.float64),
+                                         np.asarray(longitudes, dtype=np.float64), days)
+    events = {name: np.broadcast_to(values, lat.shape) for name, values in events.items()}
+
+    results = []
+    for i in np.ndindex(lat.shape):
+        result = {name: _format_event(days[i], events[name][i])
+                  for name in ('sunrise', 'sunset', 'solar_noon', 'civil_twilight_begin', 'civil_twilight_end')}
+        result['day_length'] = int(round(float(events['day_length'][i])))
+        results.append(result)
+    return results
+
+def sun_times(latitude, longitude, date=None):
+    """Sun times for one place; date defaults to today (UTC)"""
+    return sun_times_batch(latitude, longitude, date or datetime.now(timezone.utc).date())[0]
+
+def sun_phase(elevation):
+    """Name of the light phase for a sun elevation in degrees"""
+    for lower_bound, name in SUN_PHASES:
+        if elevation > lower_bound:
+            return name
+    return 'night'
+
+_finder = None
+_finder_lock = threading.Lock()
+
+def has_timezone_boundaries():
+    """Whether real zone boundaries (timezonefinder) are available"""
+    return TimezoneFinder is not None
+
+def _get_finder():
+    global _finder
+    with _finder_lock:
+        if _finder is None:
+            _finder = TimezoneFinder()
+        return _finder
+
+def nautical_timezone(longitude):
+    """Etc/GMT zone for a longitude (the Etc sign convention is inverted)"""
+    offset = int(round(float(longitude) / 15.0))
+    return 'Etc/GMT' if offset == 0 else f'Etc/GMT{-offset:+d}'
+
+def timezone_name(latitude, longitude):
+    """
+    IANA time zone at a coordinate
+
+    Returns:
+        Tuple of (zone name, source) where source is 'timezonefinder' or 'nautical'
+    """
+    if TimezoneFinder is not None:
+        try:
+            name = _get_finder().timezone_at(lng=float(longitude), lat=float(latitude))
+            if name:
+                return name, 'timezonefinder'
+        except Exception as e:
+            print(f"Error looking up time zone: {e}")
+    return nautical_timezone(longitude), 'nautical'
+
+def timezone_info(latitude, longitude, moment=None):
+    """
+    Time zone details computed locally
+
+    Args:
+        latitude, longitude: Coordinate in degrees
+        moment: Aware datetime to evaluate the offset at (defaults to now)
+
+    Returns:
+        Dictionary shaped like time_api.get_timezone_info's result, plus 'source'
+    """
+    name, source = timezone_name(latitude, longitude)
+    now = (moment or datetime.now(timezone.utc)).astimezone(ZoneInfo(name))
+    return {
+        'timezone': name,
+        'current_time': now.replace(tzinfo=None).isoformat(),
+        'utc_offset': now.utcoffset().total_seconds() / 3600,
+        'is_dst': bool(now.dst()),
+        'source': source
+    }
+
+def local_to_utc(local_datetime, latitude, longitude):
+    """
+    Convert a naive local wall-clock time (as EXIF stores it) to UTC
+
+    Returns:
+        Tuple of (aware UTC datetime, zone name)
+    """
+    if local_datetime.tzinfo is not None:
+        return local_datetime.astimezone(timezone.utc), str(local_datetime.tzinfo)
+    name, _ = timezone_name(latitude, longitude)
+    return local_datetime.replace(tzinfo=ZoneInfo(name)).astimezone(timezone.utc), name
@@ -0,0 +1,171 @@
+"""
+Stage Scheduler Module
+Runs independent analysis stages concurrently with per-stage timeouts
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import time
+import traceback
+
+# Threads per pool. Model stages mostly wait on their micro-batcher, so their
+# pool is sized for several concurrent requests (8 model stages in flight per
+# 2 requests would otherwise queue); the short I/O stages get their own pool
+# so a backlog of inference never delays EXIF reads and lookups.
+POOL_WORKERS = {
+    'model': 32,
+    'io': 16,
+}
+
+# Seconds between deadline checks while a stage is still waiting for a thread
+QUEUE_POLL_SECONDS = 0.05
+
+# Seconds a stage may wait for a thread before it times out without running
+MAX_QUEUE_SECONDS = 30.0
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+def get_executor(pool='model'):
+    """Shared thread pool per pool name (singleton pattern); torch releases the GIL during inference"""
+    with _executor_lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(max_workers=POOL_WORKERS[pool], thread_name_prefix=f'stage-{pool}')
+        return _executors[pool]
+
+class Stage:
+    """
+    One unit of analysis work
+
+    Args:
+        name: Unique stage name, also the key of its result
+        func: Callable receiving the results of depends_on, in order
+        depends_on: Names of stages that must succeed before this one starts
+        timeout: Seconds the stage may run once started
+        default: Result used when the stage fails, times out or is skipped
+        pool: 'model' for inference stages, 'io' for short file and network work
+    """
+
+    def __init__(self, name, func, depends_on=(), timeout=30.0, default=None, pool='io'):
+        if pool not in POOL_WORKERS:
+            raise ValueError(f"Unknown stage pool: {pool}")
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.default = default
+        self.pool = pool
+
+class _Clock:
+    """Start time of a submitted stage, set by the worker thread when it begins running"""
+
+    def __init__(self, func):
+        self.func = func
+        self.queued = time.monotonic()
+        self.started = None
+
+    def __call__(self, *args):
+        self.started = time.monotonic()
+        return self.func(*args)
+
+def run_stages(stages, executor=None, max_queue_seconds=MAX_QUEUE_SECONDS):
+    """
+    Run stages as soon as their dependencies finish, isolating failures
+
+    A stage that raises or exceeds its timeout gets its default result and
+    anything depending on it is skipped; every other stage still completes.
+    The timeout counts from when a worker thread picks the stage up, so time
+    spent queued behind other requests is not charged to it; a stage still
+    queued after max_queue_seconds is cancelled and times out instead, so a
+    saturated pool cannot block a request indefinitely. Timed-out work
+    keeps running in the pool but its result is discarded.
+
+    Args:
+        stages: Iterable of Stage objects
+        executor: Executor to run every stage on (defaults to the shared
+            pool of each stage's kind)
+        max_queue_seconds: Longest a stage may wait for a thread
+
+    Returns:
+        Tuple of (results, report): results maps stage name to its value,
+        report maps stage name to {'status', 'seconds', 'queued_seconds'}
+        where status is one of 'ok', 'error', 'timeout' or 'skipped'
+        (failed stages also carry the 'error' message)
+    """
+    pending = {stage.name: stage for stage in stages}
+    for stage in pending.values():
+        missing = [d for d in stage.depends_on if d not in pending]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+    results, report, running = {}, {}, {}
+
+    def finish(stage, status, clock=None, value=None, error=None):
+        now = time.monotonic()
+        started = clock.started if clock and clock.started is not None else now
+        results[stage.name] = value if status == 'ok' else stage.default
+        report[stage.name] = {'status': status, 'seconds': round(now - started, 3),
+                              'queued_seconds': round(started - clock.queued, 3) if clock else 0.0}
+        if error is not None:
+            report[stage.name]['error'] = str(error)
+
+    def submit_ready():
+        progressed = True
+        while progressed:
+            progressed = False
+            for name, stage in list(pending.items()):
+                statuses = [report[d]['status'] for d in stage.depends_on if d in report]
+                if len(statuses) < len(stage.depends_on):
+                    continue
+                del pending[name]
+                progressed = True
+                if any(status != 'ok' for status in statuses):
+                    finish(stage, 'skipped')
+                    continue
+                args = [results[d] for d in stage.depends_on]
+                clock = _Clock(stage.func)
+                future = (executor or get_executor(stage.pool)).submit(clock, *args)
+                running[future] = (stage, clock)
+
+    def deadline(stage, clock):
+        if clock.started is None:
+            return clock.queued + max_queue_seconds
+        return clock.started + stage.timeout
+
+    def next_wait():
+        """Seconds until the earliest deadline, polling while some stage still waits for a thread"""
+        deadlines = [deadline(stage, clock) for stage, clock in running.values()]
+        if any(clock.started is None for _, clock in running.values()):
+            deadlines.append(time.monotonic() + QUEUE_POLL_SECONDS)
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    submit_ready()
+    while running:
+        done, _ = wait(list(running), timeout=next_wait(), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            stage, clock = running.pop(future)
+            try:
+                finish(stage, 'ok', clock, future.result())
+            except Exception as e:
+                print(f"Stage '{stage.name}' error: {e}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+                finish(stage, 'error', clock, error=e)
+
+        now = time.monotonic()
+        for future, (stage, clock) in list(running.items()):
+            if deadline(stage, clock) > now:
+                continue
+            if clock.started is None:
+                if not future.cancel():
+                    # A worker picked it up just now; its run timeout applies from here
+                    continue
+                print(f"Stage '{stage.name}' timed out after waiting {max_queue_seconds}s for a thread")
+            else:
+                future.cancel()
+                print(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+            del running[future]
+            finish(stage, 'timeout', clock)
+
+        submit_ready()
+
+    return results, report
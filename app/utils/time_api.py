@@ -1,45 +1,96 @@
 """
 Time API Module
 Provides time-related information and utilities
+
+Sun times are computed locally (app/utils/solar.py); time zones are too when
+timezonefinder is installed, otherwise TimeAPI.io is asked.
 """
 from datetime import datetime, timezone
-import requests
 
-def get_timezone_info(location_data):
+from app.utils.http_client import api_url, cache_key, fetch_json, fetch_json_async, round_coords
+from app.utils import solar
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+def _local_now(tz_name, fallback):
+    """Current time in a zone, so cached time-zone answers stay current"""
+    try:
+        return datetime.now(ZoneInfo(tz_name)).replace(tzinfo=None).isoformat()
+    except Exception:
+        return fallback
+
+def _has_coordinates(location_data):
+    return bool(location_data) and 'latitude' in location_data and 'longitude' in location_data
+
+def _timezone_request(location_data):
+    """URL, params and cache key for the time-zone call"""
+    lat, lon = round_coords(location_data['latitude'], location_data['longitude'])
+
+    # Use TimeAPI.io (free, no key required)
+    url = api_url('timeapi', '/api/TimeZone/coordinate')
+    params = {
+        'latitude': lat,
+        'longitude': lon
+    }
+    return url, params, cache_key('timezone', lat, lon)
+
+def _parse_timezone(data):
+    return {
+        'timezone': data.get('timeZone'),
+        'current_time': _local_now(data.get('timeZone'), data.get('currentLocalTime')),
+        'utc_offset': data.get('currentUtcOffset', {}).get('seconds', 0) / 3600,
+        'is_dst': data.get('dstActive', False)
+    }
+
+def _local_timezone_info(location_data):
+    try:
+        return solar.timezone_info(location_data['latitude'], location_data['longitude'])
+    except Exception as e:
+        print(f"Error computing timezone: {e}")
+        return None
+
+def get_timezone_info(location_data, offline=None):
     """
     Get timezone information for a location
 
     Args:
         location_data: Dictionary with 'latitude' and 'longitude' keys
+        offline: Look the zone up locally; defaults to local whenever
+            timezonefinder's zone boundaries are installed
 
     Returns:
         Dictionary with timezone information or None
     """
-    if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
+    if not _has_coordinates(location_data):
         return None
+    if offline is None:
+        offline = solar.has_timezone_boundaries()
+    if offline:
+        return _local_timezone_info(location_data)
 
     try:
-        lat = location_data['latitude']
-        lon = location_data['longitude']
+        url, params, key = _timezone_request(location_data)
+        return _parse_timezone(fetch_json('timezone', url, params, key))
 
-        # Use TimeAPI.io (free, no key required)
-        url = f"https://timeapi.io/api/TimeZone/coordinate"
-        params = {
-            'latitude': lat,
-            'longitude': lon
-        }
-
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+    except Exception as e:
+        print(f"Error fetching timezone data: {e}")
+        return None
 
-        data = response.json()
+async def get_timezone_info_async(location_data, offline=None):
+    """Async get_timezone_info; same arguments and result"""
+    if not _has_coordinates(location_data):
+        return None
+    if offline is None:
+        offline = solar.has_timezone_boundaries()
+    if offline:
+        return _local_timezone_info(location_data)
 
-        return {
-            'timezone': data.get('timeZone'),
-            'current_time': data.get('currentLocalTime'),
-            'utc_offset': data.get('currentUtcOffset', {}).get('seconds', 0) / 3600,
-            'is_dst': data.get('dstActive', False)
-        }
+    try:
+        url, params, key = _timezone_request(location_data)
+        return _parse_timezone(await fetch_json_async('timezone', url, params, key))
 
     except Exception as e:
         print(f"Error fetching timezone data: {e}")
@@ -64,12 +115,47 @@ def get_time_of_day(hour):
     else:
         return 'night'
 
-def analyze_photo_time(datetime_obj):
+# Visual time-of-day predictions that are plausible in each sun phase
+PHASE_VISUAL_MATCHES = {
+    'day': {'daytime', 'sunrise/sunset'},
+    'golden hour': {'daytime', 'sunrise/sunset', 'evening'},
+    'civil twilight': {'sunrise/sunset', 'evening', 'night'},
+    'twilight': {'evening', 'night'},
+    'night': {'evening', 'night'},
+}
+
+def check_daylight(sun_phase, visual_time_of_day):
+    """
+    Compare the sun's position with the pixel-based time-of-day prediction
+
+    Args:
+        sun_phase: Phase from solar.sun_phase
+        visual_time_of_day: Result of visual_analysis.predict_time_of_day
+
+    Returns:
+        Dictionary with both predictions and whether they agree (None when
+        the visual prediction is unknown); indoor shots often disagree
+    """
+    prediction = (visual_time_of_day or {}).get('prediction', 'unknown')
+    consistent = None
+    if prediction != 'unknown':
+        consistent = prediction in PHASE_VISUAL_MATCHES.get(sun_phase, ())
+    return {
+        'sun_phase': sun_phase,
+        'visual_prediction': prediction,
+        'consistent': consistent
+    }
+
+def analyze_photo_time(datetime_obj, location_data=None, visual_time_of_day=None):
     """
     Analyze when a photo was taken
 
     Args:
-        datetime_obj: Datetime object from EXIF data
+        datetime_obj: Datetime object from EXIF data (local wall-clock time)
+        location_data: Optional dictionary with 'latitude' and 'longitude';
+            adds the sun's position at capture time
+        visual_time_of_day: Optional visual_analysis.predict_time_of_day
+            result to check against the sun's position
 
     Returns:
         Dictionary with time analysis
@@ -77,7 +163,7 @@ def analyze_photo_time(datetime_obj):
     if not datetime_obj:
         return None
 
-    return {
+    analysis = {
         'date': datetime_obj.strftime('%Y-%m-%d'),
         'time': datetime_obj.strftime('%H:%M:%S'),
         'hour': datetime_obj.hour,
@@ -87,50 +173,95 @@ def analyze_photo_time(datetime_obj):
         'year': datetime_obj.year
     }
 
-def get_sun_times(location_data, date=None):
+    if _has_coordinates(location_data):
+        try:
+            lat, lon = location_data['latitude'], location_data['longitude']
+            utc_time, zone = solar.local_to_utc(datetime_obj, lat, lon)
+            elevation, azimuth = solar.solar_position(lat, lon, utc_time)
+            analysis.update({
+                'timezone': zone,
+                'utc_time': utc_time.isoformat(),
+                'sun_elevation': round(float(elevation[0]), 1),
+                'sun_azimuth': round(float(azimuth[0]), 1),
+                'sun_phase': solar.sun_phase(float(elevation[0]))
+            })
+            if visual_time_of_day:
+                analysis['daylight_check'] = check_daylight(analysis['sun_phase'], visual_time_of_day)
+        except Exception as e:
+            print(f"Error computing sun position: {e}")
+
+    return analysis
+
+def _sun_times_request(location_data, date):
+    """URL, params and cache key for the sunrise/sunset call"""
+    lat, lon = round_coords(location_data['latitude'], location_data['longitude'])
+
+    # Use sunrise-sunset.org API (free, no key required)
+    url = api_url('sunrise_sunset', '/json')
+    params = {
+        'lat': lat,
+        'lng': lon,
+        'formatted': 0,
+        'date': date or datetime.now(timezone.utc).date().isoformat()
+    }
+    return url, params, cache_key('sun_times', lat, lon, params['date'])
+
+def _parse_sun_times(data):
+    if data.get('status') != 'OK':
+        return None
+    results = data.get('results', {})
+    return {
+        'sunrise': results.get('sunrise'),
+        'sunset': results.get('sunset'),
+        'solar_noon': results.get('solar_noon'),
+        'day_length': results.get('day_length'),
+        'civil_twilight_begin': results.get('civil_twilight_begin'),
+        'civil_twilight_end': results.get('civil_twilight_end')
+    }
+
+def _local_sun_times(location_data, date):
+    try:
+        return solar.sun_times(location_data['latitude'], location_data['longitude'], date)
+    except Exception as e:
+        print(f"Error computing sun times: {e}")
+        return None
+
+def get_sun_times(location_data, date=None, offline=True):
     """
     Get sunrise and sunset times for a location
 
     Args:
         location_data: Dictionary with 'latitude' and 'longitude' keys
         date: Date string (YYYY-MM-DD) or None for today
+        offline: Compute locally (default) instead of asking sunrise-sunset.org
 
     Returns:
         Dictionary with sunrise/sunset times or None
     """
-    if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
+    if not _has_coordinates(location_data):
+        return None
+    if offline:
+        return _local_sun_times(location_data, date)
+
+    try:
+        url, params, key = _sun_times_request(location_data, date)
+        return _parse_sun_times(fetch_json('sun_times', url, params, key))
+
+    except Exception as e:
+        print(f"Error fetching sun times: {e}")
+
+    return None
+
+async def get_sun_times_async(location_data, date=None, offline=True):
+    """Async get_sun_times; same arguments and result"""
+    if not _has_coordinates(location_data):
         return None
+    if offline:
+        return _local_sun_times(location_data, date)
 
     try:
-        lat = location_data['latitude']
-        lon = location_data['longitude']
-
-        # Use sunrise-sunset.org API (free, no key required)
-        url = "https://api.sunrise-sunset.org/json"
-        params = {
-            'lat': lat,
-            'lng': lon,
-            'formatted': 0
-        }
-
-        if date:
-            params['date'] = date
-
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()
-
-        if data.get('status') == 'OK':
-            results = data.get('results', {})
-            return {
-                'sunrise': results.get('sunrise'),
-                'sunset': results.get('sunset'),
-                'solar_noon': results.get('solar_noon'),
-                'day_length': results.get('day_length'),
-                'civil_twilight_begin': results.get('civil_twilight_begin'),
-                'civil_twilight_end': results.get('civil_twilight_end')
-            }
+        url, params, key = _sun_times_request(location_data, date)
+        return _parse_sun_times(await fetch_json_async('sun_times', url, params, key))
 
     except Exception as e:
         print(f"Error fetching sun times: {e}")
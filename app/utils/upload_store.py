@@ -0,0 +1,74 @@
+"""
+Upload Store Module
+Optional content-addressed persistence of uploads with retention cleanup
+"""
+import os
+import threading
+import time
+
+CLEANUP_INTERVAL_SECONDS = 600
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+def persist_upload(ctx, folder, extension):
+    """
+    Save the upload under its content hash
+
+    Identical content maps to the same file, so re-uploads are not written
+    again (only their modification time is refreshed for retention).
+
+    Args:
+        ctx: ImageContext holding the uploaded bytes
+        folder: Upload directory
+        extension: File extension without the dot
+
+    Returns:
+        Stored filename (relative to folder)
+    """
+    filename = f"{ctx.sha256}.{extension.lower()}"
+    path = os.path.join(folder, filename)
+    if os.path.exists(path):
+        os.utime(path)
+        return filename
+
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(ctx.data)
+    os.replace(tmp_path, path)
+    return filename
+
+def cleanup_uploads(folder, max_age_seconds):
+    """
+    Delete stored uploads older than max_age_seconds
+
+    Returns:
+        Number of files removed
+    """
+    if not os.path.isdir(folder):
+        return 0
+
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for entry in os.scandir(folder):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            print(f"Error removing old upload {entry.name}: {e}")
+    return removed
+
+def maybe_cleanup_uploads(folder, max_age_seconds, interval=CLEANUP_INTERVAL_SECONDS):
+    """Run cleanup_uploads at most once per interval; returns files removed"""
+    global _last_cleanup
+    with _cleanup_lock:
+        now = time.time()
+        if now - _last_cleanup < interval:
+            return 0
+        _last_cleanup = now
+    removed = cleanup_uploads(folder, max_age_seconds)
+    if removed:
+        print(f"Removed {removed} uploads older than {max_age_seconds}s")
+    return removed
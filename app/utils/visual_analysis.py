@@ -1,21 +1,122 @@
 """
 Visual Analysis - Time and Season from image pixels
+
+All predictions come from one fused statistics pass (ColorStats): the image
+is converted to HSV strip by strip and reduced to a hue/saturation and a
+saturation/value histogram plus the BGR channel sums, so memory stays
+constant whatever the resolution and every ratio is a histogram slice.
 """
 import cv2
 import numpy as np
 
-def predict_time_of_day(image_path):
+from app.utils.image_context import load_image_context
+
+# Bump when the thresholds change so cached predictions are invalidated
+MODEL_VERSION = 'heuristics-1'
+
+# Pixels converted to HSV at a time
+STRIP_PIXELS = 1 << 20
+# Longest side the statistics are computed at; None keeps full resolution
+STATS_MAX_SIDE = None
+# JPEGs are decoded at 1/2-1/8 scale as long as the shorter side stays >= this
+STATS_DECODE_SIZE = 256
+
+class ColorStats:
+    """
+    Color histograms of one image
+
+    Args:
+        hist_hs: [180, 256] counts over (hue, saturation)
+        hist_sv: [256, 256] counts over (saturation, value)
+        bgr_sum: Per-channel sums of the BGR pixels
+        pixels: Number of pixels counted
+    """
+
+    def __init__(self, hist_hs, hist_sv, bgr_sum, pixels):
+        self.hist_hs = hist_hs
+        self.hist_sv = hist_sv
+        self.bgr_sum = bgr_sum
+        self.pixels = pixels
+
+    @property
+    def brightness(self):
+        """Mean HSV value"""
+        value_hist = self.hist_sv.sum(axis=0)
+        return float(value_hist @ np.arange(256)) / self.pixels
+
+    @property
+    def bgr_mean(self):
+        return tuple(float(c) / self.pixels for c in self.bgr_sum)
+
+    @property
+    def warm_score(self):
+        b, g, r = self.bgr_mean
+        return (r + g * 0.5) / (b + 1)
+
+    def _hs_ratio(self, hue_lo, hue_hi, min_sat):
+        """Share of pixels with hue_lo < h < hue_hi and s > min_sat"""
+        return float(self.hist_hs[hue_lo + 1:hue_hi, min_sat + 1:].sum()) / self.pixels
+
+    @property
+    def green_ratio(self):
+        return self._hs_ratio(35, 85, 40)
+
+    @property
+    def brown_ratio(self):
+        return self._hs_ratio(10, 30, 50)
+
+    @property
+    def white_ratio(self):
+        """Share of pixels with s < 40 and v > 180"""
+        return float(self.hist_sv[:40, 181:].sum()) / self.pixels
+
+def compute_color_stats(bgr, max_side=STATS_MAX_SIDE):
+    """
+    Single pass over a BGR image
+
+    Args:
+        bgr: uint8 BGR array
+        max_side: Downscale so the longest side is at most this many pixels
+            (INTER_AREA) before counting; None counts every pixel
+
+    Returns:
+        ColorStats
+    """
+    height, width = bgr.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        bgr = cv2.resize(bgr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+        height, width = bgr.shape[:2]
+
+    hist_hs = np.zeros((180, 256), dtype=np.float64)
+    hist_sv = np.zeros((256, 256), dtype=np.float64)
+    bgr_sum = np.zeros(3, dtype=np.float64)
+    rows = max(1, STRIP_PIXELS // width)
+    for top in range(0, height, rows):
+        strip = bgr[top:top + rows]
+        hsv = cv2.cvtColor(strip, cv2.COLOR_BGR2HSV)
+        hist_hs += cv2.calcHist([hsv], [0, 1], None, [180, 256], [0, 180, 0, 256])
+        hist_sv += cv2.calcHist([hsv], [1, 2], None, [256, 256], [0, 256, 0, 256])
+        bgr_sum += cv2.sumElems(strip)[:3]
+    return ColorStats(hist_hs, hist_sv, bgr_sum, height * width)
+
+def _load_stats(image):
+    """Return the image's shared ColorStats, or None if the image cannot be decoded"""
+    try:
+        ctx = load_image_context(image)
+        return ctx.derived('color_stats', lambda: compute_color_stats(ctx.bgr_reduced(STATS_DECODE_SIZE)))
+    except Exception:
+        return None
+
+def predict_time_of_day(image):
     try:
-        img = cv2.imread(image_path)
-        if img is None:
+        stats = _load_stats(image)
+        if stats is None:
             return {'prediction': 'unknown', 'confidence': 0, 'reasoning': 'Unable to load'}
-        
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        brightness = np.mean(hsv[:, :, 2])
-        
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        r, g, b = np.mean(rgb[:,:,0]), np.mean(rgb[:,:,1]), np.mean(rgb[:,:,2])
-        warm_score = (r + g * 0.5) / (b + 1)
+
+        brightness = stats.brightness
+        warm_score = stats.warm_score
         
         if brightness < 50:
             return {'prediction': 'night', 'confidence': 0.85, 'reasoning': f'Very dark ({brightness:.0f}/255)'}
@@ -30,26 +131,20 @@ def predict_time_of_day(image_path):
     except:
         return {'prediction': 'unknown', 'confidence': 0, 'reasoning': 'Analysis failed'}
 
-def predict_season(image_path):
+def predict_season(image):
     try:
-        img = cv2.imread(image_path)
-        if img is None:
+        stats = _load_stats(image)
+        if stats is None:
             return {'prediction': 'unknown', 'confidence': 0, 'reasoning': 'Unable to load'}
-        
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        h, s, v = hsv[:,:,0], hsv[:,:,1], hsv[:,:,2]
-        
+
         # Green detection
-        green_mask = (h > 35) & (h < 85) & (s > 40)
-        green_ratio = np.sum(green_mask) / green_mask.size
-        
+        green_ratio = stats.green_ratio
+
         # Brown/orange (fall)
-        brown_mask = (h > 10) & (h < 30) & (s > 50)
-        brown_ratio = np.sum(brown_mask) / brown_mask.size
-        
+        brown_ratio = stats.brown_ratio
+
         # White (winter)
-        white_mask = (s < 40) & (v > 180)
-        white_ratio = np.sum(white_mask) / white_mask.size
+        white_ratio = stats.white_ratio
         
         if white_ratio > 0.25:
             return {'prediction': 'winter', 'confidence': 0.8, 'reasoning': f'Snow/white coverage ({white_ratio*100:.0f}%)'}
@@ -64,8 +159,86 @@ def predict_season(image_path):
     except:
         return {'prediction': 'unknown', 'confidence': 0, 'reasoning': 'Analysis failed'}
 
-def get_visual_predictions(image_path):
+def get_visual_predictions(image):
+    ctx = load_image_context(image)
     return {
-        'time_of_day': predict_time_of_day(image_path),
-        'season': predict_season(image_path)
+        'time_of_day': predict_time_of_day(ctx),
+        'season': predict_season(ctx)
     }
+
+# Batch API: compact label codes instead of a dict per image.
+# Code 0 is 'unknown' in both tables.
+TIME_OF_DAY_LABELS = ('unknown', 'night', 'evening', 'sunrise/sunset', 'daytime')
+SEASON_LABELS = ('unknown', 'winter', 'fall', 'summer', 'spring')
+
+VISUAL_DTYPE = np.dtype([
+    ('time_of_day', np.uint8), ('time_confidence', np.float32),
+    ('season', np.uint8), ('season_confidence', np.float32),
+])
+
+# Columns of a feature matrix
+FEATURES = ('brightness', 'warm_score', 'green_ratio', 'brown_ratio', 'white_ratio')
+
+def color_features(stats):
+    """
+    Feature matrix from ColorStats objects
+
+    Args:
+        stats: Iterable of ColorStats (None for images that failed to load)
+
+    Returns:
+        float64 array [N, len(FEATURES)]; failed rows are NaN
+    """
+    stats = list(stats)
+    features = np.full((len(stats), len(FEATURES)), np.nan, dtype=np.float64)
+    for i, s in enumerate(stats):
+        if s is not None:
+            features[i] = [getattr(s, name) for name in FEATURES]
+    return features
+
+def classify_features(features):
+    """
+    Apply the predict_time_of_day / predict_season rules to a whole batch
+
+    Args:
+        features: Array [N, len(FEATURES)] from color_features
+
+    Returns:
+        Structured array of VISUAL_DTYPE; decode labels with
+        TIME_OF_DAY_LABELS[code] and SEASON_LABELS[code]
+    """
+    features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURES))
+    brightness, warm, green, brown, white = features.T
+    valid = ~np.isnan(features).any(axis=1)
+
+    # np.select takes the first matching rule, like the if/elif chains
+    time_rules = [~valid, brightness < 50, brightness < 80, (warm > 2.5) & (brightness < 160), brightness > 150]
+    season_rules = [~valid, white > 0.25, brown > 0.15, green > 0.25, green > 0.1]
+
+    out = np.empty(len(features), dtype=VISUAL_DTYPE)
+    out['time_of_day'] = np.select(time_rules, [0, 1, 2, 3, 4], default=4)
+    out['time_confidence'] = np.select(time_rules, [0, 0.85, 0.7, 0.75, 0.8], default=0.6)
+    out['season'] = np.select(season_rules, [0, 1, 2, 3, 4], default=0)
+    out['season_confidence'] = np.select(season_rules, [0, 0.8, 0.75, 0.7, 0.6], default=0.4)
+    return out
+
+def predict_visual_batch(images):
+    """
+    Visual predictions for many images at once
+
+    Args:
+        images: One of
+            - uint8 BGR stack [N, H, W, 3]
+            - list of ColorStats (precomputed histograms)
+            - list of image paths / ImageContexts (stats are cached on each)
+            - feature matrix [N, len(FEATURES)] from color_features
+
+    Returns:
+        Structured array of VISUAL_DTYPE, one row per image
+    """
+    if isinstance(images, np.ndarray):
+        if images.ndim == 4:
+            return classify_features(color_features(compute_color_stats(image) for image in images))
+        return classify_features(images)
+    return classify_features(color_features(
+        item if isinstance(item, ColorStats) or item is None else _load_stats(item) for item in images))
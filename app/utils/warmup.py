@@ -0,0 +1,122 @@
+"""
+Model Warm-up Module
+Loads every model at startup and runs one dummy inference through each
+"""
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import io
+import threading
+import time
+import traceback
+
+from app.utils import blip_caption, clip_attributes, geo_prediction, yolo_detection
+from app.utils.clip_embedding import get_encoder, shared_encoder
+from app.utils.image_context import ImageContext
+from app.utils.micro_batcher import raise_if_error
+
+_state = {'status': 'idle', 'started': None, 'finished': None, 'models': {}}
+_state_lock = threading.Lock()
+_thread = None
+
+def _dummy_context():
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 240), (120, 140, 160)).save(buffer, format='PNG')
+    return ImageContext.from_bytes(buffer.getvalue(), filename='warmup.png')
+
+def _clip_loader(get_model):
+    """In shared mode both zero-shot heads load the one shared encoder instead of their own model"""
+    return lambda: get_encoder() if shared_encoder() else get_model()
+
+# name -> (loader, dummy inference)
+MODELS = {
+    'caption': (blip_caption.get_model,
+                lambda ctx: raise_if_error(blip_caption.generate_captions([ctx], max_length=5, num_beams=1)[0])),
+    'objects': (yolo_detection.get_model,
+                lambda ctx: raise_if_error(yolo_detection.detect_objects_batch([ctx])[0])),
+    'attributes': (_clip_loader(clip_attributes.get_model),
+                   lambda ctx: raise_if_error(clip_attributes.classify_attributes_batch([ctx])[0])),
+    'geo': (_clip_loader(geo_prediction.get_model),
+            lambda ctx: raise_if_error(geo_prediction.predict_country_batch([ctx])[0])),
+}
+
+def _set_model(name, **info):
+    with _state_lock:
+        _state['models'].setdefault(name, {}).update(info)
+
+def _warm_model(name):
+    loader, infer = MODELS[name]
+    _set_model(name, status='loading')
+    try:
+        started = time.monotonic()
+        loader()
+        loaded = time.monotonic()
+        infer(_dummy_context())
+        _set_model(name, status='ready',
+                   load_seconds=round(loaded - started, 2),
+                   warmup_seconds=round(time.monotonic() - loaded, 2))
+        print(f"Warm-up: {name} ready in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        print(f"Warm-up error for {name}: {e}")
+        traceback.print_exc()
+        _set_model(name, status='error', error=str(e))
+
+def warm_up_models(parallel=True, models=None):
+    """
+    Load models and run one dummy inference each (blocking)
+
+    Args:
+        parallel: Load the models concurrently instead of one after another
+        models: Names from MODELS to warm (defaults to all)
+
+    Returns:
+        Warm-up status dictionary (see warmup_status)
+    """
+    names = list(models or MODELS)
+    with _state_lock:
+        _state.update(status='warming', started=time.time(), finished=None)
+        _state['models'] = {name: {'status': 'pending'} for name in names}
+
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='warmup') as executor:
+            list(executor.map(_warm_model, names))
+    else:
+        for name in names:
+            _warm_model(name)
+
+    with _state_lock:
+        failed = [n for n, info in _state['models'].items() if info['status'] != 'ready']
+        _state.update(status='degraded' if failed else 'ready', finished=time.time())
+    return warmup_status()
+
+def start_warmup(parallel=True, models=None):
+    """Run warm_up_models in a background thread so the server can start listening"""
+    global _thread
+    with _state_lock:
+        if _thread is not None and _thread.is_alive():
+            return _thread
+        _state['status'] = 'starting'
+        _thread = threading.Thread(target=warm_up_models, args=(parallel, models),
+                                   name='warmup', daemon=True)
+    _thread.start()
+    return _thread
+
+def warmup_status():
+    """
+    Current warm-up state
+
+    Returns:
+        Dictionary with overall status ('idle', 'starting', 'warming', 'ready'
+        or 'degraded'), total seconds and per-model load/warm-up times
+    """
+    with _state_lock:
+        status = {
+            'status': _state['status'],
+            'models': {name: dict(info) for name, info in _state['models'].items()}
+        }
+        if _state['started']:
+            status['seconds'] = round((_state['finished'] or time.time()) - _state['started'], 2)
+    return status
+
+def is_ready():
+    """True once every model warmed up; 'degraded' (some failed) is not ready"""
+    return warmup_status()['status'] == 'ready'
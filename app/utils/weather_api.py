@@ -3,8 +3,45 @@ Weather API Module
 Fetches weather data based on location coordinates
 Uses Open-Meteo API (free, no API key required)
 """
-import requests
-from datetime import datetime
+from datetime import datetime, timezone
+
+from app.utils.http_client import api_url, cache_key, fetch_json, fetch_json_async, round_coords
+
+def _has_coordinates(location_data):
+    return bool(location_data) and 'latitude' in location_data and 'longitude' in location_data
+
+def _weather_request(location_data):
+    """URL, params and cache key for the current-weather call"""
+    lat, lon = round_coords(location_data['latitude'], location_data['longitude'])
+
+    # Use Open-Meteo API (free, no key required)
+    url = api_url('open_meteo', '/v1/forecast')
+    params = {
+        'latitude': lat,
+        'longitude': lon,
+        'current_weather': True,
+        'temperature_unit': 'celsius',
+        'windspeed_unit': 'kmh'
+    }
+    return url, params, cache_key('weather', lat, lon)
+
+def _parse_weather(data):
+    current = data.get('current_weather', {})
+
+    # Map weather codes to descriptions
+    weather_code = current.get('weathercode', 0)
+    weather_description = get_weather_description(weather_code)
+
+    return {
+        'temperature': current.get('temperature'),
+        'temperature_unit': 'Celsius',
+        'windspeed': current.get('windspeed'),
+        'windspeed_unit': 'km/h',
+        'wind_direction': current.get('winddirection'),
+        'weather_code': weather_code,
+        'weather_description': weather_description,
+        'time': current.get('time')
+    }
 
 def get_weather(location_data):
     """
@@ -16,43 +53,25 @@ def get_weather(location_data):
     Returns:
         Dictionary with weather information or None
     """
-    if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
+    if not _has_coordinates(location_data):
         return None
 
     try:
-        lat = location_data['latitude']
-        lon = location_data['longitude']
+        url, params, key = _weather_request(location_data)
+        return _parse_weather(fetch_json('weather', url, params, key))
 
-        # Use Open-Meteo API (free, no key required)
-        url = f"https://api.open-meteo.com/v1/forecast"
-        params = {
-            'latitude': lat,
-            'longitude': lon,
-            'current_weather': True,
-            'temperature_unit': 'celsius',
-            'windspeed_unit': 'kmh'
-        }
+    except Exception as e:
+        print(f"Error fetching weather data: {e}")
+        return None
 
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()
-        current = data.get('current_weather', {})
-
-        # Map weather codes to descriptions
-        weather_code = current.get('weathercode', 0)
-        weather_description = get_weather_description(weather_code)
-
-        return {
-            'temperature': current.get('temperature'),
-            'temperature_unit': 'Celsius',
-            'windspeed': current.get('windspeed'),
-            'windspeed_unit': 'km/h',
-            'wind_direction': current.get('winddirection'),
-            'weather_code': weather_code,
-            'weather_description': weather_description,
-            'time': current.get('time')
-        }
+async def get_weather_async(location_data):
+    """Async get_weather; same arguments and result"""
+    if not _has_coordinates(location_data):
+        return None
+
+    try:
+        url, params, key = _weather_request(location_data)
+        return _parse_weather(await fetch_json_async('weather', url, params, key))
 
     except Exception as e:
         print(f"Error fetching weather data: {e}")
@@ -108,14 +127,13 @@ def get_forecast(location_data, days=7):
     Returns:
         Dictionary with forecast data or None
     """
-    if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
+    if not _has_coordinates(location_data):
         return None
 
     try:
-        lat = location_data['latitude']
-        lon = location_data['longitude']
+        lat, lon = round_coords(location_data['latitude'], location_data['longitude'])
 
-        url = f"https://api.open-meteo.com/v1/forecast"
+        url = api_url('open_meteo', '/v1/forecast')
         params = {
             'latitude': lat,
             'longitude': lon,
@@ -124,10 +142,8 @@ def get_forecast(location_data, days=7):
             'temperature_unit': 'celsius'
         }
 
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()
+        key = cache_key('forecast', lat, lon, params['forecast_days'], datetime.now(timezone.utc).date().isoformat())
+        data = fetch_json('forecast', url, params, key)
         daily = data.get('daily', {})
 
         forecast = []
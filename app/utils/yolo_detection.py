@@ -1,63 +1,301 @@
 """
 YOLO Object Detection - YOLOv8m
+
+A DetectionEngine runs batches of decoded BGR arrays at a fixed inference
+size. If an ONNX or OpenVINO export of yolo_best.pt with a dynamic batch
+axis sits next to it, the CPU path uses that export; on GPU the PyTorch
+weights run in half precision.
 """
+from functools import lru_cache
 from ultralytics import YOLO
+import numpy as np
 import os
+import threading
+import torch
+
+from app.utils.detections import Detections, class_names
+from app.utils.image_context import load_image_context
+from app.utils.micro_batcher import get_batcher, group_by, prepare_each, raise_if_error
+from app.utils.model_registry import registry
+
+# Bump when yolo_best.pt is retrained or its input changes so cached detections are invalidated
+MODEL_VERSION = 'yolo-2'
+
+REGISTRY_NAME = 'objects'
+
+MODEL_DIR = os.path.join('app', 'models')
+WEIGHTS_PATH = os.path.join(MODEL_DIR, 'yolo_best.pt')
+FALLBACK_WEIGHTS = 'yolov8n.pt'
+
+# Exported CPU backends, in order of preference (see export_model)
+EXPORTS = {
+    'openvino': os.path.join(MODEL_DIR, 'yolo_best_openvino_model'),
+    'onnx': os.path.join(MODEL_DIR, 'yolo_best.onnx'),
+}
+
+# Inference settings; change with configure_detection()
+DETECTION_CONFIG = {
+    'imgsz': 640,
+    'half': True,       # FP16 whenever PyTorch runs on CUDA
+    'backend': 'auto',  # 'auto', 'pytorch', 'onnx' or 'openvino'
+}
+_config_lock = threading.Lock()
+
+def configure_detection(imgsz=None, half=None, backend=None):
+    """
+    Change the inference size, precision or backend
+
+    The loaded engine is dropped so the next call picks the new settings up.
+    """
+    with _config_lock:
+        if imgsz is not None:
+            DETECTION_CONFIG['imgsz'] = int(imgsz)
+        if half is not None:
+            DETECTION_CONFIG['half'] = bool(half)
+        if backend is not None:
+            if backend not in ('auto', 'pytorch') and backend not in EXPORTS:
+                raise ValueError(f"Unknown detection backend: {backend}")
+            DETECTION_CONFIG['backend'] = backend
+    registry.unload(REGISTRY_NAME)
+
+@lru_cache(maxsize=8)
+def _has_dynamic_batch(backend, path, mtime):
+    try:
+        if backend == 'onnx':
+            import onnx
+            dim = onnx.load(path, load_external_data=False).graph.input[0].type.tensor_type.shape.dim[0]
+            return not dim.HasField('dim_value')
+        try:
+            from openvino import Core
+        except ImportError:
+            from openvino.runtime import Core
+        xml = next(name for name in sorted(os.listdir(path)) if name.endswith('.xml'))
+        return Core().read_model(os.path.join(path, xml)).inputs[0].get_partial_shape()[0].is_dynamic
+    except Exception as e:
+        print(f"Error inspecting the {backend} export {path}: {e}")
+        return False
+
+def has_dynamic_batch(backend, path):
+    """
+    Whether an export accepts any batch size
+
+    Static exports (exported without dynamic=True) only run the batch size
+    they were exported with, which breaks micro-batched calls.
+    """
+    return _has_dynamic_batch(backend, path, os.path.getmtime(path))
+
+def resolve_backend():
+    """
+    Backend the next load will use
+
+    Returns:
+        Tuple of (backend name, weights path)
+    """
+    backend = DETECTION_CONFIG['backend']
+    if backend in EXPORTS:
+        return backend, EXPORTS[backend]
+    if backend == 'auto' and not torch.cuda.is_available():
+        for name, path in EXPORTS.items():
+            if os.path.exists(path):
+                if has_dynamic_batch(name, path):
+                    return name, path
+                print(f"Skipping the {name} export {path}: its batch size is fixed; "
+                      f"re-export with export_model()")
+    if os.path.exists(WEIGHTS_PATH):
+        return 'pytorch', WEIGHTS_PATH
+    return 'pytorch', FALLBACK_WEIGHTS
+
+def _use_half(backend):
+    return DETECTION_CONFIG['half'] and backend == 'pytorch' and torch.cuda.is_available()
+
+def detector_info():
+    """Backend, weights and settings of the loaded engine (or of the next load if none is loaded)"""
+    engine = registry.loaded(REGISTRY_NAME)
+    if engine is not None:
+        return {'backend': engine.backend, 'weights': engine.weights, 'imgsz': engine.imgsz,
+                'half': engine.half, 'loaded': True}
+    backend, weights = resolve_backend()
+    return {'backend': backend, 'weights': weights, 'imgsz': DETECTION_CONFIG['imgsz'],
+            'half': _use_half(backend), 'loaded': False}
+
+def engine_tag():
+    """Suffix for cache versions; detections depend on backend, size and precision"""
+    info = detector_info()
+    return f"-{info['backend']}-{info['imgsz']}" + ('-half' if info['half'] else '')
+
+class DetectionEngine:
+    """
+    Batched YOLO inference on preloaded arrays
+
+    Args:
+        weights: .pt file, .onnx file or OpenVINO model directory
+        backend: Name of the backend the weights belong to
+        imgsz: Inference size (longest side, letterboxed)
+        half: FP16 inference (ignored unless PyTorch runs on CUDA)
+    """
+
+    def __init__(self, weights, backend='pytorch', imgsz=640, half=False):
+        self.weights = weights
+        self.backend = backend
+        self.imgsz = imgsz
+        self.device = 'cuda' if backend == 'pytorch' and torch.cuda.is_available() else 'cpu'
+        self.half = bool(half) and self.device == 'cuda'
+        self.model = YOLO(weights, task='detect')
+        self.names = class_names(self.model.names)
 
-_model = None
+    def predict(self, arrays, confidence_threshold=0.5):
+        """
+        Detect objects in a batch of BGR arrays
+
+        Returns:
+            List with one float32 array [n, 6] per image: x1, y1, x2, y2,
+            confidence, class id
+        """
+        results = self.model(arrays, conf=confidence_threshold, imgsz=self.imgsz,
+                             half=self.half, device=self.device)
+        counts = [len(result.boxes) for result in results]
+        if not sum(counts):
+            return [np.zeros((0, 6), dtype=np.float32) for _ in results]
+
+        # One device-to-host copy for the whole batch, then split per image
+        data = torch.cat([result.boxes.data for result in results]).float().cpu().numpy()
+        splits, start = [], 0
+        for count in counts:
+            splits.append(data[start:start + count])
+            start += count
+        return splits
+
+def _load_model():
+    backend, weights = resolve_backend()
+    print(f"Loading YOLO ({backend}) from {weights}")
+    return DetectionEngine(weights, backend, DETECTION_CONFIG['imgsz'], _use_half(backend))
 
 def get_model():
-    global _model
-    if _model is None:
-        model_path = os.path.join('app', 'models', 'yolo_best.pt')
-        if os.path.exists(model_path):
-            _model = YOLO(model_path)
-        else:
-            _model = YOLO('yolov8n.pt')
-    return _model
-
-def detect_objects(image_path, confidence_threshold=0.5):
+    return registry.get(REGISTRY_NAME, _load_model)
+
+def export_model(format='onnx', imgsz=None):
+    """
+    Export yolo_best.pt next to itself for the CPU backends
+
+    Args:
+        format: 'onnx' or 'openvino'
+        imgsz: Export size (defaults to the configured inference size)
+
+    Returns:
+        Path of the export; picked up automatically on the next load
+    """
+    if format not in EXPORTS:
+        raise ValueError(f"Unsupported export format: {format}")
+    if not os.path.exists(WEIGHTS_PATH):
+        raise FileNotFoundError(f"{WEIGHTS_PATH} not found")
+    # Dynamic axes so micro-batches of any size run through one session
+    path = YOLO(WEIGHTS_PATH).export(format=format, imgsz=imgsz or DETECTION_CONFIG['imgsz'], dynamic=True)
+    registry.unload(REGISTRY_NAME)
+    return path
+
+def detect_objects_batch(images, confidence_threshold=0.5):
+    """
+    Run detection on several images in one forward pass
+
+    Returns:
+        One Detections per image, or the exception for images that could not be decoded
+    """
+    detections, ready = prepare_each(images, lambda image: load_image_context(image).bgr)
+    if ready:
+        with registry.use(REGISTRY_NAME, _load_model) as engine:
+            # Ultralytics accepts BGR arrays directly, so the files are not re-read
+            outputs = engine.predict([array for _, array in ready], confidence_threshold)
+            names = engine.names
+        for (i, _), rows in zip(ready, outputs):
+            detections[i] = Detections.from_rows(rows, names)
+    return detections
+
+def _detect_batch(items):
+    """Micro-batcher entry point; items are (image, confidence_threshold)"""
+    detections = [None] * len(items)
+    for conf, group in group_by(items, lambda item: item[1]).items():
+        outputs = detect_objects_batch([item[0] for _, item in group], confidence_threshold=conf)
+        for (i, _), dets in zip(group, outputs):
+            detections[i] = dets
+    return detections
+
+def detect_objects(image, confidence_threshold=0.5, batched=False):
+    """
+    Detect objects in one image
+
+    Errors propagate instead of turning into an empty result, so a failed
+    detection is never mistaken for an image without objects.
+
+    Returns:
+        Detections (empty when nothing clears the threshold)
+    """
     try:
-        model = get_model()
-        results = model(image_path, conf=confidence_threshold)
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for i in range(len(boxes)):
-                detections.append({
-                    'class': result.names[int(boxes.cls[i])],
-                    'confidence': float(boxes.conf[i]),
-                    'bbox': boxes.xyxy[i].tolist()
-                })
-        return detections
-    except:
-        return []
+        if batched:
+            return get_batcher('objects', _detect_batch)((load_image_context(image), confidence_threshold))
+        return raise_if_error(detect_objects_batch([image], confidence_threshold=confidence_threshold)[0])
+    except Exception as e:
+        print(f"Error detecting objects: {e}")
+        raise
 
 def count_objects(detections):
+    """{class name: count}; accepts Detections or a list of per-box dicts"""
+    if isinstance(detections, Detections):
+        return detections.counts()
     counts = {}
     for det in detections:
         counts[det['class']] = counts.get(det['class'], 0) + 1
     return counts
 
-def analyze_objects(counts):
+# Classes summed by the analyze_objects rules
+OBJECT_CATEGORIES = {
+    'vehicles': ('car', 'truck', 'bus'),
+    'people': ('person',),
+    'animals': ('dog', 'cat', 'cow', 'horse'),
+    'indoor': ('chair', 'couch', 'bed', 'tv'),
+}
+
+@lru_cache(maxsize=8)
+def _category_ids(names):
+    """Class-id index arrays of each category for one model's class names"""
+    index = {name: i for i, name in enumerate(names)}
+    return {category: np.array([index[n] for n in members if n in index], dtype=np.intp)
+            for category, members in OBJECT_CATEGORIES.items()}
+
+def _category_totals(detections):
+    if isinstance(detections, Detections):
+        counts = detections.class_counts()
+        totals = {category: int(counts[ids].sum()) for category, ids in _category_ids(detections.names).items()}
+        return totals, len(detections)
+    # {class name: count} from count_objects
+    totals = {category: sum(detections.get(n, 0) for n in members)
+              for category, members in OBJECT_CATEGORIES.items()}
+    return totals, sum(detections.values())
+
+def analyze_objects(detections):
+    """
+    Scene hints from object counts
+
+    Args:
+        detections: Detections, or a {class name: count} dictionary
+    """
     analysis = {'scene_type': 'general', 'reasoning': [], 'activity_level': 'unknown'}
-    total = sum(counts.values())
-    
-    vehicles = counts.get('car', 0) + counts.get('truck', 0) + counts.get('bus', 0)
+    totals, total = _category_totals(detections)
+
+    vehicles = totals['vehicles']
     if vehicles >= 5:
         analysis['reasoning'].append(f"Many vehicles ({vehicles}) - urban/traffic area")
         analysis['scene_type'] = 'urban'
     
-    people = counts.get('person', 0)
+    people = totals['people']
     if people >= 5:
         analysis['reasoning'].append(f"Multiple people ({people}) - busy area")
         analysis['activity_level'] = 'busy'
     
-    animals = counts.get('dog', 0) + counts.get('cat', 0) + counts.get('cow', 0) + counts.get('horse', 0)
+    animals = totals['animals']
     if animals >= 2:
         analysis['reasoning'].append(f"Animals detected ({animals}) - park or farm setting")
     
-    indoor = counts.get('chair', 0) + counts.get('couch', 0) + counts.get('bed', 0) + counts.get('tv', 0)
+    indoor = totals['indoor']
     if indoor >= 2:
         analysis['reasoning'].append("Indoor furniture detected")
         analysis['scene_type'] = 'indoor'
@@ -66,3 +304,12 @@ def analyze_objects(counts):
         analysis['reasoning'].append("No common objects - landscape or abstract scene")
     
     return analysis
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export yolo_best.pt for CPU inference")
+    parser.add_argument('--format', choices=sorted(EXPORTS), default='onnx')
+    parser.add_argument('--imgsz', type=int)
+    args = parser.parse_args()
+    print(f"Exported to {export_model(args.format, args.imgsz)}")
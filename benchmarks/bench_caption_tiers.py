@@ -0,0 +1,72 @@
+"""
+Benchmark: BLIP caption latency tiers
+
+Captions a fixed image set with every tier (fast = greedy, balanced = 2
+beams, quality = 5 beams), batched, and reports images/s, generated
+tokens/s and how closely each tier's captions match the quality tier.
+
+Usage:
+    python -m benchmarks.bench_caption_tiers photos/ --limit 64 --batch-size 16
+"""
+import argparse
+import time
+
+from app.batch import is_image_file
+from app.utils.blip_caption import CAPTION_TIERS, caption_settings, generate_captions, get_model
+from app.utils.image_context import ImageContext
+from benchmarks.common import find_images
+
+def word_f1(a, b):
+    """Bag-of-words F1 between two captions"""
+    a, b = a.lower().split(), b.lower().split()
+    if not a or not b:
+        return float(a == b)
+    common = sum(min(a.count(w), b.count(w)) for w in set(a))
+    if not common:
+        return 0.0
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+def run_tier(contexts, tier, batch_size):
+    max_length, num_beams = caption_settings(tier)
+    captions = []
+    started = time.perf_counter()
+    for start in range(0, len(contexts), batch_size):
+        captions.extend(generate_captions(contexts[start:start + batch_size], max_length, num_beams))
+    return captions, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help="Image files or directories")
+    parser.add_argument('--limit', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    files = find_images(args.paths, args.limit, is_image_file)
+    if not files:
+        parser.error("no images found")
+    contexts = [ImageContext.from_path(path) for path in files]
+    for ctx in contexts:
+        ctx.pil  # decode up front so only generation is timed
+
+    processor = get_model()[0]
+    generate_captions(contexts[:1], *caption_settings('fast'))  # warm-up
+
+    results = {}
+    for tier in CAPTION_TIERS:
+        captions, seconds = run_tier(contexts, tier, args.batch_size)
+        tokens = sum(len(processor.tokenizer(c, add_special_tokens=False).input_ids) for c in captions)
+        results[tier] = captions
+        print(f"{tier:<9} {len(captions) / seconds:6.2f} images/s  {tokens / seconds:7.1f} tokens/s  "
+              f"({seconds:.1f}s, avg {tokens / len(captions):.1f} tokens)")
+
+    reference = results['quality']
+    for tier, captions in results.items():
+        if tier == 'quality':
+            continue
+        exact = sum(a == b for a, b in zip(captions, reference))
+        f1 = sum(word_f1(a, b) for a, b in zip(captions, reference)) / len(reference)
+        print(f"{tier:<9} vs quality: exact {exact}/{len(reference)}, word F1 {f1:.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: reduced (DCT-scaled) JPEG decoding vs. full decoding
+
+Times the color-statistics stage and the model-input decodes with and
+without reduced decoding, and reports how often the visual predictions
+(and, with --models, the attribute, geo and caption outputs) still agree
+with the full-resolution ones.
+
+Usage:
+    python -m benchmarks.bench_draft_decode photos/ --limit 200 --models
+"""
+import argparse
+import statistics
+import time
+
+from app.utils.image_context import ImageContext, configure_decoding
+from app.utils.visual_analysis import STATS_DECODE_SIZE, compute_color_stats, get_visual_predictions
+from benchmarks.common import find_images, is_jpeg
+
+MODEL_INPUT_SIZES = (224, 336, 384)
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+def report(label, full_ms, reduced_ms):
+    full, reduced = statistics.mean(full_ms), statistics.mean(reduced_ms)
+    print(f"{label:<24} full {full:8.1f} ms   reduced {reduced:8.1f} ms   speedup {full / reduced:5.1f}x")
+
+def compare_decodes(blobs):
+    """Decode timings; every measurement uses a fresh context so nothing is cached"""
+    stats_full, stats_reduced = [], []
+    for data in blobs:
+        stats_full.append(timed(lambda: compute_color_stats(ImageContext(data).bgr)))
+        stats_reduced.append(timed(lambda: compute_color_stats(ImageContext(data).bgr_reduced(STATS_DECODE_SIZE))))
+    report('color statistics', stats_full, stats_reduced)
+
+    for size in MODEL_INPUT_SIZES:
+        pil_full, pil_reduced = [], []
+        for data in blobs:
+            pil_full.append(timed(lambda: ImageContext(data).pil))
+            pil_reduced.append(timed(lambda: ImageContext(data).pil_reduced(size)))
+        report(f'model input ({size} px)', pil_full, pil_reduced)
+
+def run_predictions(blobs, draft, models):
+    configure_decoding(draft)
+    outputs = []
+    for data in blobs:
+        ctx = ImageContext(data)
+        visual = get_visual_predictions(ctx)
+        output = {
+            'time_of_day': visual['time_of_day']['prediction'],
+            'season': visual['season']['prediction'],
+        }
+        if models:
+            from app.utils.blip_caption import generate_caption
+            from app.utils.clip_attributes import classify_attributes
+            from app.utils.geo_prediction import predict_country
+            output['attributes'] = classify_attributes(ctx)
+            top = predict_country(ctx, top_k=1)
+            output['geo'] = top[0]['country'] if top else None
+            output['caption'] = generate_caption(ctx, max_length=30, num_beams=2)
+        outputs.append(output)
+    return outputs
+
+def compare_predictions(blobs, models):
+    full = run_predictions(blobs, False, models)
+    reduced = run_predictions(blobs, True, models)
+    n = len(blobs)
+    for key in full[0]:
+        if key == 'attributes':
+            pairs = [(f[key].get(c), r[key].get(c)) for f, r in zip(full, reduced) for c in f[key]]
+            same = sum(a == b for a, b in pairs)
+            print(f"Agreement {key:<12} {same}/{len(pairs)} labels")
+        else:
+            same = sum(f[key] == r[key] for f, r in zip(full, reduced))
+            print(f"Agreement {key:<12} {same}/{n}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help="JPEG files or directories")
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--models', action='store_true', help="Also compare model outputs (loads all models)")
+    args = parser.parse_args()
+
+    files = find_images(args.paths, args.limit, is_jpeg)
+    if not files:
+        parser.error("no JPEG files found")
+    blobs = []
+    for path in files:
+        with open(path, 'rb') as f:
+            blobs.append(f.read())
+    sizes = [ImageContext(data).source.size for data in blobs]
+    print(f"{len(blobs)} JPEGs, median {statistics.median(w * h for w, h in sizes) / 1e6:.1f} MP")
+
+    compare_decodes(blobs)
+    compare_predictions(blobs, args.models)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: int8 dynamic quantization vs. fp32
+
+Runs BLIP, the OpenCLIP attribute model and StreetCLIP over a fixed image
+set in fp32 and then in int8 mode, and reports resident model size,
+per-image latency and top-1 agreement of the int8 outputs with fp32
+(exact caption match, attribute values per category, top country).
+
+Usage:
+    python -m benchmarks.bench_quantization photos/ --limit 100 --batch-size 8
+"""
+import argparse
+import time
+
+from app.batch import is_image_file
+from app.utils.blip_caption import caption_settings, generate_captions
+from app.utils.clip_attributes import classify_attributes_batch
+from app.utils.geo_prediction import predict_country_batch
+from app.utils.image_context import ImageContext
+from app.utils.micro_batcher import raise_if_error
+from app.utils.model_registry import registry
+from app.utils.quantization import QUANTIZED_MODELS, configure_quantization, quantization_mode
+from benchmarks.common import find_images
+
+def caption_top1(contexts):
+    return [raise_if_error(caption) for caption in generate_captions(contexts, *caption_settings('fast'))]
+
+def attributes_top1(contexts):
+    return [{category: value['value'] for category, value in result.items()}
+            for result in map(raise_if_error, classify_attributes_batch(contexts))]
+
+def geo_top1(contexts):
+    return [raise_if_error(preds)[0]['country'] for preds in predict_country_batch(contexts, top_k=1)]
+
+TASKS = {
+    'caption': caption_top1,
+    'attributes': attributes_top1,
+    'geo': geo_top1,
+}
+
+def run_mode(mode, contexts, batch_size):
+    """Outputs and timings of every model in one precision mode"""
+    configure_quantization(mode)
+    outputs, timings = {}, {}
+    for name, task in TASKS.items():
+        task(contexts[:1])  # load and warm up
+        started = time.perf_counter()
+        results = []
+        for start in range(0, len(contexts), batch_size):
+            results.extend(task(contexts[start:start + batch_size]))
+        timings[name] = (time.perf_counter() - started) * 1000 / len(contexts)
+        outputs[name] = results
+    sizes = {name: info['size_mb'] for name, info in registry.stats()['models'].items()
+             if name in QUANTIZED_MODELS}
+    for name in QUANTIZED_MODELS:
+        registry.unload(name)
+    return outputs, timings, sizes
+
+def agreement(name, full, quantized):
+    if name == 'attributes':
+        pairs = [(f[c], q.get(c)) for f, q in zip(full, quantized) for c in f]
+        return sum(a == b for a, b in pairs), len(pairs)
+    return sum(a == b for a, b in zip(full, quantized)), len(full)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help="Image files or directories")
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    files = find_images(args.paths, args.limit, is_image_file)
+    if not files:
+        parser.error("no images found")
+    contexts = [ImageContext.from_path(path) for path in files]
+
+    full, full_ms, full_mb = run_mode(None, contexts, args.batch_size)
+    quantized, int8_ms, int8_mb = run_mode('int8', contexts, args.batch_size)
+    if quantization_mode() != 'int8':
+        print("Note: int8 mode only applies on CPU; both runs used fp32")
+
+    print(f"{len(contexts)} images")
+    for name in TASKS:
+        same, total = agreement(name, full[name], quantized[name])
+        print(f"{name:<11} size {full_mb.get(name, 0):7.0f} -> {int8_mb.get(name, 0):7.0f} MB   "
+              f"latency {full_ms[name]:7.1f} -> {int8_ms[name]:7.1f} ms/image   "
+              f"top-1 agreement {same}/{total} ({same / total:.1%})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: offline KD-tree reverse geocoding vs. Nominatim
+
+Samples coordinates around gazetteer places, times offline lookups and
+(optionally) a small number of rate-limited online lookups, and reports how
+often both agree on the country and city.
+
+Usage:
+    python -m benchmarks.bench_reverse_geocode cities1000.txt --admin1 admin1CodesASCII.txt \
+        --countries countryInfo.txt --samples 10000 --online 20
+"""
+import argparse
+import math
+import random
+import statistics
+import time
+
+from app.utils.exif_location import get_location_name
+from app.utils.offline_geocoder import load_offline_geocoder
+
+def sample_coordinates(geocoder, count, jitter_deg, seed):
+    """Random points near random gazetteer entries"""
+    rng = random.Random(seed)
+    coords = []
+    for _ in range(count):
+        x, y, z = geocoder.points[rng.randrange(len(geocoder))].tolist()
+        lat, lon = _to_lat_lon(x, y, z)
+        coords.append((max(-90.0, min(90.0, lat + rng.uniform(-jitter_deg, jitter_deg))),
+                       (lon + rng.uniform(-jitter_deg, jitter_deg) + 180) % 360 - 180))
+    return coords
+
+def _to_lat_lon(x, y, z):
+    return math.degrees(math.asin(max(-1.0, min(1.0, z)))), math.degrees(math.atan2(y, x))
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('gazetteer')
+    parser.add_argument('--admin1')
+    parser.add_argument('--countries')
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--online', type=int, default=0, help="Online lookups to compare (1 per second)")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Degrees of noise around each place")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    geocoder = load_offline_geocoder(args.gazetteer, admin1_path=args.admin1, country_info_path=args.countries)
+    print(f"Index ready in {time.perf_counter() - started:.2f}s ({len(geocoder)} places)")
+
+    coords = sample_coordinates(geocoder, args.samples, args.jitter, args.seed)
+    timings = []
+    for lat, lon in coords:
+        t0 = time.perf_counter()
+        geocoder.lookup(lat, lon)
+        timings.append((time.perf_counter() - t0) * 1e6)
+    print(f"Offline: {len(timings)} lookups, mean {statistics.mean(timings):.1f} us, "
+          f"p50 {percentile(timings, 0.5):.1f} us, p99 {percentile(timings, 0.99):.1f} us")
+
+    if args.online:
+        online_times, same_country, same_city = [], 0, 0
+        for lat, lon in coords[:args.online]:
+            t0 = time.perf_counter()
+            online = get_location_name(lat, lon, offline=False) or {}
+            online_times.append(time.perf_counter() - t0)
+            offline = geocoder.lookup(lat, lon)
+            same_country += bool(online.get('country')) and online.get('country') == offline['country']
+            same_city += bool(online.get('city')) and online.get('city') == offline['city']
+        n = len(online_times)
+        print(f"Online: {n} lookups, mean {statistics.mean(online_times) * 1000:.0f} ms "
+              f"(includes rate limiting and cache hits)")
+        print(f"Agreement: country {same_country}/{n}, city {same_city}/{n}")
+        print(f"Speedup: {statistics.mean(online_times) * 1e6 / statistics.mean(timings):.0f}x")
+
+if __name__ == '__main__':
+    main()
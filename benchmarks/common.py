@@ -0,0 +1,29 @@
+"""
+Helpers shared by the benchmark scripts
+"""
+import os
+
+def is_jpeg(name):
+    return name.lower().endswith(('.jpg', '.jpeg'))
+
+def find_images(paths, limit, accept):
+    """
+    Image files to benchmark on
+
+    Args:
+        paths: Image files (taken as given) or directories (walked recursively)
+        limit: Maximum number of files
+        accept: Predicate on a file name selecting the files to keep from directories
+
+    Returns:
+        List of paths, in sorted order within each directory
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, n) for n in sorted(names) if accept(n))
+        else:
+            files.append(path)
+    return files[:limit]
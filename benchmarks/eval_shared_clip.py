@@ -0,0 +1,110 @@
+"""
+Evaluation: shared CLIP image embedding vs. separate attribute/geo models
+
+Runs the attribute and country heads on the same images with separate
+models (OpenCLIP ViT-L/14 + StreetCLIP) and with each shared encoder, and
+reports resident model size, time per image and, per head, agreement with
+the separate-model outputs. With --labels, accuracy against ground truth
+is reported too.
+
+The labels file is a CSV with a 'file' column (name relative to the image
+directory, or an absolute path) and any of 'country' and the attribute
+categories (e.g. 'setting', 'weather') as further columns; empty cells are
+skipped.
+
+Usage:
+    python -m benchmarks.eval_shared_clip photos/ --labels photos/labels.csv --limit 300
+"""
+import argparse
+import csv
+import os
+import time
+
+from app.batch import is_image_file
+from app.utils.clip_attributes import ATTRIBUTES, classify_attributes_batch
+from app.utils.clip_embedding import ENCODERS, REGISTRY_NAME, configure_shared_clip
+from app.utils.geo_prediction import predict_country_batch
+from app.utils.image_context import ImageContext
+from app.utils.micro_batcher import raise_if_error
+from app.utils.model_registry import registry
+from benchmarks.common import find_images
+
+MODELS = (REGISTRY_NAME, 'attributes', 'geo')
+
+def load_labels(path, directory):
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            file = row.pop('file')
+            path = file if os.path.isabs(file) else os.path.join(directory, file)
+            labels[os.path.normpath(path)] = {k: v.strip() for k, v in row.items() if v and v.strip()}
+    return labels
+
+def run_mode(encoder, files, batch_size):
+    """Predictions of both heads with one sharing mode, on fresh contexts"""
+    configure_shared_clip(encoder)
+    contexts = [ImageContext.from_path(path) for path in files]
+    classify_attributes_batch(contexts[:1])  # load and warm up
+    predict_country_batch(contexts[:1])
+    contexts = [ImageContext.from_path(path) for path in files]
+
+    predictions = []
+    started = time.perf_counter()
+    for start in range(0, len(contexts), batch_size):
+        batch = contexts[start:start + batch_size]
+        attributes = classify_attributes_batch(batch)
+        countries = predict_country_batch(batch, top_k=1)
+        for attrs, geo in zip(attributes, countries):
+            prediction = {category: value['value'] for category, value in raise_if_error(attrs).items()}
+            prediction['country'] = raise_if_error(geo)[0]['country']
+            predictions.append(prediction)
+    ms_per_image = (time.perf_counter() - started) * 1000 / len(contexts)
+
+    size_mb = sum(info['size_mb'] for name, info in registry.stats()['models'].items()
+                  if name in MODELS and info['loaded'])
+    for name in MODELS:
+        registry.unload(name)
+    return predictions, ms_per_image, size_mb
+
+def score(predictions, reference, keys):
+    """(matches, total) per key over the images that have a reference value"""
+    scores = {}
+    for key in keys:
+        pairs = [(p[key], r[key]) for p, r in zip(predictions, reference) if key in r]
+        scores[key] = (sum(a == b for a, b in pairs), len(pairs))
+    return scores
+
+def print_scores(title, scores):
+    print(f"  {title}:")
+    for key, (same, total) in scores.items():
+        if total:
+            print(f"    {key:<12} {same:5d}/{total:<5d} {same / total:6.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory', help="Directory of images")
+    parser.add_argument('--labels', help="CSV of ground-truth labels")
+    parser.add_argument('--limit', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    files = find_images([args.directory], args.limit, is_image_file)
+    if not files:
+        parser.error("no images found")
+    labels = load_labels(args.labels, args.directory) if args.labels else {}
+    truth = [labels.get(os.path.normpath(path), {}) for path in files]
+    keys = list(ATTRIBUTES) + ['country']
+
+    baseline = None
+    for encoder in (None,) + tuple(ENCODERS):
+        predictions, ms, size_mb = run_mode(encoder, files, args.batch_size)
+        print(f"{encoder or 'separate'}: {ms:.1f} ms/image, {size_mb:.0f} MB of CLIP weights")
+        if baseline is None:
+            baseline = predictions
+        else:
+            print_scores("agreement with separate models", score(predictions, baseline, keys))
+        if labels:
+            print_scores("accuracy", score(predictions, truth, keys))
+
+if __name__ == '__main__':
+    main()
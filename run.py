@@ -1,7 +1,12 @@
 """
 Simple run script for Image Insight Analyzer
 """
+import os
+
 from app.routes import app
+from app.utils.warmup import start_warmup
+
+DEBUG = True
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -9,8 +14,12 @@ if __name__ == '__main__':
     print("=" * 60)
     print("\nStarting server...")
     print("Open your browser and navigate to: http://localhost:5000")
+    print("/health reports 'ready' once all models are warmed up")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 60)
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
 
+    # The debug reloader runs this script twice; only warm up the serving child
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup(parallel=app.config['WARMUP_PARALLEL'])
+
+    app.run(debug=DEBUG, host='0.0.0.0', port=5000)